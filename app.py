@@ -1,41 +1,271 @@
+import hashlib
+import threading
+import time
+import uuid
 import streamlit as st
+from concurrent.futures import Future, ThreadPoolExecutor
 from pathlib import Path
 from src.Imagecaption.pipeline.data_ingestion_pipeline import DataIngestionPipeline
 from src.Imagecaption.pipeline.image_captioning_pipeline import ImageCaptioningPipeline
 from src.Imagecaption.pipeline.story_generation_pipeline import StoryGenerationPipeline
+from src.Imagecaption.components.story_generation import StoryVariant
+from src.Imagecaption.config.context import get_app_context
+from src.Imagecaption.utils.metrics import metrics, start_metrics_server
+from src.Imagecaption.utils.common import register_secret_source
+from src.Imagecaption.utils.job_queue import RateLimitExceeded
+from src.Imagecaption.utils.resilience import request_deadline
+from src.Imagecaption import setup_logging
+
+setup_logging()
+# Deployed apps keep TOGETHER_API_KEY in Streamlit secrets; the environment is the fallback
+register_secret_source("streamlit", lambda name: st.secrets.get(name))
 
 # Ensure upload and output folders exist
 for folder in ["data/raw", "data/ingested", "data/captions", "data/stories"]:
     Path(folder).mkdir(parents=True, exist_ok=True)
 
+
+@st.cache_resource
+def warm_up_local_model():
+    # Runs once per server process; no-op unless enabled in params.yaml
+    try:
+        ImageCaptioningPipeline.warm_up()
+    except Exception as e:
+        st.warning(f"Local fallback model warm-up failed: {e}")
+    return True
+
+
+warm_up_local_model()
+
+
+@st.cache_resource
+def start_metrics_endpoint():
+    # One metrics server per process, shared by all sessions
+    metrics_config = get_app_context().config_manager.get_metrics_config()
+    if metrics_config.serve:
+        return start_metrics_server(metrics_config.host, metrics_config.port)
+    return None
+
+
+start_metrics_endpoint()
+
+
+@st.cache_resource
+def speculation_executor():
+    # Shared by all sessions; each upload is ingested and captioned here while the user fills in the form
+    return ThreadPoolExecutor(max_workers=4, thread_name_prefix="speculate")
+
+
+def render_story(placeholder, story, width="650px"):
+    placeholder.markdown(
+        f"<div style='width: {width}; min-height: 100px; max-height: 600px; background: #f7f7f7; border-radius: 8px; border: 1px solid #ebebeb; margin: 1em 0; padding: 1.5em; overflow-y: auto; overflow-x: hidden; font-family: Georgia,serif; font-color: black; font-size: 1.1em; white-space: pre-wrap; word-wrap: break-word; box-sizing: border-box;'>{story}</div>",
+        unsafe_allow_html=True
+    )
+
+
+def render_variants(results):
+    # Side by side; the fixed-width story box is stretched to its column instead
+    for column, result in zip(st.columns(len(results)), results):
+        with column:
+            st.markdown(f"**{result['theme']}** · {result['word_limit']} words")
+            render_story(st.empty(), result["story"], width="100%")
+
+
+def parse_variants(text, limit):
+    variants = []
+    for line in text.splitlines():
+        if not line.strip():
+            continue
+        variant_theme, _, variant_limit = line.rpartition(",")
+        if not variant_theme.strip() or not variant_limit.strip().isdigit():
+            raise ValueError(f"Expected 'theme, word limit', got: {line.strip()}")
+        variants.append(StoryVariant(variant_theme.strip(), min(1000, max(100, int(variant_limit)))))
+    if not variants:
+        raise ValueError("Enter at least one variant.")
+    return variants[:limit]
+
+
 st.title("🖼️➡️📝 Image to Story Generator Web App")
 
 uploaded_file = st.file_uploader(
     "Upload an image (png, jpg, jpeg)", type=["png", "jpg", "jpeg"])
 
-if uploaded_file is not None and uploaded_file.size > 10 * 1024 * 1024:
-    st.error("Image too large. Please upload an image under 10 MB.")
+# Streamlit holds the whole upload in memory, so it keeps the ingestion limit; web_app.py streams larger files
+max_upload = get_app_context().config_manager.get_data_ingestion_config().max_file_size
+if uploaded_file is not None and uploaded_file.size > max_upload:
+    st.error(f"Image too large. Please upload an image under {max_upload // (1024 * 1024)} MB.")
     st.stop()
 
 theme = st.text_input("Story Theme", value="adventure")
 word_limit = st.number_input("Word Limit", min_value=100, max_value=1000, value=400, step=50)
 
-if st.button("Generate Story"):
+story_config = get_app_context().config_manager.get_story_generation_config()
+variants = None
+if st.checkbox("Compare variants side by side"):
+    variant_text = st.text_area(
+        f"Variants, one per line as 'theme, word limit' (up to {story_config.max_variants})",
+        value=f"{theme}, {word_limit}\nfantasy, 300\nmystery, 300"
+    )
+    try:
+        variants = parse_variants(variant_text, story_config.max_variants)
+    except ValueError as e:
+        st.error(str(e))
+        st.stop()
+
+queue_config = get_app_context().config_manager.get_job_queue_config()
+if "user_id" not in st.session_state:
+    # Per-browser-session identity for the queue's rate limits
+    st.session_state.user_id = uuid.uuid4().hex
+
+
+def speculate(data, name, ingested_future, cancelled):
+    # Background thread, no st.* calls; the caption does not depend on theme or length,
+    # so it is ready (and cached) by the time the button is pressed
+    try:
+        ingested = DataIngestionPipeline().main_bytes(data, name)
+    except Exception as e:
+        ingested_future.set_exception(e)
+        raise
+    ingested_future.set_result(ingested)
+    if cancelled.is_set():
+        return None
+    return ImageCaptioningPipeline().main_ingested(ingested)
+
+
+def cancel_speculation(upload):
+    upload["cancelled"].set()
+    if upload["caption"].cancel():
+        metrics.incr("speculative_captions_cancelled_total")
+
+
+def prepare_upload():
+    # Keyed by content hash: reruns for the same image (new theme, length or variants) reuse
+    # the running or finished work, and a different file cancels what is still pending
+    previous = st.session_state.get("upload")
+    if uploaded_file is None:
+        if previous:
+            cancel_speculation(previous)
+            del st.session_state.upload
+        return None
+    digest = hashlib.sha256(uploaded_file.getvalue()).hexdigest()
+    caption_future = previous["caption"] if previous else None
+    failed = caption_future is not None and caption_future.done() and (
+        caption_future.cancelled() or caption_future.exception() is not None
+    )
+    if previous and previous["digest"] == digest and not failed:
+        return previous
+    if previous:
+        cancel_speculation(previous)
+
+    ingested_future, cancelled = Future(), threading.Event()
+    caption_future = speculation_executor().submit(
+        speculate, uploaded_file.getvalue(), uploaded_file.name, ingested_future, cancelled
+    )
+    metrics.incr("speculative_captions_total")
+    st.session_state.upload = {"digest": digest, "ingested": ingested_future, "caption": caption_future,
+                               "cancelled": cancelled}
+    return st.session_state.upload
+
+
+upload = prepare_upload()
+
+
+def ingest_upload():
+    if not upload["ingested"].done():
+        with st.spinner("Processing image..."):
+            upload["ingested"].result()
+    ingested = upload["ingested"].result()
+    st.image(ingested.data, caption="Preprocessed Image", use_container_width=True)
+    return ingested
+
+
+def submit_job():
+    try:
+        # With the sqlite result cache the worker finds the speculative caption and skips captioning
+        ingested = ingest_upload()
+        # Workers read the ingested image from disk, so the background write must have landed
+        if ingested.persist_future is None:
+            raise RuntimeError("Queued generation needs data_ingestion.persist_ingested enabled")
+        ingested.persist_future.result()
+    except Exception as e:
+        st.error(f"Error in Data Ingestion Stage: {e}")
+        st.exception(e)
+        st.stop()
+
+    payload = {"ingested_path": str(ingested.path), "theme": theme, "word_limit": int(word_limit)}
+    if variants:
+        payload["variants"] = [[variant.theme, variant.word_limit] for variant in variants]
+    try:
+        st.session_state.job_id = get_app_context().job_queue().enqueue(
+            payload,
+            user_id=st.session_state.user_id,
+            priority=queue_config.default_priority
+        )
+    except RateLimitExceeded as e:
+        st.warning(f"{e}. Please wait a moment and try again.")
+        st.stop()
+
+
+def poll_job(job_id):
+    # Reruns (widget changes, reconnects) re-attach here instead of restarting the work
+    job_queue = get_app_context().job_queue()
+    if st.button("Cancel"):
+        job_queue.cancel(job_id)
+
+    status_box, caption_box = st.empty(), st.empty()
+    job = job_queue.get(job_id)
+    if job is not None and "variants" not in job.payload:
+        st.markdown(f"**Theme:** {job.payload['theme']}  |  **Word limit:** {job.payload['word_limit']}")
+    st.markdown("### Your Story:")
+    story_box = st.empty()
+    while True:
+        job = job_queue.get(job_id)
+        if job is None:
+            st.error("Job not found.")
+            break
+        shown = job.result or job.progress
+        if shown.get("caption"):
+            caption_box.markdown(f"**Caption:** {shown['caption']}")
+        if shown.get("story"):
+            render_story(story_box, shown["story"])
+
+        if job.status == "queued":
+            status_box.info(f"Waiting for a worker ({job_queue.position(job_id)} job(s) ahead)...")
+        elif job.status == "running":
+            stage = "Generating caption" if job.progress.get("stage") == "captioning" else "Writing story"
+            status_box.info(f"{stage}...")
+        elif job.status == "done":
+            status_box.success("Story generated!")
+            if job.result.get("variants"):
+                with story_box.container():
+                    render_variants(job.result["variants"])
+            break
+        elif job.status == "cancelled":
+            status_box.warning("Generation cancelled.")
+            break
+        else:
+            status_box.error(f"Generation failed: {job.error}")
+            break
+        time.sleep(queue_config.poll_interval)
+    st.session_state.pop("job_id", None)
+
+
+if queue_config.enabled:
+    if st.button("Generate Story"):
+        if uploaded_file is None:
+            st.error("Please upload an image file.")
+        else:
+            submit_job()
+    if st.session_state.get("job_id"):
+        poll_job(st.session_state.job_id)
+
+elif st.button("Generate Story"):
     if uploaded_file is None:
         st.error("Please upload an image file.")
     else:
-        # Save file to disk
-        upload_path = Path("data/raw") / uploaded_file.name
-        with open(upload_path, "wb") as f:
-            f.write(uploaded_file.getbuffer())
-        st.info(f"Image saved at {upload_path}")
-
-        # 1. Data Ingestion
+        # 1. Data Ingestion (decoded once in memory, persisted in the background)
         try:
-            with st.spinner("Processing image..."):
-                data_pipeline = DataIngestionPipeline()
-                ingested_path = data_pipeline.main(upload_path)
-            st.image(str(ingested_path), caption="Preprocessed Image", use_container_width=True)
+            ingested = ingest_upload()
         except Exception as e:
             st.error(f"Error in Data Ingestion Stage: {e}")
             st.exception(e)
@@ -43,34 +273,51 @@ if st.button("Generate Story"):
 
         # 2. Image Captioning
         try:
-            with st.spinner("Generating caption..."):
-                caption_pipeline = ImageCaptioningPipeline()
-                caption = caption_pipeline.main(ingested_path)
-            st.success("Caption generated!")
+            # Started on upload; usually already finished, so the story call goes out at once
+            if not upload["caption"].done():
+                with st.spinner("Generating caption..."):
+                    upload["caption"].result()
+                st.success("Caption generated!")
+            caption = upload["caption"].result()
             st.markdown(f"**Caption:** {caption}")
         except Exception as e:
             st.error(f"Error in Image Captioning Stage: {e}")
             st.exception(e)
             st.stop()
 
-        # 3. Story Generation
-        try:
-            caption_file = Path("data/captions") / f"{ingested_path.stem}_caption.txt"
-            with st.spinner("Generating story..."):
-                story_pipeline = StoryGenerationPipeline()
-                story = story_pipeline.main(caption_file, theme, word_limit)
-            st.success("Story generated!")
-        except Exception as e:
-            st.error(f"Error in Story Generation Stage: {e}")
-            st.exception(e)
-            st.stop()
-
-        # Show story in a nice box
-        st.markdown(f"**Theme:** {theme}  |  **Word limit:** {word_limit}")
-        st.markdown("### Your Story:")
-        st.markdown(
-            f"<div style='width: 650px; min-height: 100px; max-height: 600px; background: #f7f7f7; border-radius: 8px; border: 1px solid #ebebeb; margin: 1em 0; padding: 1.5em; overflow-y: auto; overflow-x: hidden; font-family: Georgia,serif; font-color: black; font-size: 1.1em; white-space: pre-wrap; word-wrap: break-word; box-sizing: border-box;'>{story}</div>",
-            unsafe_allow_html=True
-        )
+        # 3. Story Generation (streamed into the story box as tokens arrive)
+        # Request-scoped path, so concurrent uploads of the same file name never collide
+        caption_file = get_app_context().artifact_store().path("caption", ingested.request_id)
+        if not caption_file.exists():
+            # Cleaned up since it was captioned; the text alone still works (the story is just not saved)
+            caption_file = caption
+        story_pipeline = StoryGenerationPipeline()
+        if variants:
+            st.markdown("### Your Stories:")
+            try:
+                with st.spinner(f"Writing {len(variants)} stories..."):
+                    results = story_pipeline.variants(caption_file, variants)
+                render_variants(results)
+                st.success("Stories generated!")
+            except Exception as e:
+                st.error(f"Error in Story Generation Stage: {e}")
+                st.exception(e)
+                st.stop()
+        else:
+            st.markdown(f"**Theme:** {theme}  |  **Word limit:** {word_limit}")
+            st.markdown("### Your Story:")
+            story_box = st.empty()
+            story = ""
+            try:
+                with request_deadline(story_pipeline.deadline()):
+                    for chunk in story_pipeline.stream(caption_file, theme, word_limit):
+                        story += chunk
+                        render_story(story_box, story)
+                render_story(story_box, story.strip())
+                st.success("Story generated!")
+            except Exception as e:
+                st.error(f"Error in Story Generation Stage: {e}")
+                st.exception(e)
+                st.stop()
 
 st.markdown("---\nDeveloped with ❤️ using Streamlit")
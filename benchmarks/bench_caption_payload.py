@@ -0,0 +1,117 @@
+"""Caption request payload size per encoding profile.
+
+Encodes synthetic photos (a camera-sized original and an already-ingested
+512 px JPEG) with each profile, and reports the base64 payload the vision
+request carries, the encode time, the upload time that payload takes at the
+given uplink speed, and the measured round trip of a caption call to the
+local mock server (zero model latency, so the difference is payload handling):
+
+    python -m benchmarks.bench_caption_payload --uplink-mbps 10 --profiles raw 1024:JPEG:85 560:JPEG:80 512:WEBP:80
+"""
+import argparse
+import base64
+import io
+import json
+import logging
+import statistics
+import time
+from pathlib import Path
+
+from benchmarks.bench_pipeline import IMAGE_SIZES, make_corpus
+from benchmarks.mock_server import MockSettings, base_url, start_mock_server
+from src.Imagecaption.components.caption_backends import MockServerBackend
+from src.Imagecaption.components.image_captioning import CAPTION_PROMPT
+from src.Imagecaption.components.image_encoding import encode_for_model
+from src.Imagecaption.entity.config_entity import EncodingProfile
+from src.Imagecaption.utils.common import sniff_image_mime
+
+
+def parse_profile(spec: str):
+    # "raw" sends the file untouched (the old behaviour); otherwise max_side:FORMAT:quality
+    if spec == "raw":
+        return None
+    max_side, output_format, quality = spec.split(":")
+    return EncodingProfile(max_side=int(max_side), format=output_format.upper(), quality=int(quality))
+
+
+def sources(size_names, tmp_dir: Path) -> dict:
+    from PIL import Image
+
+    images = {}
+    for path in make_corpus(tmp_dir, size_names, ["jpg"], per_combo=1):
+        images[path.stem] = path.read_bytes()
+    # What DataIngestion hands to the captioner by default
+    with Image.open(io.BytesIO(images[next(iter(images))])) as img:
+        img.thumbnail((512, 512))
+        buffer = io.BytesIO()
+        img.convert("RGB").save(buffer, "JPEG", quality=85, optimize=True)
+    images["ingested_512"] = buffer.getvalue()
+    return images
+
+
+def measure(image_bytes: bytes, profile, backend, uplink_mbps: float, runs: int) -> dict:
+    mime_type = sniff_image_mime(image_bytes)
+    encode_ms, round_trip_ms = [], []
+    for _ in range(runs):
+        start = time.perf_counter()
+        payload = encode_for_model(image_bytes, mime_type, profile).data if profile else image_bytes
+        encoded = base64.b64encode(payload)
+        encode_ms.append((time.perf_counter() - start) * 1000)
+
+        backend.encoding = profile
+        start = time.perf_counter()
+        backend.caption(image_bytes, mime_type)
+        round_trip_ms.append((time.perf_counter() - start) * 1000)
+    return {
+        "source_bytes": len(image_bytes),
+        "payload_bytes": len(encoded),
+        "encode_ms": round(statistics.median(encode_ms), 2),
+        "estimated_upload_ms": round(len(encoded) * 8 / (uplink_mbps * 1e6) * 1000, 1),
+        "mock_round_trip_ms": round(statistics.median(round_trip_ms), 2),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare caption request payloads across encoding profiles.")
+    parser.add_argument("--profiles", nargs="+", default=["raw", "1024:JPEG:85", "560:JPEG:80", "512:WEBP:80"],
+                        help='"raw" or max_side:FORMAT:quality')
+    parser.add_argument("--sizes", nargs="+", default=["large", "medium"], choices=sorted(IMAGE_SIZES))
+    parser.add_argument("--uplink-mbps", type=float, default=10.0, help="Uplink used for the upload-time estimate")
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--output", type=Path, default=None)
+    args = parser.parse_args(argv)
+
+    import tempfile
+
+    logging.disable(logging.WARNING)
+    server = start_mock_server(settings=MockSettings(latency_ms=0, jitter_ms=0, tokens_per_second=1e6, completion_tokens=8))
+    backend = MockServerBackend(base_url(server), "mock-vision", CAPTION_PROMPT, timeout=60, max_tokens=8)
+
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        images = sources(args.sizes, Path(tmp))
+        print(f"{'image':>14} {'profile':>14} {'payload KB':>11} {'encode ms':>10} {'upload ms':>10} {'mock rt ms':>11}")
+        for image_name, image_bytes in images.items():
+            results[image_name] = {}
+            for spec in args.profiles:
+                row = measure(image_bytes, parse_profile(spec), backend, args.uplink_mbps, args.runs)
+                results[image_name][spec] = row
+                print(f"{image_name:>14} {spec:>14} {row['payload_bytes'] / 1024:>11.1f} {row['encode_ms']:>10.1f} "
+                      f"{row['estimated_upload_ms']:>10.1f} {row['mock_round_trip_ms']:>11.1f}")
+    server.shutdown()
+
+    report = {
+        "benchmark": "caption_payload",
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "settings": {"profiles": args.profiles, "sizes": args.sizes, "uplink_mbps": args.uplink_mbps, "runs": args.runs},
+        "results": results,
+    }
+    output = args.output or Path("benchmarks/results") / f"caption_payload_{time.strftime('%Y%m%d_%H%M%S')}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, indent=2), encoding="utf-8")
+    print(f"Report written to {output}")
+    return report
+
+
+if __name__ == "__main__":
+    main()
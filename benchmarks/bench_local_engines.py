@@ -0,0 +1,191 @@
+"""Latency versus caption quality for the local Florence-2 inference engines.
+
+Captions the same images with each engine (and thread count), using the eager
+float32 captions as the quality reference, and optionally scores every engine
+against human reference captions from a JSONL file (``{"image": ..., "caption": ...}``):
+
+    python -m benchmarks.bench_local_engines --images data/ingested --engines eager int8 compiled onnx \
+        --threads 2 4 --batch-size 1 4 --output benchmarks/results/local_engines.json
+
+Without ``--images`` a synthetic corpus is used, which is fine for latency but
+says nothing about caption quality.
+"""
+import argparse
+import json
+import platform
+import statistics
+import sys
+import tempfile
+import time
+from collections import Counter
+from difflib import SequenceMatcher
+from pathlib import Path
+
+from src.Imagecaption.components.local_model import (
+    DEFAULT_LOCAL_MODEL,
+    DEFAULT_ONNX_DIR,
+    INFERENCE_ENGINES,
+    Florence2BatchEngine,
+    Florence2Registry,
+)
+from benchmarks.bench_pipeline import make_corpus, peak_rss_mb
+
+
+def word_f1(candidate: str, reference: str) -> float:
+    cand, ref = Counter(candidate.lower().split()), Counter(reference.lower().split())
+    overlap = sum((cand & ref).values())
+    if not overlap:
+        return 0.0
+    precision, recall = overlap / sum(cand.values()), overlap / sum(ref.values())
+    return 2 * precision * recall / (precision + recall)
+
+
+def similarity(candidates: list, references: list) -> dict:
+    if not references:
+        return {}
+    return {
+        "word_f1": round(statistics.mean(word_f1(c, r) for c, r in zip(candidates, references)), 4),
+        "sequence_ratio": round(statistics.mean(
+            SequenceMatcher(None, c.lower(), r.lower()).ratio() for c, r in zip(candidates, references)
+        ), 4),
+    }
+
+
+def load_images(paths: list) -> list:
+    from PIL import Image
+
+    images = []
+    for path in paths:
+        with Image.open(path) as img:
+            images.append(img.convert("RGB"))
+    return images
+
+
+def run_engine(args, engine: str, threads: int, batch_size: int, images: list) -> dict:
+    registry = Florence2Registry()
+    batch_engine = Florence2BatchEngine(
+        model_name=args.model,
+        revision=args.revision,
+        max_new_tokens=args.max_new_tokens,
+        num_beams=args.num_beams,
+        batch_size=batch_size,
+        engine=engine,
+        num_threads=threads,
+        onnx_dir=args.onnx_dir,
+        registry=registry,
+    )
+
+    load_start = time.perf_counter()
+    registry.get(args.model, args.revision, engine, threads, args.onnx_dir)
+    load_seconds = time.perf_counter() - load_start
+
+    # First batch pays compilation / graph warm-up; reported separately
+    warm_start = time.perf_counter()
+    batch_engine.caption_batch(images[:batch_size])
+    warmup_seconds = time.perf_counter() - warm_start
+
+    per_image, captions = [], []
+    for _ in range(args.repeats):
+        captions = []
+        for start in range(0, len(images), batch_size):
+            batch = images[start:start + batch_size]
+            batch_start = time.perf_counter()
+            captions.extend(batch_engine.caption_batch(batch))
+            per_image.append((time.perf_counter() - batch_start) / len(batch))
+
+    registry.evict()
+    return {
+        "engine": engine,
+        "threads": threads,
+        "batch_size": batch_size,
+        "load_seconds": round(load_seconds, 3),
+        "warmup_seconds": round(warmup_seconds, 3),
+        "seconds_per_image": {
+            "p50": round(statistics.median(per_image), 4),
+            "p95": round(sorted(per_image)[int(0.95 * (len(per_image) - 1))], 4),
+            "mean": round(statistics.mean(per_image), 4),
+        },
+        "images_per_second": round(1.0 / statistics.mean(per_image), 3),
+        "peak_rss_mb": round(peak_rss_mb(), 1),
+        "captions": captions,
+    }
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Compare local Florence-2 inference engines.")
+    parser.add_argument("--images", type=Path, default=None, help="Directory of images to caption")
+    parser.add_argument("--references", type=Path, default=None, help="JSONL of {image, caption} reference captions")
+    parser.add_argument("--limit", type=int, default=8, help="Max images to caption")
+    parser.add_argument("--engines", nargs="+", default=list(INFERENCE_ENGINES), choices=list(INFERENCE_ENGINES))
+    parser.add_argument("--threads", type=int, nargs="+", default=[0], help="torch threads; 0 keeps the default")
+    parser.add_argument("--batch-size", type=int, nargs="+", default=[1])
+    parser.add_argument("--repeats", type=int, default=2)
+    parser.add_argument("--model", default=DEFAULT_LOCAL_MODEL)
+    parser.add_argument("--revision", default="main")
+    parser.add_argument("--max-new-tokens", type=int, default=64)
+    parser.add_argument("--num-beams", type=int, default=3)
+    parser.add_argument("--onnx-dir", default=DEFAULT_ONNX_DIR)
+    parser.add_argument("--output", type=Path, default=None)
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+
+    with tempfile.TemporaryDirectory(prefix="imagecaption-engines-") as tmp:
+        if args.images:
+            paths = sorted(p for p in args.images.iterdir() if p.suffix.lower() in (".jpg", ".jpeg", ".png"))
+        else:
+            paths = make_corpus(Path(tmp), ["small", "medium"], ["jpg"])
+        paths = paths[:args.limit]
+        images = load_images(paths)
+
+    references = {}
+    if args.references:
+        with open(args.references, encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    row = json.loads(line)
+                    references[Path(row["image"]).name] = row["caption"]
+    human = [references.get(p.name) for p in paths]
+
+    runs, baseline = [], None
+    for threads in args.threads:
+        for batch_size in args.batch_size:
+            for engine in args.engines:
+                try:
+                    result = run_engine(args, engine, threads, batch_size, images)
+                except Exception as e:
+                    # Missing optional runtimes (onnxruntime, a compiler toolchain) skip that engine
+                    print(f"{engine:>9} threads={threads} batch={batch_size}: failed ({e!r})")
+                    runs.append({"engine": engine, "threads": threads, "batch_size": batch_size, "error": repr(e)})
+                    continue
+                if engine == "eager" and baseline is None:
+                    baseline = result["captions"]
+                result["vs_eager"] = similarity(result["captions"], baseline or [])
+                if all(human):
+                    result["vs_references"] = similarity(result["captions"], human)
+                runs.append(result)
+                print(f"{engine:>9} threads={threads} batch={batch_size}: "
+                      f"{result['seconds_per_image']['p50']:.3f}s/img p50, "
+                      f"vs eager {result['vs_eager'].get('word_f1', '-')}")
+
+    report = {
+        "benchmark": "local_engines",
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "model": f"{args.model}@{args.revision}",
+        "images": [p.name for p in paths],
+        "generation": {"max_new_tokens": args.max_new_tokens, "num_beams": args.num_beams},
+        "runs": runs,
+    }
+    output = args.output or Path("benchmarks/results") / f"local_engines_{time.strftime('%Y%m%d_%H%M%S')}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, indent=2), encoding="utf-8")
+    print(f"Report written to {output}")
+    return report
+
+
+if __name__ == "__main__":
+    main()
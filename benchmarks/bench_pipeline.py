@@ -0,0 +1,217 @@
+"""Offline throughput/latency benchmark for the three pipeline stages.
+
+Drives DataIngestion -> ImageCaptioning -> StoryGeneration against the local
+mock server with synthetic images, at one or more concurrency levels, and
+writes a JSON report for comparing runs:
+
+    python -m benchmarks.bench_pipeline --requests 40 --concurrency 1 4 16 \
+        --latency-ms 300 --tokens-per-second 80 --output benchmarks/results/run.json
+"""
+import argparse
+import json
+import platform
+import random
+import resource
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import replace
+from pathlib import Path
+
+from benchmarks.mock_server import MockSettings, start_mock_server, base_url
+from src.Imagecaption.config.configuration import ConfigurationManager
+from src.Imagecaption.components.data_ingestion import DataIngestion
+from src.Imagecaption.components.image_captioning import ImageCaptioning
+from src.Imagecaption.components.story_generation import StoryGeneration
+from src.Imagecaption.utils.metrics import metrics
+
+IMAGE_SIZES = {"small": (320, 240), "medium": (1280, 960), "large": (4000, 3000)}
+IMAGE_FORMATS = {"jpg": "JPEG", "png": "PNG"}
+
+
+def make_corpus(directory: Path, sizes, formats, per_combo: int = 2, seed: int = 0) -> list:
+    from PIL import Image, ImageDraw
+
+    rng = random.Random(seed)
+    paths = []
+    for size_name in sizes:
+        width, height = IMAGE_SIZES[size_name]
+        for ext in formats:
+            for i in range(per_combo):
+                # Noise plus shapes so encoders cannot cheat on flat colour
+                noise = Image.effect_noise((width, height), rng.randint(20, 80))
+                image = Image.merge("RGB", (noise, noise.rotate(90, expand=False), noise.transpose(Image.Transpose.FLIP_LEFT_RIGHT)))
+                draw = ImageDraw.Draw(image)
+                for _ in range(12):
+                    x0, y0 = rng.randrange(width), rng.randrange(height)
+                    draw.ellipse([x0, y0, x0 + width // 6, y0 + height // 6],
+                                 fill=(rng.randrange(256), rng.randrange(256), rng.randrange(256)))
+                path = directory / f"{size_name}_{i}.{ext}"
+                image.save(path, IMAGE_FORMATS[ext])
+                paths.append(path)
+    return paths
+
+
+def build_components(workdir: Path, mock_url: str):
+    from together import Together
+
+    config_manager = ConfigurationManager()
+    ingestion_config = replace(
+        config_manager.get_data_ingestion_config(),
+        raw_data_dir=workdir / "raw",
+        ingested_data_dir=workdir / "ingested",
+        max_file_size=200 * 1024 * 1024,
+    )
+    captioning_config = replace(
+        config_manager.get_image_captioning_config(),
+        ingested_data_dir=workdir / "ingested",
+        captions_dir=workdir / "captions",
+        remote_backend="mock",
+        mock_base_url=mock_url,
+        local_fallback=False,
+        hedge_after_ms=0,
+    )
+    story_config = replace(
+        config_manager.get_story_generation_config(),
+        captions_dir=workdir / "captions",
+        stories_dir=workdir / "stories",
+    )
+    client = Together(api_key="mock", base_url=mock_url, max_retries=0)
+    return (
+        DataIngestion(ingestion_config),
+        ImageCaptioning(captioning_config, client=client),
+        StoryGeneration(story_config, client=client),
+    )
+
+
+def percentiles(values: list) -> dict:
+    if not values:
+        return {"p50": 0.0, "p95": 0.0, "p99": 0.0, "mean": 0.0}
+    ordered = sorted(values)
+
+    def pick(q):
+        return ordered[min(len(ordered) - 1, int(round(q / 100.0 * (len(ordered) - 1))))]
+
+    return {
+        "p50": round(pick(50), 4),
+        "p95": round(pick(95), 4),
+        "p99": round(pick(99), 4),
+        "mean": round(sum(ordered) / len(ordered), 4),
+    }
+
+
+def run_level(components, images: list, n_requests: int, concurrency: int, theme: str, word_limit: int) -> dict:
+    data_ingestion, image_captioner, story_generator = components
+
+    def one(index: int) -> tuple:
+        source = images[index % len(images)]
+        # Each request gets its own copy so ingestion's rename never races
+        request_path = data_ingestion.config.raw_data_dir / f"req{index}_{source.name}"
+        request_path.write_bytes(source.read_bytes())
+        start = time.perf_counter()
+        try:
+            ingested_path = data_ingestion.ingest(request_path)
+            image_captioner.caption_image(ingested_path)
+            caption_file = image_captioner.caption_path(ingested_path)
+            story_generator.generate_story(caption_file, theme, word_limit)
+            return time.perf_counter() - start, None
+        except Exception as e:
+            return time.perf_counter() - start, repr(e)
+
+    metrics.reset()
+    wall_start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        outcomes = list(pool.map(one, range(n_requests)))
+    wall = time.perf_counter() - wall_start
+
+    latencies = [latency for latency, error in outcomes if error is None]
+    errors = [error for _, error in outcomes if error is not None]
+    stages = {
+        labels: summary
+        for labels, summary in metrics.summary()["histograms"].get("stage_seconds", {}).items()
+    }
+    return {
+        "concurrency": concurrency,
+        "requests": n_requests,
+        "succeeded": len(latencies),
+        "failed": len(errors),
+        "sample_errors": errors[:3],
+        "wall_seconds": round(wall, 4),
+        "throughput_rps": round(len(latencies) / wall, 4) if wall else 0.0,
+        "latency_seconds": percentiles(latencies),
+        "stages": stages,
+        "counters": metrics.summary()["counters"],
+        "peak_rss_mb": round(peak_rss_mb(), 1),
+    }
+
+
+def peak_rss_mb() -> float:
+    # ru_maxrss is KiB on Linux and bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the image-to-story pipeline against a local mock API.")
+    parser.add_argument("--requests", type=int, default=20, help="Requests per concurrency level")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16])
+    parser.add_argument("--sizes", nargs="+", default=list(IMAGE_SIZES), choices=list(IMAGE_SIZES))
+    parser.add_argument("--formats", nargs="+", default=list(IMAGE_FORMATS), choices=list(IMAGE_FORMATS))
+    parser.add_argument("--latency-ms", type=float, default=200.0)
+    parser.add_argument("--jitter-ms", type=float, default=50.0)
+    parser.add_argument("--tokens-per-second", type=float, default=200.0)
+    parser.add_argument("--completion-tokens", type=int, default=120)
+    parser.add_argument("--failure-rate", type=float, default=0.0)
+    parser.add_argument("--theme", default="adventure")
+    parser.add_argument("--word-limit", type=int, default=300)
+    parser.add_argument("--output", type=Path, default=None, help="JSON report path (default: benchmarks/results/pipeline_<timestamp>.json)")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    settings = MockSettings(
+        latency_ms=args.latency_ms,
+        jitter_ms=args.jitter_ms,
+        tokens_per_second=args.tokens_per_second,
+        completion_tokens=args.completion_tokens,
+        failure_rate=args.failure_rate,
+    )
+    server = start_mock_server(settings=settings)
+    try:
+        with tempfile.TemporaryDirectory(prefix="imagecaption-bench-") as tmp:
+            workdir = Path(tmp)
+            corpus_dir = workdir / "corpus"
+            corpus_dir.mkdir()
+            images = make_corpus(corpus_dir, args.sizes, args.formats)
+            components = build_components(workdir, base_url(server))
+
+            levels = []
+            for concurrency in args.concurrency:
+                result = run_level(components, images, args.requests, concurrency, args.theme, args.word_limit)
+                levels.append(result)
+                print(f"concurrency={concurrency:>3}  rps={result['throughput_rps']:>7.2f}  "
+                      f"p50={result['latency_seconds']['p50']:.3f}s  p95={result['latency_seconds']['p95']:.3f}s  "
+                      f"failed={result['failed']}")
+    finally:
+        server.shutdown()
+
+    report = {
+        "benchmark": "pipeline",
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "mock": vars(settings),
+        "corpus": {"sizes": args.sizes, "formats": args.formats, "images": len(images)},
+        "levels": levels,
+    }
+    output = args.output or Path("benchmarks/results") / f"pipeline_{time.strftime('%Y%m%d_%H%M%S')}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, indent=2), encoding="utf-8")
+    print(f"Report written to {output}")
+    return report
+
+
+if __name__ == "__main__":
+    main()
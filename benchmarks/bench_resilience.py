@@ -0,0 +1,104 @@
+"""Success rate and latency under provider throttling, with and without the resilience layer.
+
+Fires concurrent story requests at a mock server that answers 429 (with
+Retry-After) once more than ``--server-capacity`` requests are in flight,
+first through a bare client and then through ``ResilientClient``, and
+reports successes, latency percentiles, retries and the final adaptive
+concurrency limit:
+
+    python -m benchmarks.bench_resilience --requests 60 --concurrency 24 --server-capacity 6
+"""
+import argparse
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, replace
+from pathlib import Path
+
+from benchmarks.bench_pipeline import percentiles
+from benchmarks.mock_server import MockSettings, start_mock_server, base_url
+from src.Imagecaption.config.configuration import ConfigurationManager
+from src.Imagecaption.utils.metrics import metrics
+from src.Imagecaption.utils.resilience import RateController, ResilientClient, request_deadline
+
+MODEL = "mock-story-model"
+
+
+def run(client, n_requests: int, concurrency: int, deadline: float) -> dict:
+    def one(_):
+        start = time.perf_counter()
+        try:
+            with request_deadline(deadline):
+                client.chat.completions.create(
+                    model=MODEL, messages=[{"role": "user", "content": "Tell me a story"}], max_tokens=60
+                )
+            return time.perf_counter() - start, None
+        except Exception as e:
+            return time.perf_counter() - start, type(e).__name__
+
+    metrics.reset()
+    wall_start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        outcomes = list(pool.map(one, range(n_requests)))
+    wall = time.perf_counter() - wall_start
+    latencies = [latency for latency, error in outcomes if error is None]
+    errors = [error for _, error in outcomes if error is not None]
+    summary = metrics.summary()
+    return {
+        "succeeded": len(latencies),
+        "failed": len(errors),
+        "errors": sorted(set(errors)),
+        "wall_seconds": round(wall, 3),
+        "latency_seconds": percentiles(latencies),
+        "counters": {name: series for name, series in summary["counters"].items() if name.startswith("provider_")},
+        "gauges": summary["gauges"],
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare bare and resilient clients against a throttling mock API.")
+    parser.add_argument("--requests", type=int, default=60)
+    parser.add_argument("--concurrency", type=int, default=24, help="Client threads issuing requests")
+    parser.add_argument("--server-capacity", type=int, default=6, help="Mock in-flight limit before it answers 429")
+    parser.add_argument("--latency-ms", type=float, default=150.0)
+    parser.add_argument("--deadline", type=float, default=30.0, help="Per-request deadline in seconds")
+    parser.add_argument("--output", type=Path, default=None)
+    args = parser.parse_args(argv)
+
+    from together import Together
+
+    server = start_mock_server(settings=MockSettings(
+        latency_ms=args.latency_ms, jitter_ms=args.latency_ms / 4, tokens_per_second=400,
+        max_concurrency=args.server_capacity
+    ))
+    config = replace(ConfigurationManager().get_resilience_config(), initial_concurrency=args.concurrency)
+    try:
+        raw = Together(api_key="mock", base_url=base_url(server), max_retries=0)
+        results = {
+            "bare": run(raw, args.requests, args.concurrency, args.deadline),
+            "resilient": run(ResilientClient(raw, RateController(config), config),
+                             args.requests, args.concurrency, args.deadline),
+        }
+    finally:
+        server.shutdown()
+
+    for name, result in results.items():
+        print(f"{name:>9}: {result['succeeded']}/{args.requests} ok  p50={result['latency_seconds']['p50']:.3f}s  "
+              f"p95={result['latency_seconds']['p95']:.3f}s  wall={result['wall_seconds']:.2f}s  errors={result['errors']}")
+
+    report = {
+        "benchmark": "resilience",
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "settings": vars(args) | {"output": str(args.output) if args.output else None},
+        "resilience": asdict(config),
+        "results": results,
+    }
+    output = args.output or Path("benchmarks/results") / f"resilience_{time.strftime('%Y%m%d_%H%M%S')}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, indent=2), encoding="utf-8")
+    print(f"Report written to {output}")
+    return report
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""Cold-start import benchmark for the pipeline modules.
+
+Imports each ``src.Imagecaption.pipeline.*`` module in a fresh interpreter,
+takes the median over several runs, and fails (exit code 1) when a module is
+over the time budget or drags in a dependency that must stay lazy:
+
+    python -m benchmarks.bench_startup --budget-ms 250 --runs 5 --output benchmarks/results/startup.json
+"""
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+PIPELINE_MODULES = [
+    "src.Imagecaption.pipeline.data_ingestion_pipeline",
+    "src.Imagecaption.pipeline.image_captioning_pipeline",
+    "src.Imagecaption.pipeline.story_generation_pipeline",
+    "src.Imagecaption.pipeline.async_pipeline",
+    "src.Imagecaption.pipeline.batch_pipeline",
+    "src.Imagecaption.pipeline.worker_pipeline",
+]
+
+# Only app.py may import Streamlit; SDKs and model runtimes load on first use
+FORBIDDEN_MODULES = ["streamlit", "together", "httpx", "torch", "transformers", "PIL", "joblib", "numpy"]
+
+_PROBE = """
+import json, sys, time
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+print(json.dumps({{"seconds": elapsed, "loaded": [m for m in {forbidden!r} if m in sys.modules]}}))
+"""
+
+
+def measure(module: str, runs: int, cwd: Path) -> dict:
+    samples, loaded = [], set()
+    for _ in range(runs):
+        wall_start = time.perf_counter()
+        output = subprocess.run(
+            [sys.executable, "-c", _PROBE.format(module=module, forbidden=FORBIDDEN_MODULES)],
+            cwd=cwd, capture_output=True, text=True, check=True
+        ).stdout.strip().splitlines()[-1]
+        wall = time.perf_counter() - wall_start
+        result = json.loads(output)
+        samples.append((result["seconds"], wall))
+        loaded.update(result["loaded"])
+    return {
+        "module": module,
+        "import_ms": round(statistics.median(s for s, _ in samples) * 1000, 1),
+        "process_ms": round(statistics.median(w for _, w in samples) * 1000, 1),
+        "eager_dependencies": sorted(loaded),
+    }
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Measure cold-start import time of the pipeline modules.")
+    parser.add_argument("--budget-ms", type=float, default=250.0, help="Median import-time budget per module")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--modules", nargs="+", default=PIPELINE_MODULES)
+    parser.add_argument("--output", type=Path, default=None, help="Optional JSON report path")
+    args = parser.parse_args(argv)
+
+    root = Path(__file__).resolve().parent.parent
+    results, failures = [], []
+    for module in args.modules:
+        result = measure(module, args.runs, root)
+        result["within_budget"] = result["import_ms"] <= args.budget_ms and not result["eager_dependencies"]
+        results.append(result)
+        if not result["within_budget"]:
+            failures.append(module)
+        print(f"{result['import_ms']:>8.1f} ms  (process {result['process_ms']:>7.1f} ms)  {module}"
+              + (f"  eager: {', '.join(result['eager_dependencies'])}" if result["eager_dependencies"] else ""))
+
+    if args.output:
+        args.output.parent.mkdir(parents=True, exist_ok=True)
+        args.output.write_text(json.dumps({
+            "benchmark": "startup",
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": sys.version.split()[0],
+            "budget_ms": args.budget_ms,
+            "results": results,
+        }, indent=2), encoding="utf-8")
+
+    if failures:
+        print(f"Over budget or importing heavy dependencies eagerly: {', '.join(failures)}")
+        return 1
+    print(f"All modules within the {args.budget_ms:.0f} ms budget")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,104 @@
+"""Generated length and latency versus the requested word budget.
+
+For each word limit, generates stories with the word-limit-derived token
+budget and with the old fixed 1024-token budget, and reports requested words,
+max_tokens, generated words and latency for both. Runs against the local mock
+server by default, or the real API with ``--live`` (needs TOGETHER_API_KEY):
+
+    python -m benchmarks.bench_story_budget --word-limits 100 300 600 1000 --repeats 3
+"""
+import argparse
+import json
+import statistics
+import time
+from dataclasses import replace
+from pathlib import Path
+
+from benchmarks.mock_server import MockSettings, start_mock_server, base_url
+from src.Imagecaption.config.configuration import ConfigurationManager
+from src.Imagecaption.components.story_generation import StoryGeneration, word_count
+
+CAPTION = ("A lighthouse on a rocky cliff at dusk, waves crashing below, a small red boat "
+           "heading for the harbour while gulls circle overhead.")
+FIXED_BUDGET = 1024
+
+
+def measure(generator: StoryGeneration, word_limit: int, repeats: int, stream: bool) -> dict:
+    latencies, words = [], []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        if stream:
+            story = "".join(generator.stream_story(CAPTION, None, word_limit))
+        else:
+            story = generator.generate_story(CAPTION, None, word_limit)
+        latencies.append(time.perf_counter() - start)
+        words.append(word_count(story))
+    return {
+        "max_tokens": generator.sampling_params(word_limit)["max_tokens"],
+        "words_mean": round(statistics.mean(words), 1),
+        "words_max": max(words),
+        "over_limit": sum(w > word_limit for w in words),
+        "latency_p50": round(statistics.median(latencies), 3),
+        "latency_mean": round(statistics.mean(latencies), 3),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare generated story length and latency to the requested budget.")
+    parser.add_argument("--word-limits", type=int, nargs="+", default=[100, 300, 600, 1000])
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--stream", action="store_true", help="Measure stream_story instead of generate_story")
+    parser.add_argument("--live", action="store_true", help="Use the real Together API instead of the mock server")
+    parser.add_argument("--tokens-per-second", type=float, default=400.0, help="Mock server generation speed")
+    parser.add_argument("--output", type=Path, default=None)
+    args = parser.parse_args(argv)
+
+    config = ConfigurationManager().get_story_generation_config()
+    server, client = None, None
+    if not args.live:
+        from together import Together
+
+        server = start_mock_server(settings=MockSettings(
+            latency_ms=100, jitter_ms=0, tokens_per_second=args.tokens_per_second, completion_tokens=4096
+        ))
+        client = Together(api_key="mock", base_url=base_url(server))
+
+    # Captions are passed as strings, so nothing is written to disk
+    budgeted = StoryGeneration(config, client=client)
+    fixed = StoryGeneration(replace(config, min_tokens=FIXED_BUDGET, max_tokens_ceiling=FIXED_BUDGET), client=client)
+
+    rows = []
+    try:
+        for word_limit in args.word_limits:
+            row = {
+                "word_limit": word_limit,
+                "budgeted": measure(budgeted, word_limit, args.repeats, args.stream),
+                "fixed": measure(fixed, word_limit, args.repeats, args.stream),
+            }
+            rows.append(row)
+            print(f"limit={word_limit:>5}  budgeted: {row['budgeted']['max_tokens']:>5} tok "
+                  f"{row['budgeted']['words_mean']:>7.1f} words {row['budgeted']['latency_p50']:>6.2f}s  |  "
+                  f"fixed: {row['fixed']['max_tokens']:>5} tok {row['fixed']['words_mean']:>7.1f} words "
+                  f"{row['fixed']['latency_p50']:>6.2f}s")
+    finally:
+        if server is not None:
+            server.shutdown()
+
+    report = {
+        "benchmark": "story_budget",
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "backend": "together" if args.live else "mock",
+        "mode": "stream" if args.stream else "generate",
+        "tokens_per_word": config.tokens_per_word,
+        "token_headroom": config.token_headroom,
+        "rows": rows,
+    }
+    output = args.output or Path("benchmarks/results") / f"story_budget_{time.strftime('%Y%m%d_%H%M%S')}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, indent=2), encoding="utf-8")
+    print(f"Report written to {output}")
+    return report
+
+
+if __name__ == "__main__":
+    main()
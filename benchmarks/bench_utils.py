@@ -0,0 +1,102 @@
+"""Per-call overhead of the utility and configuration layer.
+
+Times the hot helpers in ``utils/common.py`` in two fresh interpreters, one
+with ``IMAGECAPTION_CHECK_TYPES=1`` (every call goes through ``ensure``'s
+annotation checks, as all calls used to) and one without, and compares
+rebuilding a config object from ``ConfigBox`` on every call (the old getter
+path) with the memoised, slotted config objects ``ConfigurationManager``
+now returns:
+
+    python -m benchmarks.bench_utils --number 20000 --output benchmarks/results/utils.json
+"""
+import argparse
+import json
+import logging
+import os
+import subprocess
+import sys
+import time
+import timeit
+from pathlib import Path
+
+_CHECK_ENV = "IMAGECAPTION_CHECK_TYPES"
+
+
+def measure(number: int) -> dict:
+    # Runs in the child process; results are nanoseconds per call (best of 5)
+    from src.Imagecaption.config.configuration import ConfigurationManager
+    from src.Imagecaption.utils import common
+
+    logging.disable(logging.WARNING)
+    png = b"\x89PNG\r\n\x1a\n" + b"\x00" * 32
+    manager = ConfigurationManager()
+    build_resilience = ConfigurationManager.get_resilience_config.__wrapped__
+    resilience = manager.get_resilience_config()
+
+    cases = {
+        "is_allowed_file": lambda: common.is_allowed_file("holiday photo.JPG", ["jpg", "jpeg", "png"]),
+        "clean_filename": lambda: common.clean_filename("holiday photo (1).jpg"),
+        "get_file_extension": lambda: common.get_file_extension("holiday.JPG"),
+        "sniff_image_mime": lambda: common.sniff_image_mime(png),
+        "get_secret": lambda: common.get_secret("IMAGECAPTION_BENCH_UNSET"),
+        "config_rebuild_from_configbox": lambda: build_resilience(manager).story_deadline,
+        "config_memoised_getter": lambda: manager.get_resilience_config().story_deadline,
+        "configbox_attribute": lambda: manager.params.resilience.story_deadline,
+        "config_attribute": lambda: resilience.story_deadline,
+    }
+    return {
+        name: round(min(timeit.repeat(case, number=number, repeat=5)) / number * 1e9, 1)
+        for name, case in cases.items()
+    }
+
+
+def run_child(number: int, check_types: bool, cwd: Path) -> dict:
+    env = {key: value for key, value in os.environ.items() if key != _CHECK_ENV}
+    if check_types:
+        env[_CHECK_ENV] = "1"
+    output = subprocess.run(
+        [sys.executable, "-m", "benchmarks.bench_utils", "--child", "--number", str(number)],
+        cwd=cwd, env=env, capture_output=True, text=True, check=True
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Per-call overhead of utils/common.py helpers and config access.")
+    parser.add_argument("--number", type=int, default=20000, help="Calls per timing run")
+    parser.add_argument("--output", type=Path, default=None)
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.child:
+        print(json.dumps(measure(args.number)))
+        return None
+
+    cwd = Path(__file__).resolve().parent.parent
+    checked = run_child(args.number, True, cwd)
+    unchecked = run_child(args.number, False, cwd)
+
+    print(f"{'ns/call':>34} {'checked':>10} {'default':>10} {'speedup':>8}")
+    for name in checked:
+        speedup = checked[name] / unchecked[name] if unchecked[name] else float("inf")
+        print(f"{name:>34} {checked[name]:>10.1f} {unchecked[name]:>10.1f} {speedup:>7.1f}x")
+    print(f"{'config: rebuild vs memoised':>34} {unchecked['config_rebuild_from_configbox']:>10.1f} "
+          f"{unchecked['config_memoised_getter']:>10.1f}")
+    print(f"{'attribute: ConfigBox vs slots':>34} {unchecked['configbox_attribute']:>10.1f} "
+          f"{unchecked['config_attribute']:>10.1f}")
+
+    report = {
+        "benchmark": "utils",
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "settings": {"number": args.number},
+        "ns_per_call": {"check_types": checked, "default": unchecked},
+    }
+    output = args.output or Path("benchmarks/results") / f"utils_{time.strftime('%Y%m%d_%H%M%S')}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, indent=2), encoding="utf-8")
+    print(f"Report written to {output}")
+    return report
+
+
+if __name__ == "__main__":
+    main()
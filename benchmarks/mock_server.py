@@ -0,0 +1,196 @@
+"""Local stand-in for the Together/OpenAI chat completions API.
+
+Serves ``POST /v1/chat/completions`` (plain and ``stream=True``) with
+configurable latency, token rate and failure rate so the pipelines can be
+benchmarked without an API key:
+
+    python -m benchmarks.mock_server --port 8765 --latency-ms 300 --tokens-per-second 80
+"""
+import argparse
+import json
+import random
+import threading
+import time
+import uuid
+from dataclasses import dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+LOREM = (
+    "The old lighthouse keeper watched the storm roll in over the grey water while "
+    "gulls wheeled above the rocks and a small red boat fought its way toward the harbour"
+).split()
+
+
+@dataclass
+class MockSettings:
+    latency_ms: float = 200.0        # time to first token
+    jitter_ms: float = 50.0
+    tokens_per_second: float = 100.0
+    completion_tokens: int = 120     # used when the request has no max_tokens
+    failure_rate: float = 0.0        # fraction of requests answered with an error
+    failure_status: int = 500        # 500 or 429 (429 also sends Retry-After)
+    max_concurrency: int = 0         # >0: requests beyond this many in flight get 429 + Retry-After
+
+
+def _completion_text(n_tokens: int) -> list:
+    # Every 12th word ends a sentence so word-limit trimming has boundaries to work with
+    return [LOREM[i % len(LOREM)] + ("." if i % 12 == 11 else "") for i in range(max(1, n_tokens))]
+
+
+class MockHandler(BaseHTTPRequestHandler):
+    settings = MockSettings()
+    protocol_version = "HTTP/1.1"
+    in_flight = 0
+    _in_flight_lock = threading.Lock()
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status: int, payload: dict, headers: dict = None):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path.rstrip("/").endswith("/models"):
+            self._send_json(200, {"object": "list", "data": [{"id": "mock", "object": "model"}]})
+        else:
+            self._send_json(404, {"error": {"message": "not found"}})
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        request = json.loads(self.rfile.read(length) or b"{}")
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            self._send_json(404, {"error": {"message": "not found"}})
+            return
+
+        settings = self.settings
+        cls = type(self)
+        with cls._in_flight_lock:
+            over_capacity = settings.max_concurrency and cls.in_flight >= settings.max_concurrency
+            if not over_capacity:
+                cls.in_flight += 1
+        if over_capacity:
+            self._send_json(429, {"error": {"message": "mock capacity exceeded"}}, {"Retry-After": "0.2"})
+            return
+        try:
+            self._complete(request, settings)
+        finally:
+            with cls._in_flight_lock:
+                cls.in_flight -= 1
+
+    def _complete(self, request: dict, settings: MockSettings):
+        time.sleep(max(0.0, settings.latency_ms + random.uniform(-settings.jitter_ms, settings.jitter_ms)) / 1000.0)
+
+        if random.random() < settings.failure_rate:
+            headers = {"Retry-After": "1"} if settings.failure_status == 429 else None
+            self._send_json(settings.failure_status, {"error": {"message": "mock failure"}}, headers)
+            return
+
+        n_tokens = min(int(request.get("max_tokens") or settings.completion_tokens), settings.completion_tokens)
+        words = _completion_text(n_tokens)
+        prompt_tokens = len(json.dumps(request.get("messages", []))) // 4
+        model = request.get("model", "mock")
+        completion_id = f"mock-{uuid.uuid4().hex[:12]}"
+
+        if request.get("stream"):
+            self._stream(completion_id, model, words)
+            return
+
+        # n samples are generated in parallel server-side, so they cost tokens but not time
+        n = max(1, int(request.get("n") or 1))
+        time.sleep(len(words) / settings.tokens_per_second)
+        self._send_json(200, {
+            "id": completion_id,
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [{
+                "index": i,
+                "message": {"role": "assistant", "content": " ".join(words[i % len(words):] + words[:i % len(words)])},
+                "finish_reason": "stop",
+            } for i in range(n)],
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": n * len(words),
+                "total_tokens": prompt_tokens + n * len(words),
+            },
+        })
+
+    def _stream(self, completion_id: str, model: str, words: list):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        delay = 1.0 / self.settings.tokens_per_second
+        self.close_connection = True
+        try:
+            for i, word in enumerate(words):
+                chunk = {
+                    "id": completion_id,
+                    "object": "chat.completion.chunk",
+                    "created": int(time.time()),
+                    "model": model,
+                    "choices": [{"index": 0, "delta": {"content": word if i == 0 else f" {word}"}, "finish_reason": None}],
+                }
+                self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+                self.wfile.flush()
+                time.sleep(delay)
+            self.wfile.write(b"data: [DONE]\n\n")
+            self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            # The client closed the stream early (e.g. it reached its word limit)
+            pass
+
+
+def start_mock_server(host: str = "127.0.0.1", port: int = 0, settings: MockSettings = None) -> ThreadingHTTPServer:
+    handler = type("ConfiguredMockHandler", (MockHandler,), {"settings": settings or MockSettings()})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="mock-together", daemon=True).start()
+    return server
+
+
+def base_url(server: ThreadingHTTPServer) -> str:
+    host, port = server.server_address[:2]
+    return f"http://{host}:{port}/v1"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run a local mock of the Together chat completions API.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency-ms", type=float, default=200.0)
+    parser.add_argument("--jitter-ms", type=float, default=50.0)
+    parser.add_argument("--tokens-per-second", type=float, default=100.0)
+    parser.add_argument("--completion-tokens", type=int, default=120)
+    parser.add_argument("--failure-rate", type=float, default=0.0)
+    parser.add_argument("--failure-status", type=int, default=500, choices=[429, 500, 503])
+    parser.add_argument("--max-concurrency", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    settings = MockSettings(
+        latency_ms=args.latency_ms,
+        jitter_ms=args.jitter_ms,
+        tokens_per_second=args.tokens_per_second,
+        completion_tokens=args.completion_tokens,
+        failure_rate=args.failure_rate,
+        failure_status=args.failure_status,
+        max_concurrency=args.max_concurrency,
+    )
+    server = start_mock_server(args.host, args.port, settings)
+    print(f"Mock Together API listening on {base_url(server)} (Ctrl+C to stop)")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
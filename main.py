@@ -1,7 +1,8 @@
-from src.Imagecaption import logger
+from src.Imagecaption import logger, setup_logging
 from src.Imagecaption.pipeline.data_ingestion_pipeline import DataIngestionPipeline
 from src.Imagecaption.pipeline.image_captioning_pipeline import ImageCaptioningPipeline
 from src.Imagecaption.pipeline.story_generation_pipeline import StoryGenerationPipeline
+from src.Imagecaption.utils.metrics import metrics
 from pathlib import Path
 
 STAGE_NAME_INGESTION = "Data Ingestion stage"
@@ -9,7 +10,10 @@ STAGE_NAME_CAPTIONING = "Image Captioning stage"
 STAGE_NAME_STORY = "Story Generation stage"
 
 if __name__ == '__main__':
+    setup_logging()
     try:
+        ImageCaptioningPipeline.warm_up()
+
         # Stage 1: Data Ingestion
         logger.info(f">>>>>> stage {STAGE_NAME_INGESTION} started <<<<<<")
         ingestion_pipeline = DataIngestionPipeline()
@@ -29,10 +33,11 @@ if __name__ == '__main__':
         theme = input("Enter desired story theme (e.g., adventure, fantasy, mystery): ")
         word_limit = int(input("Enter story word limit (e.g., 150, 300, 500): "))
         story_pipeline = StoryGenerationPipeline()
-        caption_file = Path("data/captions") / f"{ingested_path.stem}_caption.txt"
+        caption_file = captioning_pipeline.context.image_captioning().caption_path(ingested_path)
         story = story_pipeline.main(caption_file, theme, word_limit)
         logger.info(f"Generated Story Preview: {story[:200]}...")
         logger.info(f">>>>>> stage {STAGE_NAME_STORY} completed <<<<<<\n\nx==========x")
+        logger.info(f"Stage metrics:\n{metrics.summary_json()}")
 
     except Exception as e:
         logger.exception(e)
@@ -1,22 +1,37 @@
 import os
-import sys
 import logging
+from typing import Optional
 
 logging_str = "[%(asctime)s: %(levelname)s: %(module)s: %(message)s]"
 
 log_dir = "logs"
 log_filepath = os.path.join(log_dir,"running_logs.log")
-os.makedirs(log_dir, exist_ok=True)
 
+logger = logging.getLogger("ImageCaptionLogger")
 
-logging.basicConfig(
-    level= logging.INFO,
-    format= logging_str,
+_logging_configured = False
 
-    handlers=[
-        logging.FileHandler(log_filepath),
-        logging.StreamHandler(sys.stdout)
-    ]
-)
 
-logger = logging.getLogger("ImageCaptionLogger")
\ No newline at end of file
+def setup_logging(level: Optional[int] = None, config=None):
+    # Called by entry points (main.py, app.py, pipeline CLIs) rather than on import,
+    # so importing the package never touches the filesystem
+    global _logging_configured
+    if _logging_configured:
+        return logger
+    from src.Imagecaption.utils.logs import configure_logging
+
+    config_error = None
+    if config is None:
+        try:
+            from src.Imagecaption.config.configuration import ConfigurationManager
+            config = ConfigurationManager().get_logging_config()
+        except Exception as e:
+            from src.Imagecaption.entity.config_entity import LoggingConfig
+            config = LoggingConfig(log_file=log_filepath)
+            config_error = e
+    # Records are queued on the calling thread and written by a listener thread
+    configure_logging(config, level)
+    _logging_configured = True
+    if config_error is not None:
+        logger.warning(f"Logging config unavailable ({config_error}); using defaults")
+    return logger
@@ -0,0 +1,349 @@
+import asyncio
+import base64
+import contextvars
+import io
+import logging
+import threading
+import time
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from typing import Optional, Tuple
+
+from src.Imagecaption.components.image_encoding import encode_for_model
+from src.Imagecaption.entity.config_entity import EncodingProfile
+from src.Imagecaption.utils.metrics import metrics
+from src.Imagecaption.utils.resilience import time_remaining
+
+logger = logging.getLogger(__name__)
+
+# Shared by every policy so hedged and timed-out calls never block the request thread
+_hedge_executor = ThreadPoolExecutor(max_workers=16, thread_name_prefix="caption-backend")
+
+
+def _submit(fn, *args):
+    # Runs in a copy of the caller's context so its request deadline reaches the backend
+    return _hedge_executor.submit(contextvars.copy_context().run, fn, *args)
+
+
+class CaptionBackend(ABC):
+    name = "base"
+
+    @abstractmethod
+    def caption(self, image_bytes: bytes, mime_type: str = "image/jpeg", image_url: Optional[str] = None) -> str:
+        # image_url: where the provider can fetch the same image; backends that cannot use it ignore it
+        raise NotImplementedError
+
+    async def acaption(self, image_bytes: bytes, mime_type: str = "image/jpeg", image_url: Optional[str] = None) -> str:
+        return await asyncio.to_thread(self.caption, image_bytes, mime_type, image_url)
+
+
+class TogetherBackend(CaptionBackend):
+    name = "together"
+
+    def __init__(self, client, model_name: str, prompt: str, timeout: Optional[float] = None, async_client=None,
+                 max_tokens: Optional[int] = None, encoding: Optional[EncodingProfile] = None):
+        self.client = client
+        self.async_client = async_client
+        self.model_name = model_name
+        self.prompt = prompt
+        self.timeout = timeout
+        self.max_tokens = max_tokens
+        self.encoding = encoding
+
+    def image_reference(self, image_bytes: bytes, mime_type: str = "image/jpeg", image_url: Optional[str] = None) -> str:
+        if image_url:
+            # The provider downloads the image itself; the request carries only the URL
+            metrics.incr("caption_image_urls_total", backend=self.name)
+            metrics.incr("caption_request_bytes_total", len(image_url), backend=self.name)
+            return image_url
+        with metrics.span("captioning.encode"):
+            if self.encoding is not None:
+                encoded = encode_for_model(image_bytes, mime_type, self.encoding)
+                image_bytes, mime_type = encoded.data, encoded.mime_type
+            base64_image = base64.b64encode(image_bytes).decode('utf-8')
+        metrics.incr("caption_request_bytes_total", len(base64_image), backend=self.name)
+        return f"data:{mime_type};base64,{base64_image}"
+
+    def build_messages(self, image_bytes: bytes, mime_type: str = "image/jpeg", image_url: Optional[str] = None) -> list:
+        return [
+            {
+                "role": "user",
+                "content": [
+                    {"type": "text", "text": self.prompt},
+                    {
+                        "type": "image_url",
+                        "image_url": {
+                            "url": self.image_reference(image_bytes, mime_type, image_url)
+                        },
+                    },
+                ],
+            }
+        ]
+
+    def request_kwargs(self, messages: list) -> dict:
+        kwargs = {"model": self.model_name, "messages": messages, "timeout": self.timeout}
+        if self.max_tokens:
+            kwargs["max_tokens"] = self.max_tokens
+        return kwargs
+
+    def caption(self, image_bytes: bytes, mime_type: str = "image/jpeg", image_url: Optional[str] = None) -> str:
+        messages = self.build_messages(image_bytes, mime_type, image_url)
+        with metrics.span("captioning.remote", backend=self.name):
+            response = self.client.chat.completions.create(**self.request_kwargs(messages))
+        metrics.record_token_usage(response, stage="captioning")
+        return response.choices[0].message.content.strip()
+
+    async def acaption(self, image_bytes: bytes, mime_type: str = "image/jpeg", image_url: Optional[str] = None) -> str:
+        if self.async_client is None:
+            return await super().acaption(image_bytes, mime_type, image_url)
+        messages = await asyncio.to_thread(self.build_messages, image_bytes, mime_type, image_url)
+        with metrics.span("captioning.remote", backend=self.name):
+            response = await self.async_client.chat.completions.create(**self.request_kwargs(messages))
+        metrics.record_token_usage(response, stage="captioning")
+        return response.choices[0].message.content.strip()
+
+
+class MockServerBackend(TogetherBackend):
+    """Together-compatible backend pointed at a local mock server (see benchmarks)."""
+
+    name = "mock"
+
+    def __init__(self, base_url: str, model_name: str, prompt: str, timeout: Optional[float] = None,
+                 max_tokens: Optional[int] = None, encoding: Optional[EncodingProfile] = None):
+        from together import Together, AsyncTogether
+        super().__init__(
+            Together(api_key="mock", base_url=base_url),
+            model_name,
+            prompt,
+            timeout=timeout,
+            async_client=AsyncTogether(api_key="mock", base_url=base_url),
+            max_tokens=max_tokens,
+            encoding=encoding
+        )
+
+
+class Florence2Backend(CaptionBackend):
+    name = "florence2"
+
+    def __init__(self, engine):
+        self.engine = engine
+
+    def caption(self, image_bytes: bytes, mime_type: str = "image/jpeg", image_url: Optional[str] = None) -> str:
+        from PIL import Image
+
+        with metrics.span("captioning.local"):
+            with Image.open(io.BytesIO(image_bytes)) as image:
+                image = image.convert("RGB")
+            # Goes through the shared micro-batching queue
+            return self.engine.submit(image).result()
+
+
+class CircuitBreaker:
+    """Skips a backend after repeated failures until ``reset_seconds`` have passed.
+
+    After the cool-down one trial call is let through (half-open); its outcome
+    closes the breaker again or re-opens it.
+    """
+
+    def __init__(self, failure_threshold: int = 5, reset_seconds: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_seconds:
+            return "half_open"
+        return "open"
+
+    def allow(self) -> bool:
+        with self._lock:
+            state = self.state
+            if state == "closed":
+                return True
+            if state == "half_open" and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return True
+            return False
+
+    def release_trial(self):
+        # The trial call was cancelled before it said anything about the backend's health
+        with self._lock:
+            self._trial_in_flight = False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._trial_in_flight = False
+            if self.opened_at is not None or self.failures >= self.failure_threshold:
+                if self.opened_at is None:
+                    metrics.incr("circuit_open_total")
+                    logger.warning(f"Circuit opened after {self.failures} consecutive failures")
+                self.opened_at = time.monotonic()
+
+
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+
+def get_circuit_breaker(name: str, failure_threshold: int = 5, reset_seconds: float = 30.0) -> CircuitBreaker:
+    # One breaker per backend per process, so every component sees the same provider health
+    with _breakers_lock:
+        breaker = _breakers.get(name)
+        if breaker is None:
+            breaker = CircuitBreaker(failure_threshold, reset_seconds)
+            _breakers[name] = breaker
+    return breaker
+
+
+class CaptionPolicy:
+    """Timeout, hedging and circuit breaking around a primary and fallback backend.
+
+    The primary is skipped while its breaker is open. Otherwise, if it has not
+    answered within ``hedge_after_ms`` the fallback is started as well and the
+    first successful answer wins; ``hedge_after_ms <= 0`` disables hedging so
+    the fallback only runs after the primary fails or times out.
+    """
+
+    def __init__(self, primary: CaptionBackend, fallback: Optional[CaptionBackend] = None,
+                 timeout: float = 30.0, hedge_after_ms: float = 0.0, breaker: Optional[CircuitBreaker] = None):
+        self.primary = primary
+        self.fallback = fallback
+        self.timeout = timeout
+        self.hedge_after = hedge_after_ms / 1000.0 if hedge_after_ms and hedge_after_ms > 0 else None
+        self.breaker = breaker or CircuitBreaker()
+
+    def _record_outcome(self, future):
+        # Works for thread futures and asyncio tasks; a primary cancelled because
+        # the hedge won is slow, not failing, but a cancelled half-open trial must
+        # free the slot so the next call can try again
+        if future.cancelled():
+            self.breaker.release_trial()
+            return
+        if future.exception() is not None:
+            self.breaker.record_failure()
+        else:
+            self.breaker.record_success()
+
+    def _track(self, future):
+        future.add_done_callback(self._record_outcome)
+        return future
+
+    def try_primary(self, image_bytes: bytes, mime_type: str = "image/jpeg", image_url: Optional[str] = None) -> Optional[str]:
+        # Primary only, no fallback: used by batch callers that fall back in bulk
+        if not self.breaker.allow():
+            return None
+        future = self._track(_submit(self.primary.caption, image_bytes, mime_type, image_url))
+        try:
+            return future.result(timeout=time_remaining(self.timeout))
+        except Exception as e:
+            logger.warning(f"{self.primary.name} caption backend failed ({e})")
+            return None
+
+    def caption(self, image_bytes: bytes, mime_type: str = "image/jpeg", image_url: Optional[str] = None) -> Tuple[str, str]:
+        if not self.breaker.allow():
+            logger.info(f"{self.primary.name} circuit open, using {self._fallback_name()}")
+            metrics.incr("caption_circuit_skips_total", backend=self.primary.name)
+            return self._run_fallback(image_bytes, mime_type)
+
+        primary = self._track(_submit(self.primary.caption, image_bytes, mime_type, image_url))
+        timeout = time_remaining(self.timeout)
+        deadline = time.monotonic() + timeout
+
+        wait([primary], timeout=self.hedge_after if self.hedge_after is not None else timeout)
+        if primary.done() and primary.exception() is None:
+            return primary.result(), self.primary.name
+        if self.fallback is None:
+            return self._result_by(primary, deadline, self.primary.name, timeout), self.primary.name
+
+        if not primary.done() and self.hedge_after is not None:
+            # Hedge: race the fallback against the still-running primary
+            logger.info(f"{self.primary.name} slower than {self.hedge_after * 1000:.0f} ms, hedging with {self.fallback.name}")
+            metrics.incr("caption_hedges_total", backend=self.fallback.name)
+            hedge = _submit(self.fallback.caption, image_bytes, mime_type)
+            pending = {primary, hedge}
+            while pending:
+                done, pending = wait(pending, timeout=max(0.0, deadline - time.monotonic()), return_when=FIRST_COMPLETED)
+                if not done:
+                    break
+                for future in done:
+                    if future.exception() is None:
+                        winner = self.primary.name if future is primary else self.fallback.name
+                        return future.result(), winner
+            # Primary failed or timed out; the hedge is the fallback
+            if primary.done():
+                logger.warning(f"{self.primary.name} caption backend failed ({primary.exception()}), "
+                               f"waiting for {self.fallback.name}")
+            return self._result_by(hedge, deadline, self.fallback.name, timeout), self.fallback.name
+
+        if primary.done():
+            logger.warning(f"{self.primary.name} caption backend failed ({primary.exception()}), using {self.fallback.name}")
+        else:
+            logger.warning(f"{self.primary.name} caption backend timed out after {timeout:.1f}s, using {self.fallback.name}")
+        return self._run_fallback(image_bytes, mime_type)
+
+    async def acaption(self, image_bytes: bytes, mime_type: str = "image/jpeg", image_url: Optional[str] = None) -> Tuple[str, str]:
+        if not self.breaker.allow():
+            logger.info(f"{self.primary.name} circuit open, using {self._fallback_name()}")
+            metrics.incr("caption_circuit_skips_total", backend=self.primary.name)
+            if self.fallback is None:
+                raise RuntimeError(f"{self.primary.name} circuit open and no fallback configured")
+            return await self.fallback.acaption(image_bytes, mime_type), self.fallback.name
+
+        primary = asyncio.ensure_future(self.primary.acaption(image_bytes, mime_type, image_url))
+        primary.add_done_callback(self._record_outcome)
+        loop = asyncio.get_running_loop()
+        timeout = time_remaining(self.timeout)
+        deadline = loop.time() + timeout
+
+        await asyncio.wait({primary}, timeout=self.hedge_after if self.hedge_after is not None else timeout)
+        if primary.done() and primary.exception() is None:
+            return primary.result(), self.primary.name
+        if self.fallback is None:
+            return await asyncio.wait_for(primary, max(0.0, deadline - loop.time())), self.primary.name
+
+        tasks = {primary}
+        hedge = asyncio.ensure_future(self.fallback.acaption(image_bytes, mime_type))
+        tasks.add(hedge)
+        try:
+            while tasks:
+                done, tasks = await asyncio.wait(tasks, timeout=max(0.0, deadline - loop.time()), return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    break
+                for task in done:
+                    if task.exception() is None:
+                        winner = self.primary.name if task is primary else self.fallback.name
+                        return task.result(), winner
+            return await hedge, self.fallback.name
+        finally:
+            if not primary.done():
+                primary.cancel()
+
+    @staticmethod
+    def _result_by(future, deadline: float, backend_name: str, timeout: float) -> str:
+        # Never waits past the deadline, so a hung backend cannot hold the caller
+        try:
+            return future.result(timeout=max(0.0, deadline - time.monotonic()))
+        except FutureTimeoutError:
+            raise TimeoutError(f"{backend_name} caption backend timed out after {timeout:.1f}s") from None
+
+    def _fallback_name(self) -> str:
+        return self.fallback.name if self.fallback is not None else "no fallback"
+
+    def _run_fallback(self, image_bytes: bytes, mime_type: str) -> Tuple[str, str]:
+        if self.fallback is None:
+            raise RuntimeError(f"{self.primary.name} unavailable and no fallback configured")
+        metrics.incr("caption_fallbacks_total", backend=self.fallback.name)
+        return self.fallback.caption(image_bytes, mime_type), self.fallback.name
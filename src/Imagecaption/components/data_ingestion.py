@@ -1,34 +1,142 @@
 from pathlib import Path
-import shutil
+from dataclasses import dataclass
+from concurrent.futures import ThreadPoolExecutor, Future
+from typing import Optional
+import logging
 from src.Imagecaption.entity.config_entity import DataIngestionConfig
+from src.Imagecaption.components.preprocessing import OUTPUT_FORMATS, get_preprocessing_service
 from src.Imagecaption.utils.common import (
     create_directories,
-    is_allowed_file,
-    validate_image,
-    resize_image
+    is_allowed_file
 )
-import os
+from src.Imagecaption.utils.artifacts import ArtifactStore
+from src.Imagecaption.utils.metrics import metrics
+from src.Imagecaption.utils.near_duplicates import NearDuplicateIndex
+
+logger = logging.getLogger(__name__)
+
+# Disk writes for in-memory ingestion happen off the request thread
+_persist_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="ingest-persist")
+
+
+@dataclass
+class IngestedImage:
+    name: str
+    data: bytes
+    width: int
+    height: int
+    mime_type: str = "image/jpeg"
+    request_id: str = ""
+    path: Optional[Path] = None
+    persist_future: Optional[Future] = None
+    phash: Optional[int] = None
+
+    @property
+    def stem(self) -> str:
+        return Path(self.name).stem
+
 
 class DataIngestion:
-    def __init__(self, config: DataIngestionConfig):
+    def __init__(self, config: DataIngestionConfig, store: Optional[ArtifactStore] = None,
+                 hash_index: Optional[NearDuplicateIndex] = None):
         self.config = config
+        self.hash_index = hash_index
         create_directories([config.raw_data_dir, config.ingested_data_dir])
+        self.store = store or ArtifactStore({"raw": config.raw_data_dir, "ingested": config.ingested_data_dir})
+        self.preprocessor = get_preprocessing_service(
+            mode=config.preprocess_mode,
+            workers=config.preprocess_workers,
+            max_pending=config.preprocess_max_pending,
+            submit_timeout=config.preprocess_submit_timeout
+        )
+
+    def ingested_path(self, request_id: str, filename: str) -> Path:
+        # WebP output gets its own extension; JPEG keeps the upload's extension as before
+        if self.config.output_format.upper() == "WEBP":
+            ext = OUTPUT_FORMATS["WEBP"][1]
+        else:
+            ext = Path(filename).suffix
+        return self.store.path("ingested", request_id, ext)
+
+    def preprocess(self, data, filename: str):
+        try:
+            return self.preprocessor.process(
+                data,
+                self.config.resize_shape,
+                preset=self.config.resample_preset,
+                output_format=self.config.output_format,
+                quality=self.config.output_quality,
+                hash_kind=self.hash_index.hash_kind if self.hash_index is not None else None
+            )
+        except ValueError as e:
+            logger.error(f"Image decode failed for {filename}: {e}")
+            raise ValueError("Uploaded file is not a valid image.") from e
+
+    def ingest(self, file_path: Path, max_file_size: Optional[int] = None) -> Path:
+        with metrics.span("ingestion"):
+            return self._ingest(file_path, max_file_size or self.config.max_file_size)
 
-    def ingest(self, file_path: Path) -> Path:
+    def _ingest(self, file_path: Path, max_file_size: int) -> Path:
         # Check extension
         if not is_allowed_file(file_path.name, self.config.allowed_extensions):
             raise ValueError(f"File type not supported: {file_path.suffix}")
 
         # File size check
-        if file_path.stat().st_size > self.config.max_file_size:
+        if file_path.stat().st_size > max_file_size:
             raise ValueError(f"File size exceeds limit: {file_path.stat().st_size}")
 
-        # Validate image
-        if not validate_image(file_path):
-            raise ValueError("Uploaded file is not a valid image.")
-
-        # Resize and save to ingested_data_dir
-        resized_path = resize_image(file_path, self.config.resize_shape)
-        final_path = self.config.ingested_data_dir / resized_path.name
-        resized_path.rename(final_path)
+        # Validate, resize and encode in the preprocessing pool, then save to ingested_data_dir;
+        # the pool opens the file itself, so it is never held in memory here
+        processed = self.preprocess(str(file_path), file_path.name)
+        request_id = self.store.new_request_id(file_path.name)
+        final_path = self.ingested_path(request_id, file_path.name)
+        self._record_hash(request_id, processed.phash)
+        self._persist(final_path, processed.data)
         return final_path
+
+    def ingest_bytes(self, data, filename: str) -> IngestedImage:
+        with metrics.span("ingestion"):
+            return self._ingest_bytes(data, filename)
+
+    def _ingest_bytes(self, data, filename: str) -> IngestedImage:
+        data = bytes(data)
+        if not is_allowed_file(filename, self.config.allowed_extensions):
+            raise ValueError(f"File type not supported: {Path(filename).suffix}")
+
+        if len(data) > self.config.max_file_size:
+            raise ValueError(f"File size exceeds limit: {len(data)}")
+
+        # One decode does validation, orientation and resize
+        processed = self.preprocess(data, filename)
+        request_id = self.store.new_request_id(filename)
+        path = self.ingested_path(request_id, filename)
+        ingested = IngestedImage(
+            name=path.name,
+            data=processed.data,
+            width=processed.width,
+            height=processed.height,
+            mime_type=processed.mime_type,
+            request_id=request_id,
+            phash=processed.phash
+        )
+        self._record_hash(request_id, processed.phash)
+        logger.info(f"Ingested {filename} in memory ({len(data)} -> {len(ingested.data)} bytes)")
+
+        if self.config.persist_ingested:
+            ingested.path = path
+            ingested.persist_future = _persist_executor.submit(self._persist, ingested.path, ingested.data)
+        return ingested
+
+    def _record_hash(self, request_id: str, value_hash: Optional[int]):
+        # Looked up by request ID at captioning time, which may run in another process
+        if self.hash_index is not None and value_hash is not None:
+            try:
+                self.hash_index.record_hash(request_id, value_hash)
+            except Exception as e:
+                logger.warning(f"Could not record perceptual hash for {request_id}: {e}")
+
+    def _persist(self, path: Path, data: bytes) -> Path:
+        self.store.write_bytes(path, data)
+        metrics.incr("ingested_bytes_written_total", len(data))
+        logger.info(f"Ingested image persisted at: {path}")
+        return path
@@ -1,100 +1,203 @@
 from pathlib import Path
+from typing import List, Optional, Tuple
+import asyncio
+import io
 import logging
-import base64
-import os
-import streamlit as st
-from together import Together
+from src.Imagecaption.components.local_model import get_batch_engine
+from src.Imagecaption.components.caption_backends import (
+    TogetherBackend,
+    MockServerBackend,
+    Florence2Backend,
+    CaptionPolicy,
+    get_circuit_breaker
+)
+from src.Imagecaption.utils.artifacts import ArtifactStore
+from src.Imagecaption.utils.common import get_secret, sniff_image_mime
+from src.Imagecaption.utils.metrics import metrics
 
 logger = logging.getLogger(__name__)
 
+CAPTION_PROMPT = "Describe this image in 2-3 vivid sentences. Focus on the setting, mood, characters or objects present, and any emotions the scene conveys. Make it suitable for inspiring a short creative story."
+
 class ImageCaptioning:
-    def __init__(self, config):
+    def __init__(self, config, client=None, async_client=None, store=None):
         self.config = config
         self.config.captions_dir.mkdir(parents=True, exist_ok=True)
-        
-        # Robust API key retrieval (Streamlit secrets + local env fallback)
-        try:
-            api_key = st.secrets["TOGETHER_API_KEY"]
-        except Exception:
-            api_key = os.getenv("TOGETHER_API_KEY", "")
-            
-        self.client = Together(api_key=api_key)
-
-    def caption_image(self, image_path: Path) -> str:
-        logger.info("Attempting to generate caption using Together.ai vision model...")
-        
-        try:
-            with open(image_path, "rb") as image_file:
-                base64_image = base64.b64encode(image_file.read()).decode('utf-8')
-                
-            prompt = "Describe this image in 2-3 vivid sentences. Focus on the setting, mood, characters or objects present, and any emotions the scene conveys. Make it suitable for inspiring a short creative story."
-            
-            response = self.client.chat.completions.create(
-                model="meta-llama/Llama-3.2-11B-Vision-Instruct-Turbo",
-                messages=[
-                    {
-                        "role": "user",
-                        "content": [
-                            {"type": "text", "text": prompt},
-                            {
-                                "type": "image_url",
-                                "image_url": {
-                                    "url": f"data:image/jpeg;base64,{base64_image}"
-                                },
-                            },
-                        ],
-                    }
-                ],
+        self.store = store or ArtifactStore({"caption": config.captions_dir})
+        self.model_name = config.florence2_model_name
+        self.prompt = CAPTION_PROMPT
+
+        # Shared clients come from the application context; standalone use builds its own
+        self.api_key = get_secret("TOGETHER_API_KEY")
+        self._client = client
+        self._async_client = async_client
+        self._policy = None
+
+    @property
+    def client(self):
+        # The SDK is imported on first use so importing this module stays cheap
+        if self._client is None:
+            from together import Together
+            self._client = Together(api_key=self.api_key)
+        return self._client
+
+    @property
+    def local_engine(self):
+        return get_batch_engine(
+            model_name=self.config.local_model_name,
+            revision=self.config.revision_id,
+            task_prompt=self.config.task_prompt,
+            max_new_tokens=self.config.max_new_tokens,
+            num_beams=self.config.num_beams,
+            batch_size=self.config.batch_size,
+            batch_wait_ms=self.config.batch_wait_ms,
+            engine=self.config.inference_engine,
+            num_threads=self.config.num_threads,
+            onnx_dir=str(self.config.onnx_dir)
+        )
+
+    @property
+    def policy(self) -> CaptionPolicy:
+        if self._policy is None:
+            self._policy = self._build_policy()
+        return self._policy
+
+    def _build_policy(self) -> CaptionPolicy:
+        config = self.config
+        if config.remote_backend == "mock":
+            primary = MockServerBackend(
+                config.mock_base_url,
+                self.model_name,
+                self.prompt,
+                timeout=config.request_timeout,
+                max_tokens=config.remote_max_tokens,
+                encoding=config.encoding
             )
-            caption = response.choices[0].message.content.strip()
-            logger.info("Together.ai vision model captioning succeeded!")
-            
-        except Exception as api_err:
-            logger.warning(f"Together.ai vision model failed or not available ({api_err}). Falling back to local Florence-2 model...")
-            
-            # Local Florence-2 fallback loading and inference
-            import torch
-            from transformers import AutoProcessor, AutoModelForCausalLM
-            from PIL import Image
-            
-            device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
-            logger.info(f"Loading local Florence-2 model on {device}...")
-            
-            processor = AutoProcessor.from_pretrained("microsoft/Florence-2-base-ft", trust_remote_code=True, revision="main")
-            torch_dtype = torch.float16 if device.type != "cpu" else torch.float32
-            model = AutoModelForCausalLM.from_pretrained(
-                "microsoft/Florence-2-base-ft", 
-                trust_remote_code=True, 
-                torch_dtype=torch_dtype, 
-                revision="main"
-            ).to(device).eval()
-            
-            image = Image.open(image_path)
-            inputs = processor(text="<MORE_DETAILED_CAPTION>", images=image, return_tensors="pt")
-            inputs = {k: v.to(device) if hasattr(v, 'to') else v for k, v in inputs.items()}
-            
-            with torch.no_grad():
-                generated_ids = model.generate(
-                    input_ids=inputs["input_ids"],
-                    pixel_values=inputs["pixel_values"],
-                    max_new_tokens=64,
-                    num_beams=3,
-                    early_stopping=True,
-                    do_sample=False
-                )
-            generated_text = processor.batch_decode(generated_ids, skip_special_tokens=False)[0]
-            parsed_answer = processor.post_process_generation(
-                generated_text,
-                task="<MORE_DETAILED_CAPTION>",
-                image_size=(image.width, image.height)
+        elif config.remote_backend == "together":
+            primary = TogetherBackend(
+                self.client,
+                self.model_name,
+                self.prompt,
+                timeout=config.request_timeout,
+                async_client=self._async_client,
+                max_tokens=config.remote_max_tokens,
+                encoding=config.encoding
             )
-            caption = parsed_answer.get("<MORE_DETAILED_CAPTION>", "").strip()
-            logger.info("Local Florence-2 fallback captioning succeeded!")
-
-        # Save caption to captions_dir
-        caption_file = self.config.captions_dir / f"{image_path.stem}_caption.txt"
-        with open(caption_file, "w", encoding="utf-8") as f:
-            f.write(caption)
-            
+        else:
+            raise ValueError(f"Unknown caption backend: {config.remote_backend}")
+
+        return CaptionPolicy(
+            primary=primary,
+            fallback=Florence2Backend(self.local_engine) if config.local_fallback else None,
+            timeout=config.request_timeout,
+            hedge_after_ms=config.hedge_after_ms,
+            breaker=get_circuit_breaker(
+                f"{primary.name}:{self.model_name}",
+                config.breaker_failure_threshold,
+                config.breaker_reset_seconds
+            )
+        )
+
+    def image_url(self, image_path) -> Optional[str]:
+        # Ingested images are served from image_url_base; anything else is sent inline
+        if not self.config.image_url_base or image_path is None:
+            return None
+        try:
+            relative = Path(image_path).resolve().relative_to(self.config.ingested_data_dir.resolve())
+        except ValueError:
+            return None
+        return f"{self.config.image_url_base.rstrip('/')}/{relative.as_posix()}"
+
+    def is_primary(self, backend: str) -> bool:
+        # Only the configured remote model's captions are cached and shared; fallback ones are not
+        return backend == self.policy.primary.name
+
+    def caption_image(self, image_path: Path) -> Tuple[str, str]:
+        with open(image_path, "rb") as image_file:
+            image_bytes = image_file.read()
+
+        with metrics.span("captioning"):
+            caption, backend = self.policy.caption(image_bytes, sniff_image_mime(image_bytes), self.image_url(image_path))
+        metrics.incr("captions_total", backend=backend)
+        logger.info(f"Captioning succeeded with {backend} backend")
+
+        self.save_caption(image_path, caption)
+        return caption, backend
+
+    def caption_ingested(self, ingested) -> Tuple[str, str]:
+        # In-memory variant: the encoded buffer from DataIngestion.ingest_bytes is sent as-is
+        image_url = self.image_url(ingested.path)
+        if image_url and ingested.persist_future is not None:
+            # The provider fetches the file, so it has to be on disk first
+            ingested.persist_future.result()
+        with metrics.span("captioning"):
+            caption, backend = self.policy.caption(ingested.data, ingested.mime_type, image_url)
+        metrics.incr("captions_total", backend=backend)
+        logger.info(f"Captioning succeeded with {backend} backend")
+
+        self.save_caption(Path(ingested.name), caption)
+        return caption, backend
+
+    async def acaption_image(self, image_path: Path) -> Tuple[str, str]:
+        image_bytes = await asyncio.to_thread(Path(image_path).read_bytes)
+
+        with metrics.span("captioning"):
+            caption, backend = await self.policy.acaption(image_bytes, sniff_image_mime(image_bytes), self.image_url(image_path))
+        metrics.incr("captions_total", backend=backend)
+        logger.info(f"Captioning succeeded with {backend} backend")
+
+        self.save_caption(image_path, caption)
+        return caption, backend
+
+    def caption_images(self, image_paths: List[Path]) -> List[str]:
+        captions = [None] * len(image_paths)
+        fallback_indices = []
+
+        for i, image_path in enumerate(image_paths):
+            # Open circuit or failure: no per-image fallback, collected for the local batch below
+            image_bytes = Path(image_path).read_bytes()
+            captions[i] = self.policy.try_primary(image_bytes, sniff_image_mime(image_bytes), self.image_url(image_path))
+            if captions[i] is None:
+                fallback_indices.append(i)
+
+        if fallback_indices:
+            if not self.config.local_fallback:
+                raise RuntimeError(f"Remote captioning failed for {len(fallback_indices)} image(s) and local fallback is disabled")
+            # Images that missed the remote model are captioned locally in padded batches
+            with metrics.span("captioning.local_batch"):
+                local_captions = self._caption_local([image_paths[i] for i in fallback_indices], batched=True)
+            metrics.incr("caption_fallbacks_total", len(fallback_indices), backend="florence2")
+            for i, caption in zip(fallback_indices, local_captions):
+                captions[i] = caption
+            logger.info(f"Local Florence-2 captioned {len(fallback_indices)} image(s) in batches of {self.config.batch_size}")
+
+        for image_path, caption in zip(image_paths, captions):
+            self.save_caption(image_path, caption)
+        return captions
+
+    def _caption_local(self, image_sources: list, batched: bool = False) -> List[str]:
+        from PIL import Image
+
+        images = []
+        for source in image_sources:
+            # Sources are file paths or already-encoded image bytes
+            if isinstance(source, (bytes, bytearray, memoryview)):
+                source = io.BytesIO(source)
+            with Image.open(source) as image:
+                images.append(image.convert("RGB"))
+
+        engine = self.local_engine
+        if batched:
+            return engine.caption(images)
+        # Single requests go through the shared queue so concurrent fallbacks are batched together
+        futures = [engine.submit(image) for image in images]
+        return [future.result() for future in futures]
+
+    def caption_path(self, image_path) -> Path:
+        return self.store.path_for("caption", image_path)
+
+    def save_caption(self, image_path: Path, caption: str) -> Path:
+        caption_file = self.store.write_text(self.caption_path(image_path), caption)
+
         logger.info(f"Caption saved at: {caption_file}")
-        return caption
+        return caption_file
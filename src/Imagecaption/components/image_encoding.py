@@ -0,0 +1,56 @@
+import io
+import time
+from dataclasses import dataclass
+
+from src.Imagecaption.entity.config_entity import EncodingProfile
+
+ENCODING_FORMATS = {"JPEG": "image/jpeg", "WEBP": "image/webp", "PNG": "image/png"}
+
+
+@dataclass
+class EncodedImage:
+    data: bytes
+    mime_type: str
+    width: int
+    height: int
+    source_bytes: int
+    seconds: float = 0.0
+    reencoded: bool = True
+
+
+def encode_for_model(image_bytes: bytes, mime_type: str, profile: EncodingProfile) -> EncodedImage:
+    """Fit an image to what the vision model uses: at most ``max_side`` pixels, in ``format``.
+
+    Vision models tile or downscale large inputs themselves, so pixels beyond
+    their input size only add upload time. Images that already fit and are in
+    the target format (the usual case after ``DataIngestion``) are sent as-is.
+    """
+    from PIL import Image, ImageOps
+
+    output_format = profile.format.upper()
+    if output_format not in ENCODING_FORMATS:
+        raise ValueError(f"Unsupported encoding format: {profile.format}")
+    target_mime = ENCODING_FORMATS[output_format]
+    max_size = (profile.max_side, profile.max_side)
+
+    start = time.perf_counter()
+    with Image.open(io.BytesIO(image_bytes)) as img:
+        # Opening only reads the header, so the pass-through check costs no decode
+        if target_mime == mime_type and max(img.size) <= profile.max_side and img.getexif().get(0x0112, 1) == 1:
+            return EncodedImage(image_bytes, mime_type, img.width, img.height, len(image_bytes),
+                                time.perf_counter() - start, reencoded=False)
+        img.draft("RGB", max_size)
+        img = ImageOps.exif_transpose(img)
+        if img.mode not in ("RGB", "L") and not (output_format == "PNG" and img.mode == "RGBA"):
+            img = img.convert("RGB")
+        img.thumbnail(max_size, Image.Resampling.BICUBIC, reducing_gap=3.0)
+
+    buffer = io.BytesIO()
+    if output_format == "JPEG":
+        img.save(buffer, "JPEG", quality=profile.quality, optimize=True)
+    elif output_format == "WEBP":
+        img.save(buffer, "WEBP", quality=profile.quality, method=4)
+    else:
+        img.save(buffer, "PNG", optimize=True)
+    return EncodedImage(buffer.getvalue(), target_mime, img.width, img.height, len(image_bytes),
+                        time.perf_counter() - start)
@@ -0,0 +1,305 @@
+import logging
+import threading
+from concurrent.futures import Future
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from src.Imagecaption.utils.batching import MicroBatcher
+from src.Imagecaption.utils.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_LOCAL_MODEL = "microsoft/Florence-2-base-ft"
+DEFAULT_ONNX_DIR = "artifacts/onnx"
+
+# eager: float32 (float16 on GPU) as loaded; int8: dynamic quantization of Linear layers (CPU);
+# compiled: torch.compile on the vision tower and language model; onnx: vision encoder in ONNX Runtime
+INFERENCE_ENGINES = ("eager", "int8", "compiled", "onnx")
+
+
+@dataclass
+class LoadedModel:
+    processor: Any
+    model: Any
+    device: Any
+    torch_dtype: Any
+    engine: str = "eager"
+
+
+class Florence2Registry:
+    """Process-wide cache of Florence-2 processors and models.
+
+    Weights are loaded lazily on first use and then shared by every caller in
+    the process, so the local fallback only pays inference time per request.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._models: Dict[Tuple[str, str, str], LoadedModel] = {}
+
+    def get(self, model_name: str = DEFAULT_LOCAL_MODEL, revision: str = "main", engine: str = "eager",
+            num_threads: int = 0, onnx_dir: str = DEFAULT_ONNX_DIR) -> LoadedModel:
+        key = (model_name, revision, engine)
+        loaded = self._models.get(key)
+        if loaded is not None:
+            return loaded
+
+        # Double-checked so concurrent fallbacks during an outage load only once
+        with self._lock:
+            loaded = self._models.get(key)
+            if loaded is None:
+                with metrics.span("captioning.model_load", engine=engine):
+                    loaded = self._load(model_name, revision, engine, num_threads, onnx_dir)
+                self._models[key] = loaded
+        return loaded
+
+    def warm_up(self, model_name: str = DEFAULT_LOCAL_MODEL, revision: str = "main", engine: str = "eager",
+                num_threads: int = 0, onnx_dir: str = DEFAULT_ONNX_DIR) -> LoadedModel:
+        logger.info(f"Warming up local model {model_name}@{revision} ({engine})")
+        return self.get(model_name, revision, engine, num_threads, onnx_dir)
+
+    def is_loaded(self, model_name: str = DEFAULT_LOCAL_MODEL, revision: str = "main", engine: str = "eager") -> bool:
+        return (model_name, revision, engine) in self._models
+
+    def evict(self, model_name: Optional[str] = None, revision: Optional[str] = None) -> int:
+        with self._lock:
+            keys = [
+                key for key in self._models
+                if (model_name is None or key[0] == model_name)
+                and (revision is None or key[1] == revision)
+            ]
+            for key in keys:
+                del self._models[key]
+
+        if keys:
+            self._release_device_memory()
+            logger.info(f"Evicted {len(keys)} local model(s) from registry")
+        return len(keys)
+
+    def reload(self, model_name: str = DEFAULT_LOCAL_MODEL, revision: str = "main", engine: str = "eager",
+               num_threads: int = 0, onnx_dir: str = DEFAULT_ONNX_DIR) -> LoadedModel:
+        self.evict(model_name, revision)
+        return self.get(model_name, revision, engine, num_threads, onnx_dir)
+
+    @classmethod
+    def _load(cls, model_name: str, revision: str, engine: str = "eager", num_threads: int = 0,
+              onnx_dir: str = DEFAULT_ONNX_DIR) -> LoadedModel:
+        import torch
+        from transformers import AutoProcessor, AutoModelForCausalLM
+
+        if engine not in INFERENCE_ENGINES:
+            raise ValueError(f"Unknown local inference engine: {engine} (expected one of {INFERENCE_ENGINES})")
+
+        if num_threads and num_threads > 0:
+            # Process-wide; on shared CPU nodes fewer intra-op threads usually beats oversubscription
+            torch.set_num_threads(int(num_threads))
+
+        device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+        if device.type != "cpu" and engine in ("int8", "onnx"):
+            logger.warning(f"Engine {engine} is CPU-only; using eager on {device}")
+            engine = "eager"
+        logger.info(f"Loading local model {model_name}@{revision} on {device} "
+                    f"(engine={engine}, threads={torch.get_num_threads()})...")
+
+        processor = AutoProcessor.from_pretrained(model_name, trust_remote_code=True, revision=revision)
+        torch_dtype = torch.float16 if device.type != "cpu" else torch.float32
+        model = AutoModelForCausalLM.from_pretrained(
+            model_name,
+            trust_remote_code=True,
+            torch_dtype=torch_dtype,
+            revision=revision
+        ).to(device).eval()
+
+        if engine == "int8":
+            model = torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+        elif engine == "compiled":
+            cls._compile(model)
+        elif engine == "onnx":
+            cls._attach_onnx_vision_encoder(model, model_name, revision, Path(onnx_dir))
+
+        logger.info(f"Local model {model_name} loaded")
+        return LoadedModel(processor=processor, model=model, device=device, torch_dtype=torch_dtype, engine=engine)
+
+    @staticmethod
+    def _compile(model):
+        import torch
+
+        # generate() lives on the wrapper, so compile the submodules it calls into
+        for name in ("vision_tower", "language_model"):
+            module = getattr(model, name, None)
+            if module is not None:
+                module.forward = torch.compile(module.forward, dynamic=True)
+
+    @staticmethod
+    def _attach_onnx_vision_encoder(model, model_name: str, revision: str, onnx_dir: Path):
+        import numpy as np
+        import onnxruntime as ort
+        import torch
+
+        # Florence-2's decoder loop does not export cleanly, so only the image encoder
+        # (DaViT + projection, the per-image cost) runs in ONNX Runtime
+        onnx_path = onnx_dir / f"{model_name.replace('/', '__')}@{revision}_vision.onnx"
+        if not onnx_path.exists():
+            onnx_dir.mkdir(parents=True, exist_ok=True)
+
+            class _VisionEncoder(torch.nn.Module):
+                def __init__(self, wrapped):
+                    super().__init__()
+                    self.wrapped = wrapped
+
+                def forward(self, pixel_values):
+                    return self.wrapped._encode_image(pixel_values)
+
+            logger.info(f"Exporting vision encoder to {onnx_path}")
+            tmp_path = onnx_path.with_name(f".{onnx_path.name}.tmp")
+            with torch.inference_mode():
+                torch.onnx.export(
+                    _VisionEncoder(model),
+                    (torch.zeros(1, 3, 768, 768),),
+                    str(tmp_path),
+                    input_names=["pixel_values"],
+                    output_names=["image_features"],
+                    dynamic_axes={"pixel_values": {0: "batch"}, "image_features": {0: "batch"}},
+                    opset_version=17
+                )
+            tmp_path.replace(onnx_path)
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        options.intra_op_num_threads = torch.get_num_threads()
+        session = ort.InferenceSession(str(onnx_path), options, providers=["CPUExecutionProvider"])
+
+        def encode_image(pixel_values):
+            features = session.run(None, {"pixel_values": pixel_values.detach().cpu().numpy().astype(np.float32)})[0]
+            return torch.from_numpy(features)
+
+        model._encode_image = encode_image
+
+    @staticmethod
+    def _release_device_memory():
+        import gc
+        gc.collect()
+        try:
+            import torch
+            if torch.cuda.is_available():
+                torch.cuda.empty_cache()
+        except ImportError:
+            pass
+
+
+florence2_registry = Florence2Registry()
+
+
+class Florence2BatchEngine:
+    """Runs Florence-2 captioning on padded batches of images.
+
+    ``caption_batch`` captions a list of images directly, while ``submit``
+    routes single images through a micro-batching queue so concurrent
+    fallback requests share one ``generate`` call.
+    """
+
+    def __init__(self, model_name: str = DEFAULT_LOCAL_MODEL, revision: str = "main",
+                 task_prompt: str = "<MORE_DETAILED_CAPTION>", max_new_tokens: int = 64,
+                 num_beams: int = 3, batch_size: int = 8, batch_wait_ms: float = 20.0,
+                 engine: str = "eager", num_threads: int = 0, onnx_dir: str = DEFAULT_ONNX_DIR,
+                 registry: Optional[Florence2Registry] = None):
+        self.model_name = model_name
+        self.revision = revision
+        self.task_prompt = task_prompt
+        self.max_new_tokens = max_new_tokens
+        self.num_beams = num_beams
+        self.batch_size = max(1, int(batch_size))
+        self.engine = engine
+        self.num_threads = num_threads
+        self.onnx_dir = onnx_dir
+        self.registry = registry or florence2_registry
+        self._batcher = MicroBatcher(
+            self.caption_batch,
+            max_batch_size=self.batch_size,
+            max_wait_ms=batch_wait_ms,
+            name=f"florence2-batcher-{model_name}"
+        )
+
+    def submit(self, image) -> Future:
+        return self._batcher.submit(image)
+
+    def caption(self, images: List[Any]) -> List[str]:
+        captions: List[str] = []
+        for start in range(0, len(images), self.batch_size):
+            captions.extend(self.caption_batch(images[start:start + self.batch_size]))
+        return captions
+
+    def caption_batch(self, images: List[Any]) -> List[str]:
+        import torch
+
+        if not images:
+            return []
+
+        loaded = self.registry.get(self.model_name, self.revision, self.engine, self.num_threads, self.onnx_dir)
+        processor, model, device = loaded.processor, loaded.model, loaded.device
+        images = [image if image.mode == "RGB" else image.convert("RGB") for image in images]
+
+        inputs = processor(
+            text=[self.task_prompt] * len(images),
+            images=images,
+            return_tensors="pt",
+            padding=True
+        )
+        inputs = {k: v.to(device) if hasattr(v, 'to') else v for k, v in inputs.items()}
+
+        metrics.observe("local_batch_size", len(images))
+        # inference_mode also skips version-counter bookkeeping that no_grad still pays for
+        with metrics.span("captioning.local_generate", engine=loaded.engine), torch.inference_mode():
+            generated_ids = model.generate(
+                input_ids=inputs["input_ids"],
+                pixel_values=inputs["pixel_values"].to(loaded.torch_dtype),
+                max_new_tokens=self.max_new_tokens,
+                num_beams=self.num_beams,
+                early_stopping=True,
+                do_sample=False
+            )
+
+        generated_texts = processor.batch_decode(generated_ids, skip_special_tokens=False)
+        captions = []
+        for text, image in zip(generated_texts, images):
+            parsed_answer = processor.post_process_generation(
+                text,
+                task=self.task_prompt,
+                image_size=(image.width, image.height)
+            )
+            captions.append(parsed_answer.get(self.task_prompt, "").strip())
+
+        logger.info(f"Local model captioned batch of {len(images)} image(s)")
+        return captions
+
+
+_engines: Dict[tuple, Florence2BatchEngine] = {}
+_engines_lock = threading.Lock()
+
+
+def get_batch_engine(model_name: str = DEFAULT_LOCAL_MODEL, revision: str = "main",
+                     task_prompt: str = "<MORE_DETAILED_CAPTION>", max_new_tokens: int = 64,
+                     num_beams: int = 3, batch_size: int = 8, batch_wait_ms: float = 20.0,
+                     engine: str = "eager", num_threads: int = 0,
+                     onnx_dir: str = DEFAULT_ONNX_DIR) -> Florence2BatchEngine:
+    # One engine (and queue) per model/generation setting, shared process-wide
+    key = (model_name, revision, task_prompt, max_new_tokens, num_beams, batch_size, batch_wait_ms,
+           engine, num_threads, onnx_dir)
+    with _engines_lock:
+        batch_engine = _engines.get(key)
+        if batch_engine is None:
+            batch_engine = Florence2BatchEngine(
+                model_name=model_name,
+                revision=revision,
+                task_prompt=task_prompt,
+                max_new_tokens=max_new_tokens,
+                num_beams=num_beams,
+                batch_size=batch_size,
+                batch_wait_ms=batch_wait_ms,
+                engine=engine,
+                num_threads=num_threads,
+                onnx_dir=onnx_dir
+            )
+            _engines[key] = batch_engine
+    return batch_engine
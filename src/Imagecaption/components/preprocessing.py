@@ -0,0 +1,176 @@
+import io
+import logging
+import multiprocessing
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, Optional, Tuple, Union
+
+from src.Imagecaption.utils.metrics import metrics
+from src.Imagecaption.utils.near_duplicates import perceptual_hash
+
+logger = logging.getLogger(__name__)
+
+# Resampling filter and Pillow reducing_gap per preset; a reducing_gap lets Pillow shrink
+# by an integer factor first (cheap box reduce) before the final resampling pass
+RESAMPLE_PRESETS: Dict[str, Tuple[str, Optional[float]]] = {
+    "fast": ("BILINEAR", 2.0),
+    "balanced": ("BICUBIC", 3.0),
+    "quality": ("LANCZOS", None),
+}
+
+OUTPUT_FORMATS = {"JPEG": ("image/jpeg", ".jpg"), "WEBP": ("image/webp", ".webp")}
+
+
+class PreprocessingBusy(RuntimeError):
+    """Raised when the preprocessing queue is full for longer than the submit timeout."""
+
+
+@dataclass
+class PreprocessedImage:
+    data: bytes
+    width: int
+    height: int
+    mime_type: str
+    decode_seconds: float = 0.0
+    encode_seconds: float = 0.0
+    phash: Optional[int] = None
+
+
+def preprocess_image(data: Union[bytes, str], resize_shape: tuple, preset: str = "balanced",
+                     output_format: str = "JPEG", quality: int = 85,
+                     hash_kind: Optional[str] = None) -> PreprocessedImage:
+    # Module-level and dependency-light so it can run in a spawned worker process
+    from PIL import Image, ImageOps
+
+    if preset not in RESAMPLE_PRESETS:
+        raise ValueError(f"Unknown resample preset: {preset}")
+    output_format = output_format.upper()
+    if output_format not in OUTPUT_FORMATS:
+        raise ValueError(f"Unsupported output format: {output_format}")
+    resample_name, reducing_gap = RESAMPLE_PRESETS[preset]
+
+    start = time.perf_counter()
+    try:
+        # A path is opened directly, so large files are streamed from disk rather than pickled to the pool
+        with Image.open(data if isinstance(data, str) else io.BytesIO(data)) as img:
+            # JPEGs are decoded at a reduced DCT scale that is still >= the target size
+            img.draft("RGB", tuple(resize_shape))
+            img = ImageOps.exif_transpose(img)
+            if img.mode != "RGB":
+                img = img.convert("RGB")
+            img.thumbnail(resize_shape, getattr(Image.Resampling, resample_name), reducing_gap=reducing_gap)
+    except Exception as e:
+        raise ValueError(f"Uploaded file is not a valid image: {e}") from e
+    # Hashed from the already-decoded thumbnail, so near-duplicate detection costs no extra decode
+    value_hash = perceptual_hash(img, hash_kind) if hash_kind else None
+    decoded = time.perf_counter()
+
+    buffer = io.BytesIO()
+    if output_format == "WEBP":
+        img.save(buffer, "WEBP", quality=quality, method=4)
+    else:
+        img.save(buffer, "JPEG", quality=quality, optimize=True)
+    mime_type = OUTPUT_FORMATS[output_format][0]
+    return PreprocessedImage(
+        data=buffer.getvalue(),
+        width=img.width,
+        height=img.height,
+        mime_type=mime_type,
+        decode_seconds=decoded - start,
+        encode_seconds=time.perf_counter() - decoded,
+        phash=value_hash
+    )
+
+
+class PreprocessingService:
+    """Runs image decode/resize/encode off the request thread.
+
+    ``mode="process"`` uses a spawned process pool so large photos do not hold
+    the caller's GIL; ``"thread"`` and ``"inline"`` are for environments where
+    spawning processes is not possible. At most ``max_pending`` jobs are queued
+    or running; further submits wait up to ``submit_timeout`` seconds and then
+    raise ``PreprocessingBusy`` so callers can shed load instead of piling up.
+    """
+
+    def __init__(self, mode: str = "process", workers: int = 2, max_pending: int = 16,
+                 submit_timeout: float = 5.0):
+        if mode not in ("process", "thread", "inline"):
+            raise ValueError(f"Unknown preprocessing mode: {mode}")
+        self.mode = mode
+        self.workers = max(1, int(workers))
+        self.submit_timeout = submit_timeout
+        self._slots = threading.BoundedSemaphore(max(1, int(max_pending)))
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def _get_executor(self):
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    if self.mode == "process":
+                        # spawn: forking a process that already runs threads (Streamlit, HTTP pools) is unsafe
+                        self._executor = ProcessPoolExecutor(
+                            max_workers=self.workers,
+                            mp_context=multiprocessing.get_context("spawn")
+                        )
+                    else:
+                        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="preprocess")
+                    logger.info(f"Started {self.mode} preprocessing pool with {self.workers} worker(s)")
+        return self._executor
+
+    def submit(self, data: Union[bytes, str, Path], resize_shape: tuple, preset: str = "balanced",
+               output_format: str = "JPEG", quality: int = 85, hash_kind: Optional[str] = None) -> Future:
+        source = str(data) if isinstance(data, (str, Path)) else bytes(data)
+        args = (source, tuple(resize_shape), preset, output_format, quality, hash_kind)
+        if self.mode == "inline":
+            future: Future = Future()
+            try:
+                future.set_result(preprocess_image(*args))
+            except Exception as e:
+                future.set_exception(e)
+            return future
+
+        if not self._slots.acquire(timeout=self.submit_timeout):
+            metrics.incr("preprocess_rejected_total")
+            raise PreprocessingBusy(f"Preprocessing queue full (timed out after {self.submit_timeout}s)")
+        try:
+            future = self._get_executor().submit(preprocess_image, *args)
+        except BaseException:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        return future
+
+    def process(self, data: Union[bytes, str, Path], resize_shape: tuple, preset: str = "balanced",
+                output_format: str = "JPEG", quality: int = 85, hash_kind: Optional[str] = None) -> PreprocessedImage:
+        with metrics.span("ingestion.preprocess", mode=self.mode):
+            result = self.submit(data, resize_shape, preset, output_format, quality, hash_kind).result()
+        # Timings measured inside the worker keep the per-step breakdown across processes
+        metrics.observe("stage_seconds", result.decode_seconds, stage="ingestion.decode_resize", status="ok")
+        metrics.observe("stage_seconds", result.encode_seconds, stage="ingestion.encode", status="ok")
+        return result
+
+    def shutdown(self, wait: bool = True):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=wait)
+                self._executor = None
+
+
+_services: Dict[tuple, PreprocessingService] = {}
+_services_lock = threading.Lock()
+
+
+def get_preprocessing_service(mode: str = "process", workers: int = 2, max_pending: int = 16,
+                              submit_timeout: float = 5.0) -> PreprocessingService:
+    # One pool per setting, shared process-wide so every DataIngestion reuses warm workers
+    key = (mode, workers, max_pending, submit_timeout)
+    with _services_lock:
+        service = _services.get(key)
+        if service is None:
+            service = PreprocessingService(mode, workers, max_pending, submit_timeout)
+            _services[key] = service
+    return service
@@ -1,67 +1,366 @@
+import contextvars
+from contextlib import ExitStack
+import json
 import logging
+import math
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
 from pathlib import Path
+from typing import List, Optional
 import os
-import streamlit as st
-from together import Together
+import re
+import time
+from src.Imagecaption.utils.artifacts import ArtifactStore
+from src.Imagecaption.utils.cache import story_cache_key
+from src.Imagecaption.utils.common import get_secret
+from src.Imagecaption.utils.metrics import metrics
 
 logger = logging.getLogger(__name__)
 
+_WORD = re.compile(r"\S+")
+_SENTENCE_END = re.compile(r"[.!?][\"')\]]*(?=\s|$)")
+_LAST_SPACE = re.compile(r"\s\S*$")
+
+
+def word_count(text: str) -> int:
+    return len(_WORD.findall(text))
+
+
+def word_limit_cutoff(text: str, word_limit: int, tolerance: float = 0.1, final: bool = True) -> Optional[int]:
+    """Character index at which ``text`` should end to respect ``word_limit``.
+
+    Prefers finishing the sentence in progress (up to ``tolerance`` extra words),
+    otherwise backs off to the last complete sentence. Returns None while the
+    text is within the limit, or (``final=False``) while a stream may still end
+    the current sentence in time.
+    """
+    words = list(_WORD.finditer(text))
+    if not word_limit or len(words) <= word_limit:
+        return None
+
+    limit_end = words[word_limit - 1].end()
+    hard_limit = max(word_limit, int(word_limit * (1 + tolerance)))
+    hard_end = words[min(hard_limit, len(words)) - 1].end()
+    sentence_end = _SENTENCE_END.search(text, limit_end - 1)
+    if sentence_end and sentence_end.end() <= hard_end:
+        return sentence_end.end()
+    if not final and len(words) <= hard_limit:
+        return None
+
+    last_complete = None
+    for match in _SENTENCE_END.finditer(text, 0, limit_end):
+        last_complete = match.end()
+    return last_complete if last_complete and last_complete > limit_end // 2 else limit_end
+
+
+class _WordCounter:
+    # Word count of a growing text; each chunk is scanned once instead of the whole text
+    def __init__(self):
+        self._complete = 0   # Words already followed by whitespace
+        self._partial = ""  # Trailing word that the next chunk may continue
+
+    def add(self, text: str) -> int:
+        text = self._partial + text
+        last_space = _LAST_SPACE.search(text)
+        if last_space:
+            self._complete += word_count(text[:last_space.start()])
+            text = text[last_space.start() + 1:]
+        self._partial = text
+        return self._complete + (1 if text else 0)
+
+
+@dataclass(frozen=True)
+class StoryVariant:
+    theme: Optional[str] = None
+    word_limit: Optional[int] = None
+    count: int = 1   # Independent samples of this prompt
+
+
 class StoryGeneration:
-    def __init__(self, config):
+    def __init__(self, config, client=None, async_client=None, store=None):
         self.config = config
-        
-        # Robust API key retrieval (Streamlit secrets + local env fallback)
-        try:
-            api_key = st.secrets["TOGETHER_API_KEY"]
-        except Exception:
-            api_key = os.getenv("TOGETHER_API_KEY", getattr(config, "together_api_key", ""))
-            
-        self.client = Together(api_key=api_key)
+        if store is None and hasattr(config, "stories_dir"):
+            store = ArtifactStore({"story": config.stories_dir, "variants": config.stories_dir})
+        self.store = store
 
-    def generate_story(self, caption_file_path, theme=None, word_limit=None) -> str:
+        # Shared clients come from the application context; standalone use builds its own
+        self.api_key = get_secret("TOGETHER_API_KEY", getattr(config, "together_api_key", ""))
+        self._client = client
+        self._async_client = async_client
+
+    @property
+    def client(self):
+        # The SDK is imported on first use so importing this module stays cheap
+        if self._client is None:
+            from together import Together
+            self._client = Together(api_key=self.api_key)
+        return self._client
+
+    @property
+    def async_client(self):
+        # Created on first use so sync-only callers never open an async connection pool
+        if self._async_client is None:
+            from together import AsyncTogether
+            self._async_client = AsyncTogether(api_key=self.api_key)
+        return self._async_client
+
+    @staticmethod
+    def read_caption(caption_file_path):
         # Check if the first argument is a path or a caption string
         if isinstance(caption_file_path, (str, Path)) and os.path.exists(caption_file_path):
             with open(caption_file_path, 'r', encoding='utf-8') as f:
-                caption = f.read().strip()
-            save_to_disk = True
-        else:
-            caption = str(caption_file_path).strip()
-            save_to_disk = False
+                return f.read().strip(), True
+        return str(caption_file_path).strip(), False
+
+    def resolve(self, theme=None, word_limit=None) -> tuple:
+        return (theme or self.config.default_theme, int(word_limit or self.config.default_word_limit))
+
+    def token_budget(self, word_limit=None) -> int:
+        # Completion tokens for a story of word_limit words, with headroom for the title and
+        # the sentence in progress; a 100-word request no longer reserves a 1000-word budget
+        if not word_limit:
+            return self.config.max_tokens
+        budget = math.ceil(int(word_limit) * self.config.tokens_per_word * (1 + self.config.token_headroom))
+        return max(self.config.min_tokens, min(budget, self.config.max_tokens_ceiling))
+
+    def sampling_params(self, word_limit=None) -> dict:
+        return {
+            "model": self.config.model_name,
+            "max_tokens": self.token_budget(word_limit),
+            "temperature": self.config.temperature,
+            "top_p": self.config.top_p,
+        }
+
+    def cache_key(self, caption: str, theme=None, word_limit=None, **extra) -> str:
+        # Keyed on the resolved request, so omitted arguments and explicit defaults share an entry
+        theme, word_limit = self.resolve(theme, word_limit)
+        return story_cache_key(caption, theme, word_limit, **self.sampling_params(word_limit), **extra)
+
+    def build_prompt(self, caption: str, theme=None, word_limit=None) -> str:
+        theme, word_limit = self.resolve(theme, word_limit)
+        return self.config.story_prompt_template.format(caption=caption, theme=theme, word_limit=word_limit)
+
+    def finalize(self, story: str, word_limit: int, elapsed: float, max_tokens: int, early_stopped: bool = False) -> str:
+        cutoff = word_limit_cutoff(story, word_limit, self.config.word_limit_tolerance)
+        if cutoff is not None:
+            story = story[:cutoff].rstrip()
+            early_stopped = True
+        words = word_count(story)
+        metrics.observe("story_words", words)
+        metrics.observe("story_budget_ratio", words / word_limit if word_limit else 0.0)
+        if early_stopped:
+            metrics.incr("story_early_stops_total")
+        logger.info(f"Story budget: {words}/{word_limit} words, max_tokens={max_tokens}, "
+                    f"{elapsed:.2f}s{' (stopped at limit)' if early_stopped else ''}")
+        return story
+
+    def _request_stories(self, caption: str, theme: str, word_limit: int, params: dict, n: int = 1) -> List[str]:
+        # One request; with n > 1 the provider samples several completions of the same prompt
+        start = time.perf_counter()
+        with metrics.span("story"):
+            response = self.client.chat.completions.create(
+                messages=[{
+                    "role": "user",
+                    "content": self.build_prompt(caption, theme, word_limit)
+                }],
+                **({**params, "n": n} if n > 1 else params)
+            )
+        metrics.record_token_usage(response, stage="story")
+        elapsed = time.perf_counter() - start
+        return [
+            self.finalize(choice.message.content.strip(), word_limit, elapsed, params["max_tokens"],
+                          early_stopped=choice.finish_reason == "length")
+            for choice in response.choices[:n]
+        ]
+
+    def _variant_samples(self, caption: str, theme: str, word_limit: int, count: int) -> List[str]:
+        params = self.sampling_params(word_limit)
+        if count == 1 or not self.config.use_n_for_samples:
+            return self._request_stories(caption, theme, word_limit, params)
+        stories = self._request_stories(caption, theme, word_limit, params, n=count)
+        # Providers that ignore n answer with one choice; the rest are requested one by one
+        while len(stories) < count:
+            metrics.incr("story_n_fallback_requests_total")
+            stories += self._request_stories(caption, theme, word_limit, params)
+        return stories
+
+    def generate_variants(self, caption_file_path, variants: List[StoryVariant]) -> List[dict]:
+        """Stories for several (theme, word_limit) variants of one caption.
+
+        Distinct prompts run as parallel requests (``variant_concurrency``);
+        repeated samples of one prompt use the ``n`` parameter. Returns one
+        ``{"theme", "word_limit", "story"}`` record per sample, in input order.
+        """
+        caption, save_to_disk = self.read_caption(caption_file_path)
+        resolved = [(*self.resolve(v.theme, v.word_limit), max(1, v.count)) for v in variants]
+        if not self.config.use_n_for_samples:
+            # Every sample becomes its own parallel request
+            resolved = [(theme, word_limit, 1) for theme, word_limit, count in resolved for _ in range(count)]
+
+        logger.info(f"Generating {sum(count for *_, count in resolved)} story variant(s) from caption")
+        with metrics.span("story.variants"), ThreadPoolExecutor(
+                max_workers=max(1, min(len(resolved), self.config.variant_concurrency)),
+                thread_name_prefix="story-variant") as pool:
+            # Copied contexts carry the caller's request deadline into the pool threads
+            futures = [
+                pool.submit(contextvars.copy_context().run, self._variant_samples, caption, theme, word_limit, count)
+                for theme, word_limit, count in resolved
+            ]
+            results = [
+                {"theme": theme, "word_limit": word_limit, "story": story}
+                for (theme, word_limit, _), future in zip(resolved, futures)
+                for story in future.result()
+            ]
+
+        if save_to_disk:
+            self.save_variants(caption_file_path, results)
+        return results
+
+    def generate_story(self, caption_file_path, theme=None, word_limit=None) -> str:
+        caption, save_to_disk = self.read_caption(caption_file_path)
+        theme, word_limit = self.resolve(theme, word_limit)
+        params = self.sampling_params(word_limit)
 
         logger.info("Generating story from caption")
+        story = self._request_stories(caption, theme, word_limit, params)[0]
+
+        if save_to_disk:
+            self.save_story(caption_file_path, story)
+
+        logger.info("Story generated successfully")
+        return story
 
-        prompt = f"""You are a creative storyteller. Based on the following image description, write an engaging short story.
+    async def agenerate_story(self, caption_file_path, theme=None, word_limit=None) -> str:
+        caption, save_to_disk = self.read_caption(caption_file_path)
+        theme, word_limit = self.resolve(theme, word_limit)
+        params = self.sampling_params(word_limit)
 
-Image Description: {caption}
+        logger.info("Generating story from caption (async)")
 
-Instructions:
-- Write a complete short story of 3-4 paragraphs
-- Include a clear beginning, middle, and end
-- Use vivid, descriptive language
-- Give the main character a name and personality
-- End with a meaningful or surprising conclusion
+        start = time.perf_counter()
+        with metrics.span("story"):
+            response = await self.async_client.chat.completions.create(
+                messages=[{
+                    "role": "user",
+                    "content": self.build_prompt(caption, theme, word_limit)
+                }],
+                **params
+            )
+        metrics.record_token_usage(response, stage="story")
+
+        story = self.finalize(
+            response.choices[0].message.content.strip(),
+            word_limit,
+            time.perf_counter() - start,
+            params["max_tokens"],
+            early_stopped=response.choices[0].finish_reason == "length"
+        )
 
-Story:"""
+        if save_to_disk:
+            self.save_story(caption_file_path, story)
+
+        logger.info("Story generated successfully")
+        return story
 
-        response = self.client.chat.completions.create(
-            model="meta-llama/Llama-3.3-70B-Instruct-Turbo",
+    def stream_story(self, caption_file_path, theme=None, word_limit=None):
+        caption, save_to_disk = self.read_caption(caption_file_path)
+        theme, word_limit = self.resolve(theme, word_limit)
+        params = self.sampling_params(word_limit)
+
+        logger.info("Streaming story from caption")
+
+        start = time.perf_counter()
+        first_chunk_at = None
+        stream = self.client.chat.completions.create(
             messages=[{
                 "role": "user",
-                "content": prompt
+                "content": self.build_prompt(caption, theme, word_limit)
             }],
-            max_tokens=1024,
-            temperature=0.8,
+            stream=True,
+            **params
         )
 
-        story = response.choices[0].message.content.strip()
-        
-        if save_to_disk and hasattr(self.config, "stories_dir"):
-            # Ensure folder exists
-            self.config.stories_dir.mkdir(parents=True, exist_ok=True)
-            story_path = self.config.stories_dir / f"{Path(caption_file_path).stem.replace('_caption', '')}_story.txt"
-            with open(story_path, "w", encoding="utf-8") as f:
-                f.write(story)
-            logger.info(f"Story saved at: {story_path}")
+        story_file, story_writer = None, ExitStack()
+        if save_to_disk and self.store is not None:
+            # Written and flushed as chunks arrive, so a dropped connection still leaves the text so far;
+            # only a completed stream is renamed to the story path, anything else to the .partial sibling
+            story_file = story_writer.enter_context(self.store.open_atomic(
+                self.story_path(caption_file_path), partial_path=self.partial_story_path(caption_file_path)))
 
-        logger.info("Story generated successfully")
-        return story
+        def emit(text):
+            if story_file is not None:
+                story_file.write(text)
+                story_file.flush()
+            return text
+
+        received, sent, cutoff, completed = "", 0, None, False
+        words = _WordCounter()
+        status = "error"
+        with story_writer:
+            try:
+                for chunk in stream:
+                    if not chunk.choices:
+                        continue
+                    text = chunk.choices[0].delta.content
+                    if not text:
+                        continue
+                    if first_chunk_at is None:
+                        first_chunk_at = time.perf_counter()
+                        metrics.observe("stage_seconds", first_chunk_at - start, stage="story.first_token", status="ok")
+                    metrics.incr("story_stream_chunks_total")
+                    received += text
+
+                    if words.add(text) <= word_limit:
+                        yield emit(received[sent:])
+                        sent = len(received)
+                        continue
+                    # Past the limit, text is held back until the sentence ends or the tolerance runs out
+                    cutoff = word_limit_cutoff(received, word_limit, self.config.word_limit_tolerance, final=False)
+                    if cutoff is not None:
+                        break
+
+                if cutoff is None:
+                    cutoff = word_limit_cutoff(received, word_limit, self.config.word_limit_tolerance)
+                # What was already sent stays sent, even if the cutoff backs off to an earlier sentence
+                end = len(received) if cutoff is None else max(cutoff, sent)
+                if end > sent:
+                    yield emit(received[sent:end])
+                completed, status = True, "ok"
+            finally:
+                if (cutoff is not None or not completed) and hasattr(stream, "close"):
+                    # Stops generation server-side instead of paying for tokens that would be discarded
+                    # (also when the consumer abandons the stream, e.g. a cancelled job)
+                    stream.close()
+                metrics.observe("stage_seconds", time.perf_counter() - start, stage="story.stream", status=status)
+        # Logged from the text the consumer received, which is also what gets cached and saved
+        self.finalize(received[:end], word_limit, time.perf_counter() - start, params["max_tokens"],
+                      early_stopped=cutoff is not None)
+        if story_file is not None:
+            logger.info(f"Story saved at: {self.story_path(caption_file_path)}")
+
+        logger.info("Story streamed successfully")
+
+    def story_path(self, caption_file_path) -> Path:
+        return self.store.path_for("story", caption_file_path)
+
+    def partial_story_path(self, caption_file_path) -> Path:
+        # <id>_story.partial.txt: what an interrupted stream produced, never read as a finished story
+        story_path = self.story_path(caption_file_path)
+        return story_path.with_name(f"{story_path.stem}.partial{story_path.suffix}")
+
+    def save_variants(self, caption_file_path, results: List[dict]):
+        if self.store is None:
+            return None
+        path = self.store.write_text(
+            self.store.path_for("variants", caption_file_path),
+            json.dumps(results, ensure_ascii=False, indent=2)
+        )
+        logger.info(f"Story variants saved at: {path}")
+        return path
+
+    def save_story(self, caption_file_path, story: str):
+        if self.store is None:
+            return None
+        story_path = self.store.write_text(self.story_path(caption_file_path), story)
+        logger.info(f"Story saved at: {story_path}")
+        return story_path
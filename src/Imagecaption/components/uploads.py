@@ -0,0 +1,262 @@
+import json
+import logging
+import os
+import re
+import shutil
+import threading
+import time
+import uuid
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import BinaryIO, Dict, Optional
+
+from src.Imagecaption.entity.config_entity import UploadConfig
+from src.Imagecaption.utils.common import clean_filename, is_allowed_file
+from src.Imagecaption.utils.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# Enough of the first chunk to tell real images from renamed or corrupt files
+_HEADER_BYTES = 12
+_UPLOAD_ID = re.compile(r"^[0-9a-f]{32}$")
+
+
+class UploadError(ValueError):
+    """The upload was rejected (bad header, over the size limit, wrong state)."""
+
+
+class UploadNotFound(UploadError):
+    pass
+
+
+class UploadOffsetMismatch(UploadError):
+    """A chunk did not start where the stored data ends; ``received`` is where to resume."""
+
+    def __init__(self, message: str, received: int):
+        super().__init__(message)
+        self.received = received
+
+
+def detect_image_type(header: bytes) -> Optional[tuple]:
+    # Magic bytes -> (MIME type, extensions)
+    if header[:3] == b"\xff\xd8\xff":
+        return "image/jpeg", ("jpg", "jpeg")
+    if header[:8] == b"\x89PNG\r\n\x1a\n":
+        return "image/png", ("png",)
+    if header[:4] == b"RIFF" and header[8:12] == b"WEBP":
+        return "image/webp", ("webp",)
+    return None
+
+
+@dataclass
+class UploadStatus:
+    upload_id: str
+    filename: str
+    size: Optional[int]  # None when the client did not declare it (plain form posts)
+    received: int = 0
+    state: str = "uploading"  # uploading -> complete -> ingested | failed
+    mime_type: str = ""
+    ingested_path: str = ""
+    error: str = ""
+    created_at: float = 0.0
+
+    def to_dict(self) -> dict:
+        return asdict(self)
+
+
+class ChunkedUploads:
+    """Resumable chunked uploads that stream to disk and are ingested as soon as they complete.
+
+    Each upload lives in ``uploads_dir/<upload_id>/``: ``meta.json``, the growing
+    ``data.part`` (whose size is the resume offset) and, once complete, the file
+    under its cleaned original name. The first chunk must carry a JPEG/PNG/WebP
+    header, so renamed or truncated files fail before the rest is sent. Completing
+    an upload hands it to ``DataIngestion`` on a background thread; ``ingested``
+    waits for that result (or runs it, when another process took the upload).
+    """
+
+    def __init__(self, config: UploadConfig, data_ingestion):
+        self.config = config
+        self.data_ingestion = data_ingestion
+        self.allowed_extensions = data_ingestion.config.allowed_extensions
+        self.config.uploads_dir.mkdir(parents=True, exist_ok=True)
+        self._executor = ThreadPoolExecutor(max_workers=max(1, config.ingest_workers), thread_name_prefix="upload-ingest")
+        self._futures: Dict[str, Future] = {}
+        self._locks: Dict[str, threading.Lock] = {}
+        self._locks_lock = threading.Lock()
+        self._last_purge = time.monotonic()
+
+    def _dir(self, upload_id: str) -> Path:
+        # The ID becomes a path component, so only our own hex IDs are accepted
+        if not _UPLOAD_ID.match(upload_id or ""):
+            raise UploadNotFound(f"Unknown upload: {upload_id}")
+        return self.config.uploads_dir / upload_id
+
+    def _lock(self, upload_id: str) -> threading.Lock:
+        with self._locks_lock:
+            return self._locks.setdefault(upload_id, threading.Lock())
+
+    def _read_meta(self, upload_id: str) -> UploadStatus:
+        meta_path = self._dir(upload_id) / "meta.json"
+        try:
+            status = UploadStatus(**json.loads(meta_path.read_text(encoding="utf-8")))
+        except FileNotFoundError:
+            raise UploadNotFound(f"Unknown upload: {upload_id}") from None
+        part_path = meta_path.with_name("data.part")
+        if status.state == "uploading":
+            status.received = part_path.stat().st_size if part_path.exists() else 0
+        return status
+
+    def _write_meta(self, status: UploadStatus):
+        meta_path = self._dir(status.upload_id) / "meta.json"
+        tmp_path = meta_path.with_name(f".meta.{uuid.uuid4().hex[:8]}.tmp")
+        tmp_path.write_text(json.dumps(status.to_dict()), encoding="utf-8")
+        os.replace(tmp_path, meta_path)
+
+    def _final_path(self, status: UploadStatus) -> Path:
+        return self._dir(status.upload_id) / clean_filename(Path(status.filename).name)
+
+    def create(self, filename: str, size: Optional[int] = None) -> UploadStatus:
+        if not is_allowed_file(filename, self.allowed_extensions):
+            raise UploadError(f"File type not supported: {Path(filename).suffix}")
+        if size is not None and not 0 < size <= self.config.max_file_size:
+            raise UploadError(f"File size must be between 1 byte and {self.config.max_file_size} bytes, got {size}")
+        self.maybe_purge()
+
+        status = UploadStatus(upload_id=uuid.uuid4().hex, filename=Path(filename).name, size=size, created_at=time.time())
+        upload_dir = self._dir(status.upload_id)
+        upload_dir.mkdir(parents=True)
+        (upload_dir / "data.part").touch()
+        self._write_meta(status)
+        metrics.incr("uploads_started_total")
+        logger.info(f"Upload {status.upload_id} started for {status.filename} ({size} bytes)")
+        return status
+
+    def status(self, upload_id: str) -> UploadStatus:
+        return self._read_meta(upload_id)
+
+    def write_chunk(self, upload_id: str, offset: int, data: bytes) -> UploadStatus:
+        if len(data) > self.config.max_chunk_size:
+            raise UploadError(f"Chunk exceeds {self.config.max_chunk_size} bytes")
+        with self._lock(upload_id):
+            status = self._read_meta(upload_id)
+            if status.state != "uploading":
+                raise UploadError(f"Upload {upload_id} is already {status.state}")
+            received = status.received
+            if offset > received:
+                raise UploadOffsetMismatch(f"Expected offset {received}, got {offset}", received)
+            # A retried chunk may overlap what was already stored; only the new tail is appended
+            data = data[received - offset:]
+            if not data:
+                return status
+            limit = status.size if status.size is not None else self.config.max_file_size
+            if received + len(data) > limit:
+                self.discard(upload_id)
+                raise UploadError(f"Upload exceeds {limit} bytes")
+
+            if received == 0:
+                needed = min(_HEADER_BYTES, status.size or _HEADER_BYTES)
+                if len(data) < needed:
+                    raise UploadError(f"The first chunk must contain at least {needed} bytes")
+                detected = detect_image_type(data[:_HEADER_BYTES])
+                allowed = {ext.lower().lstrip(".") for ext in self.allowed_extensions}
+                if detected is None or not allowed.intersection(detected[1]):
+                    self.discard(upload_id)
+                    metrics.incr("uploads_rejected_total", reason="header")
+                    raise UploadError("Uploaded file is not a valid image.")
+                status.mime_type = detected[0]
+                self._write_meta(status)
+
+            with open(self._dir(upload_id) / "data.part", "ab") as f:
+                f.write(data)
+            status.received = received + len(data)
+        metrics.incr("upload_bytes_received_total", len(data))
+        return status
+
+    def write_stream(self, upload_id: str, stream: BinaryIO) -> UploadStatus:
+        # Plain multipart form posts (no JavaScript) go through the same checks, one chunk at a time
+        status = self.status(upload_id)
+        while True:
+            chunk = stream.read(self.config.chunk_size)
+            if not chunk:
+                return status
+            status = self.write_chunk(upload_id, status.received, chunk)
+
+    def complete(self, upload_id: str) -> UploadStatus:
+        with self._lock(upload_id):
+            status = self._read_meta(upload_id)
+            if status.state != "uploading":
+                return status
+            if status.received == 0 or (status.size is not None and status.received != status.size):
+                raise UploadOffsetMismatch(f"Upload incomplete: {status.received}/{status.size} bytes", status.received)
+            upload_dir = self._dir(upload_id)
+            os.replace(upload_dir / "data.part", self._final_path(status))
+            status.size, status.state = status.received, "complete"
+            self._write_meta(status)
+            # Decode/resize starts now, while the user is still filling in the rest of the form
+            future = self._futures[upload_id] = self._executor.submit(self._ingest, upload_id)
+            # Once done, the result is in meta.json for any process to read
+            future.add_done_callback(lambda _: self._futures.pop(upload_id, None))
+        metrics.incr("uploads_completed_total")
+        logger.info(f"Upload {upload_id} complete ({status.received} bytes); ingesting")
+        return status
+
+    def _ingest(self, upload_id: str) -> Path:
+        status = self._read_meta(upload_id)
+        try:
+            ingested_path = self.data_ingestion.ingest(self._final_path(status), max_file_size=self.config.max_file_size)
+        except Exception as e:
+            status.state, status.error = "failed", str(e)
+            self._write_meta(status)
+            raise
+        status.state, status.ingested_path = "ingested", str(ingested_path)
+        self._write_meta(status)
+        return ingested_path
+
+    def ingested(self, upload_id: str, timeout: Optional[float] = None) -> Path:
+        future = self._futures.get(upload_id)
+        if future is not None:
+            return future.result(timeout)
+        status = self._read_meta(upload_id)
+        if status.state == "ingested":
+            return Path(status.ingested_path)
+        if status.state == "failed":
+            raise UploadError(status.error)
+        if status.state == "uploading":
+            raise UploadOffsetMismatch("Upload incomplete", status.received)
+        # Completed in another process (or before a restart) without an ingestion result here
+        return self._ingest(upload_id)
+
+    def discard(self, upload_id: str):
+        with self._locks_lock:
+            self._locks.pop(upload_id, None)
+        shutil.rmtree(self._dir(upload_id), ignore_errors=True)
+
+    def maybe_purge(self):
+        interval = min(self.config.stale_after_seconds / 4, 3600)
+        if time.monotonic() - self._last_purge < interval:
+            return
+        self._last_purge = time.monotonic()
+        try:
+            self.purge()
+        except Exception as e:
+            logger.warning(f"Upload purge failed: {e}")
+
+    def purge(self, older_than: Optional[float] = None) -> int:
+        # Abandoned partial uploads and uploads nobody came back for; the ingested copy is kept
+        cutoff = time.time() - (self.config.stale_after_seconds if older_than is None else older_than)
+        removed = 0
+        for upload_dir in self.config.uploads_dir.iterdir():
+            if not upload_dir.is_dir() or not _UPLOAD_ID.match(upload_dir.name):
+                continue
+            last_write = max((f.stat().st_mtime for f in upload_dir.iterdir()), default=upload_dir.stat().st_mtime)
+            if last_write < cutoff and upload_dir.name not in self._futures:
+                self.discard(upload_dir.name)
+                removed += 1
+        if removed:
+            logger.info(f"Purged {removed} stale upload(s)")
+        return removed
+
+    def shutdown(self, wait: bool = True):
+        self._executor.shutdown(wait=wait)
@@ -1,15 +1,30 @@
+import functools
 import os
 from pathlib import Path
 from dotenv import load_dotenv
-from src.Imagecaption.utils.common import read_yaml
-from src.Imagecaption.entity.config_entity import (DataIngestionConfig,ImageCaptioningConfig,StoryGenerationConfig)
+from src.Imagecaption.utils.common import read_yaml, get_secret
+from src.Imagecaption.entity.config_entity import (DataIngestionConfig,ImageCaptioningConfig,StoryGenerationConfig,CacheConfig,OrchestratorConfig,ProviderConfig,MetricsConfig,ArtifactConfig,JobQueueConfig,ResilienceConfig,NearDuplicateConfig,LoggingConfig,UploadConfig,EncodingProfile,validate_config)
+
+def _built_once(getter):
+    # The YAML is only re-read by creating a new manager, so each config object is built
+    # from the ConfigBox and type-checked once; later calls are a dict lookup
+    @functools.wraps(getter)
+    def wrapper(self):
+        config = self._built.get(getter.__name__)
+        if config is None:
+            config = self._built[getter.__name__] = validate_config(getter(self))
+        return config
+    return wrapper
+
 
 class ConfigurationManager:
     def __init__(self, config_path: str = "config/config.yaml", params_path: str = "params.yaml"):
         load_dotenv()
         self.config = read_yaml(Path(config_path))
         self.params = read_yaml(Path(params_path))
+        self._built = {}
 
+    @_built_once
     def get_data_ingestion_config(self) -> DataIngestionConfig:
         config = self.config.data_ingestion
         params = self.params.data_ingestion
@@ -18,9 +33,18 @@ class ConfigurationManager:
             ingested_data_dir=Path(config.ingested_data_dir),
             allowed_extensions=config.allowed_extensions,
             max_file_size=config.max_file_size,
-            resize_shape=tuple(params.resize_shape)
+            resize_shape=tuple(params.resize_shape),
+            persist_ingested=config.get("persist_ingested", True),
+            preprocess_mode=params.get("preprocess_mode", "process"),
+            preprocess_workers=params.get("preprocess_workers", 2),
+            preprocess_max_pending=params.get("preprocess_max_pending", 16),
+            preprocess_submit_timeout=params.get("preprocess_submit_timeout", 5.0),
+            resample_preset=params.get("resample_preset", "balanced"),
+            output_format=params.get("output_format", "JPEG"),
+            output_quality=params.get("output_quality", 85)
         )
 
+    @_built_once
     def get_image_captioning_config(self) -> ImageCaptioningConfig:
         config = self.config.image_captioning
         params = self.params.image_captioning
@@ -30,9 +54,35 @@ class ConfigurationManager:
             florence2_model_name=config.florence2_model_name,
             max_new_tokens=params.max_new_tokens,
             task_prompt=params.task_prompt,
-            num_beams=params.num_beams
+            num_beams=params.num_beams,
+            local_model_name=config.get("local_model_name", "microsoft/Florence-2-base-ft"),
+            revision_id=config.get("revision_id", "main"),
+            warmup_local_model=params.get("warmup_local_model", False),
+            batch_size=params.get("batch_size", 8),
+            batch_wait_ms=params.get("batch_wait_ms", 20.0),
+            remote_backend=params.get("remote_backend", "together"),
+            mock_base_url=config.get("mock_base_url", "http://127.0.0.1:8765/v1"),
+            local_fallback=params.get("local_fallback", True),
+            request_timeout=params.get("request_timeout", 30.0),
+            hedge_after_ms=params.get("hedge_after_ms", 0.0),
+            breaker_failure_threshold=params.get("breaker_failure_threshold", 5),
+            breaker_reset_seconds=params.get("breaker_reset_seconds", 30.0),
+            remote_max_tokens=params.get("remote_max_tokens", 160),
+            inference_engine=params.get("inference_engine", "eager"),
+            num_threads=params.get("num_threads", 0),
+            onnx_dir=Path(config.get("onnx_dir", "artifacts/onnx")),
+            encoding=self._encoding_profile(params.get("encoding", {}), config.florence2_model_name),
+            image_url_base=config.get("image_url_base")
         )
 
+    @staticmethod
+    def _encoding_profile(encoding, model_name: str) -> EncodingProfile:
+        # Defaults, then the overrides listed for the configured vision model
+        settings = {key: value for key, value in encoding.items() if key != "models"}
+        settings.update((encoding.get("models") or {}).get(model_name, {}))
+        return validate_config(EncodingProfile(**settings))
+
+    @_built_once
     def get_story_generation_config(self) -> StoryGenerationConfig:
         config = self.config.story_generation
         params = self.params.story_generation
@@ -47,5 +97,147 @@ class ConfigurationManager:
             max_tokens=params.max_tokens,
             temperature=params.temperature,
             top_p=params.top_p,
-            story_prompt_template=params.story_prompt_template
-        )
\ No newline at end of file
+            story_prompt_template=params.story_prompt_template,
+            default_theme=params.get("default_theme", "adventure"),
+            default_word_limit=params.get("default_word_limit", 400),
+            tokens_per_word=params.get("tokens_per_word", 1.35),
+            token_headroom=params.get("token_headroom", 0.15),
+            min_tokens=params.get("min_tokens", 64),
+            max_tokens_ceiling=params.get("max_tokens_ceiling", 2048),
+            word_limit_tolerance=params.get("word_limit_tolerance", 0.1),
+            variant_concurrency=params.get("variant_concurrency", 4),
+            use_n_for_samples=params.get("use_n_for_samples", True),
+            max_variants=params.get("max_variants", 4)
+        )
+
+    @_built_once
+    def get_cache_config(self) -> CacheConfig:
+        config = self.config.get("cache", {})
+        return CacheConfig(
+            enabled=config.get("enabled", True),
+            backend=config.get("backend", "memory"),
+            db_path=Path(config.get("db_path", "data/cache/results.sqlite")),
+            max_entries=config.get("max_entries", 10000),
+            ttl_seconds=config.get("ttl_seconds", 0)
+        )
+
+    @_built_once
+    def get_near_duplicate_config(self) -> NearDuplicateConfig:
+        config = self.config.get("near_duplicates", {})
+        params = self.params.get("near_duplicates", {})
+        artifacts = self.get_artifact_config()
+        return NearDuplicateConfig(
+            enabled=config.get("enabled", True),
+            db_path=Path(config.get("db_path", "data/cache/phash.sqlite")),
+            hash_kind=params.get("hash_kind", "dhash"),
+            max_distance=params.get("max_distance", 6),
+            # Hashes and captions live as long as the artifacts they came from unless set here
+            retention_seconds=config.get("retention_seconds", artifacts.retention_seconds) or 0,
+            prune_interval_seconds=config.get("prune_interval_seconds", artifacts.gc_interval_seconds)
+        )
+
+    @_built_once
+    def get_upload_config(self) -> UploadConfig:
+        config = self.config.get("uploads", {})
+        return UploadConfig(
+            uploads_dir=Path(config.get("uploads_dir", "data/uploads")),
+            max_file_size=config.get("max_file_size", 50 * 1024 * 1024),
+            chunk_size=config.get("chunk_size", 1024 * 1024),
+            max_chunk_size=config.get("max_chunk_size", 8 * 1024 * 1024),
+            stale_after_seconds=config.get("stale_after_seconds", 86400),
+            ingest_workers=config.get("ingest_workers", 2)
+        )
+
+    @_built_once
+    def get_orchestrator_config(self) -> OrchestratorConfig:
+        params = self.params.get("orchestrator", {})
+        return OrchestratorConfig(
+            ingestion_concurrency=params.get("ingestion_concurrency", 4),
+            captioning_concurrency=params.get("captioning_concurrency", 16),
+            story_concurrency=params.get("story_concurrency", 16),
+            thread_pool_workers=params.get("thread_pool_workers", 4)
+        )
+
+    def get_provider_config(self, name: str = "together") -> ProviderConfig:
+        # Not memoised: secrets are looked up when the client is built, after app.py registers its sources
+        config = self.config.get("providers", {}).get(name, {})
+        return validate_config(ProviderConfig(
+            name=name,
+            api_key=get_secret(f"{name.upper()}_API_KEY"),
+            base_url=config.get("base_url"),
+            max_connections=config.get("max_connections", 32),
+            max_keepalive_connections=config.get("max_keepalive_connections", 16),
+            keepalive_expiry=config.get("keepalive_expiry", 60),
+            timeout=config.get("timeout", 120)
+        ))
+
+    @_built_once
+    def get_resilience_config(self) -> ResilienceConfig:
+        params = self.params.get("resilience", {})
+        return ResilienceConfig(
+            max_retries=params.get("max_retries", 3),
+            backoff_base=params.get("backoff_base", 0.5),
+            backoff_max=params.get("backoff_max", 20),
+            requests_per_minute=params.get("requests_per_minute", 600),
+            burst=params.get("burst", 10),
+            model_requests_per_minute=dict(params.get("model_requests_per_minute") or {}),
+            initial_concurrency=params.get("initial_concurrency", 8),
+            min_concurrency=params.get("min_concurrency", 1),
+            max_concurrency=params.get("max_concurrency", 32),
+            caption_deadline=params.get("caption_deadline", 60),
+            story_deadline=params.get("story_deadline", 150)
+        )
+
+    @_built_once
+    def get_metrics_config(self) -> MetricsConfig:
+        config = self.config.get("metrics", {})
+        return MetricsConfig(
+            serve=config.get("serve", False),
+            host=config.get("host", "127.0.0.1"),
+            port=config.get("port", 9100)
+        )
+
+    @_built_once
+    def get_logging_config(self) -> LoggingConfig:
+        config = self.config.get("logging", {})
+        return LoggingConfig(
+            level=config.get("level", "INFO"),
+            log_file=Path(config.get("log_file", "logs/running_logs.log")),
+            file_format=config.get("file_format", "json"),
+            console_format=config.get("console_format", "text"),
+            max_bytes=config.get("max_bytes", 10 * 1024 * 1024),
+            backup_count=config.get("backup_count", 5),
+            queue_size=config.get("queue_size", 10000),
+            module_levels=dict(config.get("module_levels") or {}),
+            sample_every=dict(config.get("sample_every") or {})
+        )
+
+    @_built_once
+    def get_artifact_config(self) -> ArtifactConfig:
+        config = self.config.get("artifacts", {})
+        return ArtifactConfig(
+            raw_dir=Path(self.config.data_ingestion.raw_data_dir),
+            ingested_dir=Path(self.config.data_ingestion.ingested_data_dir),
+            captions_dir=Path(self.config.image_captioning.captions_dir),
+            stories_dir=Path(self.config.story_generation.stories_dir),
+            shard_depth=config.get("shard_depth", 2),
+            retention_seconds=config.get("retention_seconds", 0) or 0,
+            gc_interval_seconds=config.get("gc_interval_seconds", 3600)
+        )
+
+    @_built_once
+    def get_job_queue_config(self) -> JobQueueConfig:
+        config = self.config.get("job_queue", {})
+        params = self.params.get("job_queue", {})
+        return JobQueueConfig(
+            enabled=config.get("enabled", False),
+            db_path=Path(config.get("db_path", "data/queue/jobs.sqlite")),
+            worker_processes=params.get("worker_processes", 1),
+            worker_concurrency=params.get("worker_concurrency", 4),
+            poll_interval=params.get("poll_interval", 0.5),
+            rate_limit_per_minute=params.get("rate_limit_per_minute", 0),
+            max_active_per_user=params.get("max_active_per_user", 0),
+            max_attempts=params.get("max_attempts", 2),
+            lease_seconds=params.get("lease_seconds", 120),
+            default_priority=params.get("default_priority", 0)
+        )
@@ -0,0 +1,238 @@
+import logging
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Optional
+
+from src.Imagecaption.constants import CONFIG_FILE_PATH, PARAMS_FILE_PATH
+from src.Imagecaption.config.configuration import ConfigurationManager
+
+logger = logging.getLogger(__name__)
+
+
+class AppContext:
+    """Long-lived holder for parsed configuration, provider clients and components.
+
+    Configuration is parsed once (and optionally re-read when the YAML files
+    change), each provider gets one pooled HTTP client with keep-alive, and
+    components are built once per configuration version and handed to the
+    pipelines, so a request only pays for the model calls.
+    """
+
+    def __init__(self, config_path: Path = CONFIG_FILE_PATH, params_path: Path = PARAMS_FILE_PATH,
+                 auto_reload: Optional[bool] = None):
+        self.config_path = Path(config_path)
+        self.params_path = Path(params_path)
+        self._lock = threading.RLock()
+        self._clients: Dict[str, object] = {}
+        self._async_clients: Dict[str, object] = {}
+        self._components: Dict[str, object] = {}
+        self._last_check = 0.0
+        self._load()
+
+        settings = self._config_manager.config.get("app_context", {})
+        self.auto_reload = settings.get("auto_reload", False) if auto_reload is None else auto_reload
+        self.reload_check_interval = settings.get("reload_check_interval", 2)
+
+    def _mtimes(self) -> tuple:
+        return tuple(path.stat().st_mtime if path.exists() else 0.0 for path in (self.config_path, self.params_path))
+
+    def _load(self):
+        self._config_manager = ConfigurationManager(str(self.config_path), str(self.params_path))
+        self._loaded_mtimes = self._mtimes()
+        self._components = {}
+
+    def reload(self):
+        with self._lock:
+            logger.info("Reloading configuration")
+            self._load()
+
+    def _maybe_reload(self):
+        if not self.auto_reload:
+            return
+        now = time.monotonic()
+        if now - self._last_check < self.reload_check_interval:
+            return
+        self._last_check = now
+        if self._mtimes() != self._loaded_mtimes:
+            self.reload()
+
+    @property
+    def config_manager(self) -> ConfigurationManager:
+        self._maybe_reload()
+        return self._config_manager
+
+    def _component(self, name: str, factory):
+        self._maybe_reload()
+        component = self._components.get(name)
+        if component is None:
+            with self._lock:
+                component = self._components.get(name)
+                if component is None:
+                    component = factory()
+                    self._components[name] = component
+        return component
+
+    def together_client(self):
+        with self._lock:
+            client = self._clients.get("together")
+            if client is None:
+                import httpx
+                from together import Together
+
+                provider = self._config_manager.get_provider_config("together")
+                # Retries belong to the resilience layer; SDK retries would multiply them
+                client = self._resilient(Together(
+                    api_key=provider.api_key,
+                    base_url=provider.base_url,
+                    timeout=provider.timeout,
+                    max_retries=0,
+                    http_client=httpx.Client(limits=self._limits(provider), timeout=provider.timeout)
+                ))
+                self._clients["together"] = client
+        return client
+
+    def async_together_client(self):
+        # Async connection pools are bound to the event loop that first uses them
+        with self._lock:
+            client = self._async_clients.get("together")
+            if client is None:
+                import httpx
+                from together import AsyncTogether
+
+                provider = self._config_manager.get_provider_config("together")
+                client = self._resilient(AsyncTogether(
+                    api_key=provider.api_key,
+                    base_url=provider.base_url,
+                    timeout=provider.timeout,
+                    max_retries=0,
+                    http_client=httpx.AsyncClient(limits=self._limits(provider), timeout=provider.timeout)
+                ), asynchronous=True)
+                self._async_clients["together"] = client
+        return client
+
+    def _resilient(self, client, asynchronous: bool = False):
+        from src.Imagecaption.utils.resilience import AsyncResilientClient, ResilientClient, get_rate_controller
+
+        config = self._config_manager.get_resilience_config()
+        wrapper = AsyncResilientClient if asynchronous else ResilientClient
+        return wrapper(client, get_rate_controller("together", config), config)
+
+    @staticmethod
+    def _limits(provider):
+        import httpx
+        return httpx.Limits(
+            max_connections=provider.max_connections,
+            max_keepalive_connections=provider.max_keepalive_connections,
+            keepalive_expiry=provider.keepalive_expiry
+        )
+
+    def artifact_store(self):
+        from src.Imagecaption.utils.artifacts import build_artifact_store
+        return self._component("artifact_store", lambda: build_artifact_store(self._config_manager.get_artifact_config()))
+
+    def data_ingestion(self):
+        from src.Imagecaption.components.data_ingestion import DataIngestion
+        return self._component(
+            "data_ingestion",
+            lambda: DataIngestion(
+                self._config_manager.get_data_ingestion_config(),
+                store=self.artifact_store(),
+                hash_index=self.near_duplicate_index()
+            )
+        )
+
+    def uploads(self):
+        from src.Imagecaption.components.uploads import ChunkedUploads
+        return self._component(
+            "uploads",
+            lambda: ChunkedUploads(self._config_manager.get_upload_config(), self.data_ingestion())
+        )
+
+    def image_captioning(self):
+        from src.Imagecaption.components.image_captioning import ImageCaptioning
+        return self._component(
+            "image_captioning",
+            lambda: ImageCaptioning(
+                self._config_manager.get_image_captioning_config(),
+                client=self.together_client(),
+                store=self.artifact_store()
+            )
+        )
+
+    def story_generation(self):
+        from src.Imagecaption.components.story_generation import StoryGeneration
+        return self._component(
+            "story_generation",
+            lambda: StoryGeneration(
+                self._config_manager.get_story_generation_config(),
+                client=self.together_client(),
+                store=self.artifact_store()
+            )
+        )
+
+    def result_cache(self):
+        from src.Imagecaption.utils.cache import get_result_cache
+        return self._component("result_cache", lambda: get_result_cache(self._config_manager.get_cache_config()))
+
+    def near_duplicate_index(self):
+        # None when disabled, so callers skip hashing altogether
+        config = self._config_manager.get_near_duplicate_config()
+        if not config.enabled:
+            return None
+        from src.Imagecaption.utils.near_duplicates import get_near_duplicate_index
+        return self._component("near_duplicate_index", lambda: get_near_duplicate_index(config))
+
+    def job_queue(self):
+        from src.Imagecaption.utils.job_queue import get_job_queue
+        return self._component("job_queue", lambda: get_job_queue(self._config_manager.get_job_queue_config()))
+
+    async def aclose(self):
+        # Preferred from async code: the clients' pools are closed on the loop that used them
+        with self._lock:
+            async_clients = list(self._async_clients.values())
+            self._async_clients.clear()
+        for client in async_clients:
+            await client.close()
+        self.close()
+
+    def close(self):
+        with self._lock:
+            for client in self._clients.values():
+                client.close()
+            self._clients.clear()
+            async_clients = list(self._async_clients.values())
+            self._async_clients.clear()
+            self._components.clear()
+        for client in async_clients:
+            _close_async_client(client)
+
+
+def _close_async_client(client):
+    import asyncio
+
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        loop = None
+    try:
+        if loop is not None:
+            loop.create_task(client.close())
+        else:
+            asyncio.run(client.close())
+    except Exception as e:
+        # A pool bound to an event loop that has already closed cannot be shut down cleanly
+        logger.warning(f"Could not close async provider client: {e}")
+
+
+_context: Optional[AppContext] = None
+_context_lock = threading.Lock()
+
+
+def get_app_context() -> AppContext:
+    global _context
+    if _context is None:
+        with _context_lock:
+            if _context is None:
+                _context = AppContext()
+    return _context
@@ -1,16 +1,30 @@
-from dataclasses import dataclass
+from dataclasses import dataclass, field, fields
 from pathlib import Path
-from typing import List
+from typing import Dict, List, Optional, Union, get_args, get_origin, get_type_hints
 
-@dataclass(frozen=True)
+@dataclass(frozen=True, slots=True)
 class DataIngestionConfig:
     raw_data_dir: Path
     ingested_data_dir: Path
     allowed_extensions: List[str]
     max_file_size: int
     resize_shape: tuple
+    persist_ingested: bool = True
+    preprocess_mode: str = "process"
+    preprocess_workers: int = 2
+    preprocess_max_pending: int = 16
+    preprocess_submit_timeout: float = 5.0
+    resample_preset: str = "balanced"
+    output_format: str = "JPEG"
+    output_quality: int = 85
 
-@dataclass(frozen=True)
+@dataclass(frozen=True, slots=True)
+class EncodingProfile:
+    max_side: int = 512
+    format: str = "JPEG"
+    quality: int = 80
+
+@dataclass(frozen=True, slots=True)
 class ImageCaptioningConfig:
     ingested_data_dir: Path
     captions_dir: Path
@@ -18,8 +32,26 @@ class ImageCaptioningConfig:
     max_new_tokens: int
     task_prompt: str
     num_beams: int
+    local_model_name: str = "microsoft/Florence-2-base-ft"
+    revision_id: str = "main"
+    warmup_local_model: bool = False
+    batch_size: int = 8
+    batch_wait_ms: float = 20.0
+    remote_backend: str = "together"
+    mock_base_url: str = "http://127.0.0.1:8765/v1"
+    local_fallback: bool = True
+    request_timeout: float = 30.0
+    hedge_after_ms: float = 0.0
+    breaker_failure_threshold: int = 5
+    breaker_reset_seconds: float = 30.0
+    remote_max_tokens: int = 160
+    inference_engine: str = "eager"
+    num_threads: int = 0
+    onnx_dir: Path = Path("artifacts/onnx")
+    encoding: EncodingProfile = EncodingProfile()
+    image_url_base: Optional[str] = None
 
-@dataclass(frozen=True)
+@dataclass(frozen=True, slots=True)
 class StoryGenerationConfig:
     captions_dir: Path
     stories_dir: Path
@@ -30,4 +62,142 @@ class StoryGenerationConfig:
     top_p: float
     story_prompt_template: str
     default_theme: str = "adventure"
-    default_word_limit: int = 400
\ No newline at end of file
+    default_word_limit: int = 400
+    tokens_per_word: float = 1.35
+    token_headroom: float = 0.15
+    min_tokens: int = 64
+    max_tokens_ceiling: int = 2048
+    word_limit_tolerance: float = 0.1
+    variant_concurrency: int = 4
+    use_n_for_samples: bool = True
+    max_variants: int = 4
+
+@dataclass(frozen=True, slots=True)
+class CacheConfig:
+    enabled: bool
+    backend: str
+    db_path: Path
+    max_entries: int
+    ttl_seconds: float
+
+@dataclass(frozen=True, slots=True)
+class NearDuplicateConfig:
+    enabled: bool
+    db_path: Path
+    hash_kind: str = "dhash"
+    max_distance: int = 6
+    retention_seconds: float = 0
+    prune_interval_seconds: float = 3600
+
+@dataclass(frozen=True, slots=True)
+class UploadConfig:
+    uploads_dir: Path
+    max_file_size: int = 50 * 1024 * 1024
+    chunk_size: int = 1024 * 1024
+    max_chunk_size: int = 8 * 1024 * 1024
+    stale_after_seconds: float = 86400
+    ingest_workers: int = 2
+
+@dataclass(frozen=True, slots=True)
+class OrchestratorConfig:
+    ingestion_concurrency: int
+    captioning_concurrency: int
+    story_concurrency: int
+    thread_pool_workers: int
+
+@dataclass(frozen=True, slots=True)
+class ProviderConfig:
+    name: str
+    api_key: str
+    base_url: Optional[str]
+    max_connections: int
+    max_keepalive_connections: int
+    keepalive_expiry: float
+    timeout: float
+
+@dataclass(frozen=True, slots=True)
+class MetricsConfig:
+    serve: bool
+    host: str
+    port: int
+
+@dataclass(frozen=True, slots=True)
+class LoggingConfig:
+    level: str = "INFO"
+    log_file: Path = Path("logs/running_logs.log")
+    file_format: str = "json"
+    console_format: str = "text"
+    max_bytes: int = 10 * 1024 * 1024
+    backup_count: int = 5
+    queue_size: int = 10000
+    module_levels: Dict[str, str] = field(default_factory=dict)
+    sample_every: Dict[str, int] = field(default_factory=dict)
+
+@dataclass(frozen=True, slots=True)
+class ArtifactConfig:
+    raw_dir: Path
+    ingested_dir: Path
+    captions_dir: Path
+    stories_dir: Path
+    shard_depth: int = 2
+    retention_seconds: float = 0
+    gc_interval_seconds: float = 3600
+
+@dataclass(frozen=True, slots=True)
+class JobQueueConfig:
+    enabled: bool
+    db_path: Path
+    worker_processes: int = 1
+    worker_concurrency: int = 4
+    poll_interval: float = 0.5
+    rate_limit_per_minute: int = 0
+    max_active_per_user: int = 0
+    max_attempts: int = 2
+    lease_seconds: float = 120
+    default_priority: int = 0
+
+@dataclass(frozen=True, slots=True)
+class ResilienceConfig:
+    max_retries: int = 3
+    backoff_base: float = 0.5
+    backoff_max: float = 20.0
+    requests_per_minute: float = 600
+    burst: float = 10
+    model_requests_per_minute: Dict[str, float] = field(default_factory=dict)
+    initial_concurrency: int = 8
+    min_concurrency: int = 1
+    max_concurrency: int = 32
+    caption_deadline: float = 60
+    story_deadline: float = 150
+
+
+def _matches(value, hint) -> bool:
+    origin = get_origin(hint)
+    if origin is Union:
+        return any(_matches(value, arg) for arg in get_args(hint))
+    if origin is list:
+        (item,) = get_args(hint)
+        return isinstance(value, list) and all(_matches(v, item) for v in value)
+    if origin is dict:
+        key, item = get_args(hint)
+        return isinstance(value, dict) and all(_matches(k, key) and _matches(v, item) for k, v in value.items())
+    if hint is type(None):
+        return value is None
+    if hint is float:
+        # YAML writes whole numbers as ints
+        return isinstance(value, (int, float)) and not isinstance(value, bool)
+    if hint is int:
+        return isinstance(value, int) and not isinstance(value, bool)
+    return isinstance(value, hint)
+
+
+def validate_config(config):
+    # Checked once when ConfigurationManager builds the object, instead of on every helper call
+    hints = get_type_hints(type(config))
+    for f in fields(config):
+        value = getattr(config, f.name)
+        if not _matches(value, hints[f.name]):
+            raise TypeError(
+                f"{type(config).__name__}.{f.name} should be {hints[f.name]}, got {type(value).__name__}: {value!r}"
+            )
+    return config
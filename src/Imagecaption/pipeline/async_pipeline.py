@@ -0,0 +1,173 @@
+import asyncio
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from src.Imagecaption import setup_logging
+from src.Imagecaption.config.context import AppContext, get_app_context
+from src.Imagecaption.components.image_captioning import ImageCaptioning
+from src.Imagecaption.components.story_generation import StoryGeneration
+from src.Imagecaption.pipeline.image_captioning_pipeline import ImageCaptioningPipeline
+from src.Imagecaption.utils.artifacts import request_id_from
+from src.Imagecaption.utils.logs import log_context
+from src.Imagecaption.utils.resilience import request_deadline
+
+logger = logging.getLogger(__name__)
+STAGE_NAME = "Async Story Pipeline"
+
+
+@dataclass
+class StoryRequest:
+    image_path: Path
+    theme: Optional[str] = None
+    word_limit: Optional[int] = None
+
+
+@dataclass
+class StoryResult:
+    request: StoryRequest
+    ingested_path: Optional[Path] = None
+    caption: Optional[str] = None
+    story: Optional[str] = None
+    error: Optional[str] = None
+    timings: Dict[str, float] = field(default_factory=dict)
+
+
+class AsyncStoryPipeline:
+    """Runs ingestion -> captioning -> story for many requests concurrently.
+
+    Each stage has its own concurrency bound: ingestion runs PIL work on a
+    thread pool, the two remote stages use the async Together client. Use one
+    instance per event loop; the context's pooled async client is bound to the
+    loop that first uses it.
+    """
+
+    def __init__(self, context: Optional[AppContext] = None):
+        context = context or get_app_context()
+        config_manager = context.config_manager
+        self.config = config_manager.get_orchestrator_config()
+        self.resilience = config_manager.get_resilience_config()
+        self.data_ingestion = context.data_ingestion()
+        # Own instances for the async client, but the shared store, so paths and retention match the sync pipelines
+        self.image_captioner = ImageCaptioning(
+            config_manager.get_image_captioning_config(),
+            client=context.together_client(),
+            async_client=context.async_together_client(),
+            store=context.artifact_store()
+        )
+        self.story_generator = StoryGeneration(
+            config_manager.get_story_generation_config(),
+            client=context.together_client(),
+            async_client=context.async_together_client(),
+            store=context.artifact_store()
+        )
+        self.cache = context.result_cache()
+        self.captions = ImageCaptioningPipeline(context, self.image_captioner)
+
+        self._executor = ThreadPoolExecutor(
+            max_workers=self.config.thread_pool_workers,
+            thread_name_prefix="ingestion"
+        )
+        self._ingestion_slots = asyncio.Semaphore(self.config.ingestion_concurrency)
+        self._captioning_slots = asyncio.Semaphore(self.config.captioning_concurrency)
+        self._story_slots = asyncio.Semaphore(self.config.story_concurrency)
+
+    async def _run_in_pool(self, func, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._executor, func, *args)
+
+    async def ingest(self, image_path: Path) -> Path:
+        async with self._ingestion_slots:
+            return await self._run_in_pool(self.data_ingestion.ingest, Path(image_path))
+
+    async def caption(self, ingested_path: Path) -> str:
+        image_bytes = await self._run_in_pool(ingested_path.read_bytes)
+        lookup = await self._run_in_pool(self.captions.lookup, image_bytes, ingested_path, request_id_from(ingested_path))
+        if lookup.caption is not None:
+            return lookup.caption
+
+        async with self._captioning_slots:
+            with request_deadline(self.resilience.caption_deadline):
+                caption, backend = await self.image_captioner.acaption_image(ingested_path)
+        return self.captions.store(lookup, caption, backend)
+
+    async def generate_story(self, caption_file: Path, theme=None, word_limit=None) -> str:
+        caption, from_file = self.story_generator.read_caption(caption_file)
+        cache_key = self.story_generator.cache_key(caption, theme, word_limit)
+        story = self.cache.get(cache_key)
+        if story is not None:
+            logger.info("Story cache hit")
+            if from_file:
+                self.story_generator.save_story(caption_file, story)
+            return story
+
+        async with self._story_slots:
+            with request_deadline(self.resilience.story_deadline):
+                story = await self.story_generator.agenerate_story(caption_file, theme, word_limit)
+        self.cache.set(cache_key, story)
+        return story
+
+    async def run_one(self, request: StoryRequest) -> StoryResult:
+        # Each gathered task runs in its own context copy, so the fields stay per request
+        with log_context(image=Path(request.image_path).name) as log_fields:
+            return await self._run_one(request, log_fields)
+
+    async def _run_one(self, request: StoryRequest, log_fields: dict) -> StoryResult:
+        result = StoryResult(request=request)
+        try:
+            start = time.perf_counter()
+            result.ingested_path = await self.ingest(request.image_path)
+            log_fields["request_id"] = request_id_from(result.ingested_path)
+            result.timings["ingestion"] = time.perf_counter() - start
+
+            start = time.perf_counter()
+            result.caption = await self.caption(result.ingested_path)
+            result.timings["captioning"] = time.perf_counter() - start
+
+            start = time.perf_counter()
+            caption_file = self.image_captioner.caption_path(result.ingested_path)
+            result.story = await self.generate_story(caption_file, request.theme, request.word_limit)
+            result.timings["story"] = time.perf_counter() - start
+        except Exception as e:
+            logger.exception(f"Request for {request.image_path} failed: {e}")
+            result.error = str(e)
+        return result
+
+    async def run_many(self, requests: List[StoryRequest]) -> List[StoryResult]:
+        return await asyncio.gather(*(self.run_one(request) for request in requests))
+
+    def close(self):
+        self._executor.shutdown(wait=False)
+
+
+async def run_requests(requests: List[StoryRequest]) -> List[StoryResult]:
+    pipeline = AsyncStoryPipeline()
+    try:
+        return await pipeline.run_many(requests)
+    finally:
+        pipeline.close()
+
+
+if __name__ == '__main__':
+    setup_logging()
+    import sys
+
+    if len(sys.argv) < 4:
+        print("Usage: python -m src.Imagecaption.pipeline.async_pipeline <theme> <word_limit> <image> [<image> ...]")
+        sys.exit(1)
+
+    theme, word_limit = sys.argv[1], int(sys.argv[2])
+    requests = [StoryRequest(Path(path), theme, word_limit) for path in sys.argv[3:]]
+
+    try:
+        logger.info(f">>>>>> stage {STAGE_NAME} started <<<<<<")
+        results = asyncio.run(run_requests(requests))
+        for result in results:
+            status = f"failed: {result.error}" if result.error else f"{len(result.story)} characters"
+            logger.info(f"{result.request.image_path}: {status}")
+        logger.info(f">>>>>> stage {STAGE_NAME} completed <<<<<<\n\nx==========x")
+    except Exception as e:
+        logger.exception(e)
+        raise e
@@ -0,0 +1,195 @@
+import argparse
+import csv
+import hashlib
+import json
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass, asdict
+from pathlib import Path
+from typing import Iterable, List, Optional, Set
+
+from src.Imagecaption import setup_logging
+from src.Imagecaption.config.context import AppContext, get_app_context
+from src.Imagecaption.pipeline.image_captioning_pipeline import ImageCaptioningPipeline
+from src.Imagecaption.utils.artifacts import request_id_from
+from src.Imagecaption.utils.common import is_allowed_file
+from src.Imagecaption.utils.logs import log_context
+from src.Imagecaption.utils.metrics import metrics
+from src.Imagecaption.utils.resilience import request_deadline
+
+logger = logging.getLogger(__name__)
+STAGE_NAME = "Batch Processing stage"
+
+
+@dataclass
+class BatchItem:
+    image_path: str
+    theme: str
+    word_limit: int
+
+    @property
+    def item_id(self) -> str:
+        key = f"{Path(self.image_path).resolve()}|{self.theme}|{self.word_limit}"
+        return hashlib.sha1(key.encode("utf-8")).hexdigest()[:16]
+
+
+def load_items(source: Path, default_theme: str, default_word_limit: int,
+               allowed_extensions: List[str]) -> List[BatchItem]:
+    if source.is_dir():
+        return [
+            BatchItem(str(path), default_theme, default_word_limit)
+            for path in sorted(source.iterdir())
+            if path.is_file() and is_allowed_file(path.name, allowed_extensions)
+        ]
+
+    if source.suffix.lower() == ".csv":
+        with open(source, newline="", encoding="utf-8") as f:
+            rows = list(csv.DictReader(f))
+    elif source.suffix.lower() in (".jsonl", ".ndjson"):
+        with open(source, encoding="utf-8") as f:
+            rows = [json.loads(line) for line in f if line.strip()]
+    else:
+        raise ValueError(f"Unsupported manifest type: {source.suffix} (expected a directory, .csv or .jsonl)")
+
+    items = []
+    for row in rows:
+        # Relative image paths in a manifest are resolved against the manifest's folder
+        image_path = Path(row["image_path"])
+        if not image_path.is_absolute():
+            image_path = source.parent / image_path
+        items.append(BatchItem(
+            image_path=str(image_path),
+            theme=row.get("theme") or default_theme,
+            word_limit=int(row.get("word_limit") or default_word_limit)
+        ))
+    return items
+
+
+def load_checkpoint(output_path: Path) -> Set[str]:
+    # The output file doubles as the checkpoint: finished items are skipped on rerun
+    done = set()
+    if not output_path.exists():
+        return done
+    with open(output_path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue  # Partially written last line from an interrupted run
+            if record.get("status") == "ok":
+                done.add(record["item_id"])
+    return done
+
+
+class BatchPipeline:
+    def __init__(self, workers: int = 4, context: Optional[AppContext] = None):
+        context = context or get_app_context()
+        self.workers = workers
+        self.data_ingestion = context.data_ingestion()
+        self.image_captioner = context.image_captioning()
+        self.story_generator = context.story_generation()
+        self.ingestion_config = self.data_ingestion.config
+        self.story_config = self.story_generator.config
+        self.cache = context.result_cache()
+        self.captions = ImageCaptioningPipeline(context, self.image_captioner)
+        self.resilience = context.config_manager.get_resilience_config()
+        self._write_lock = threading.Lock()
+
+    def process_item(self, item: BatchItem) -> dict:
+        with log_context(item_id=item.item_id) as log_fields:
+            return self._process_item(item, log_fields)
+
+    def _process_item(self, item: BatchItem, log_fields: dict) -> dict:
+        record = {"item_id": item.item_id, **asdict(item), "timings": {}}
+        timings = record["timings"]
+        try:
+            start = time.perf_counter()
+            ingested_path = self.data_ingestion.ingest(Path(item.image_path))
+            log_fields["request_id"] = request_id_from(ingested_path)
+            timings["ingestion"] = round(time.perf_counter() - start, 4)
+
+            start = time.perf_counter()
+            lookup = self.captions.lookup(ingested_path.read_bytes(), ingested_path, log_fields["request_id"])
+            caption = lookup.caption
+            if caption is None:
+                with request_deadline(self.resilience.caption_deadline):
+                    caption, backend = self.image_captioner.caption_image(ingested_path)
+                self.captions.store(lookup, caption, backend)
+            timings["captioning"] = round(time.perf_counter() - start, 4)
+
+            start = time.perf_counter()
+            caption_file = self.image_captioner.caption_path(ingested_path)
+            cache_key = self.story_generator.cache_key(caption, item.theme, item.word_limit)
+            story = self.cache.get(cache_key)
+            if story is None:
+                with request_deadline(self.resilience.story_deadline):
+                    story = self.story_generator.generate_story(caption_file, item.theme, item.word_limit)
+                self.cache.set(cache_key, story)
+            else:
+                self.story_generator.save_story(caption_file, story)
+            timings["story"] = round(time.perf_counter() - start, 4)
+
+            record.update(status="ok", ingested_path=str(ingested_path), caption=caption, story=story)
+        except Exception as e:
+            logger.error(f"Batch item {item.image_path} failed: {e}")
+            record.update(status="error", error=str(e))
+        timings["total"] = round(sum(timings.values()), 4)
+        return record
+
+    def _write_record(self, output_file, record: dict):
+        with self._write_lock:
+            output_file.write(json.dumps(record, ensure_ascii=False) + "\n")
+            output_file.flush()
+
+    def run(self, items: Iterable[BatchItem], output_path: Path) -> dict:
+        output_path.parent.mkdir(parents=True, exist_ok=True)
+        done = load_checkpoint(output_path)
+        pending = [item for item in items if item.item_id not in done]
+        logger.info(f"Batch: {len(done)} item(s) already done, {len(pending)} to process with {self.workers} worker(s)")
+
+        summary = {"skipped": len(done), "ok": 0, "error": 0}
+        with open(output_path, "a", encoding="utf-8") as output_file, \
+                ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="batch") as pool:
+            futures = [pool.submit(self.process_item, item) for item in pending]
+            for future in as_completed(futures):
+                record = future.result()
+                self._write_record(output_file, record)
+                summary[record["status"]] += 1
+        logger.info(f"Batch finished: {summary}")
+        return summary
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Generate stories for a directory or manifest of images.")
+    parser.add_argument("source", type=Path, help="Directory of images, or a .csv/.jsonl manifest with image_path, theme, word_limit")
+    parser.add_argument("-o", "--output", type=Path, default=Path("data/batch/results.jsonl"), help="JSONL results file (also used as checkpoint)")
+    parser.add_argument("--theme", default=None, help="Theme for items without one")
+    parser.add_argument("--word-limit", type=int, default=None, help="Word limit for items without one")
+    parser.add_argument("--workers", type=int, default=4, help="Number of items processed concurrently")
+    parser.add_argument("--metrics-json", type=Path, default=None, help="Write per-stage latency/counter summary to this file")
+    return parser.parse_args(argv)
+
+
+if __name__ == '__main__':
+    setup_logging()
+    args = parse_args()
+
+    try:
+        logger.info(f">>>>>> stage {STAGE_NAME} started <<<<<<")
+        pipeline = BatchPipeline(workers=args.workers)
+        items = load_items(
+            args.source,
+            args.theme or pipeline.story_config.default_theme,
+            args.word_limit or pipeline.story_config.default_word_limit,
+            pipeline.ingestion_config.allowed_extensions
+        )
+        pipeline.run(items, args.output)
+        if args.metrics_json:
+            args.metrics_json.write_text(metrics.summary_json(), encoding="utf-8")
+            logger.info(f"Metrics summary written to {args.metrics_json}")
+        logger.info(f">>>>>> stage {STAGE_NAME} completed <<<<<<\n\nx==========x")
+    except Exception as e:
+        logger.exception(e)
+        raise e
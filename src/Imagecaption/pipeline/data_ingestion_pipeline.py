@@ -1,27 +1,32 @@
 import logging
 from pathlib import Path
 
-from src.Imagecaption.config.configuration import ConfigurationManager
-from src.Imagecaption.components.data_ingestion import DataIngestion
+from src.Imagecaption import setup_logging
+from src.Imagecaption.config.context import get_app_context
 
 logger = logging.getLogger(__name__)
 STAGE_NAME = "Data Ingestion stage"
 
 
 class DataIngestionPipeline:
-    def __init__(self):
-        pass
+    def __init__(self, context=None):
+        self.context = context or get_app_context()
 
     def main(self, file_path: Path):
-        config = ConfigurationManager()
-        data_ingestion_config = config.get_data_ingestion_config()
-        data_ingestion = DataIngestion(config=data_ingestion_config)
+        data_ingestion = self.context.data_ingestion()
         ingested_path = data_ingestion.ingest(file_path)
         logger.info(f"Ingested and preprocessed image saved at: {ingested_path}")
         return ingested_path
 
+    def main_bytes(self, data, filename: str):
+        data_ingestion = self.context.data_ingestion()
+        ingested = data_ingestion.ingest_bytes(data, filename)
+        logger.info(f"Ingested and preprocessed image {ingested.name} in memory")
+        return ingested
+
 
 if __name__ == '__main__':
+    setup_logging()
     import sys
 
     if len(sys.argv) != 2:
@@ -1,23 +1,145 @@
 import logging
+from dataclasses import dataclass
 from pathlib import Path
-from src.Imagecaption.config.configuration import ConfigurationManager
-from src.Imagecaption.components.image_captioning import ImageCaptioning
+from typing import List, Optional
+from src.Imagecaption import setup_logging
+from src.Imagecaption.config.context import get_app_context
+from src.Imagecaption.components.local_model import florence2_registry
+from src.Imagecaption.utils.artifacts import request_id_from
+from src.Imagecaption.utils.cache import caption_cache_key
+from src.Imagecaption.utils.logs import log_context
+from src.Imagecaption.utils.metrics import metrics
+from src.Imagecaption.utils.resilience import request_deadline
 
 logger = logging.getLogger(__name__)
 STAGE_NAME = "Image Captioning Stage"
 
+@dataclass
+class CaptionLookup:
+    """Where a caption would be cached; ``caption`` is set when the cache or a near-duplicate had one."""
+    cache_key: str
+    request_id: str
+    value_hash: Optional[int] = None
+    caption: Optional[str] = None
+
+
 class ImageCaptioningPipeline:
-    def __init__(self):
-        pass
+    def __init__(self, context=None, image_captioner=None):
+        self.context = context or get_app_context()
+        # The async pipeline passes its own captioner (async clients); everything else shares the context's
+        self._image_captioner = image_captioner
+
+    @property
+    def image_captioner(self):
+        return self._image_captioner or self.context.image_captioning()
+
+    def deadline(self) -> float:
+        return self.context.config_manager.get_resilience_config().caption_deadline
+
+    def _variant_key(self, index) -> str:
+        return index.variant_key(self.image_captioner.model_name, self.image_captioner.prompt)
+
+    def _near_duplicate(self, index, value_hash: int, name) -> Optional[str]:
+        match = index.nearest(self._variant_key(index), value_hash)
+        if match is None:
+            return None
+        metrics.incr("caption_near_duplicate_hits_total")
+        logger.info(f"Near-duplicate of {match.request_id} (distance {match.distance}); reusing its caption for {name}")
+        return match.caption
+
+    def _remember(self, index, value_hash: int, caption: str, request_id: str):
+        try:
+            index.add_caption(self._variant_key(index), value_hash, caption, request_id)
+        except Exception as e:
+            logger.warning(f"Could not index caption for {request_id}: {e}")
+
+    def lookup(self, data: bytes, image_path, request_id: str, value_hash: Optional[int] = None) -> CaptionLookup:
+        # Exact cache first, then a near-duplicate's caption; either is saved next to image_path
+        image_captioner = self.image_captioner
+        cache = self.context.result_cache()
+        lookup = CaptionLookup(caption_cache_key(data, image_captioner.model_name, image_captioner.prompt), request_id)
+        caption = cache.get(lookup.cache_key)
+        if caption is not None:
+            logger.info(f"Caption cache hit for {image_path}")
+            image_captioner.save_caption(Path(image_path), caption)
+            lookup.caption = caption
+            return lookup
+
+        index = self.context.near_duplicate_index()
+        if index is not None:
+            # Ingestion recorded the hash of the pre-encode thumbnail; other paths are hashed here
+            if value_hash is None:
+                value_hash = index.hash_for(request_id)
+            lookup.value_hash = value_hash if value_hash is not None else index.hash_bytes(data)
+            caption = self._near_duplicate(index, lookup.value_hash, image_path)
+            if caption is not None:
+                image_captioner.save_caption(Path(image_path), caption)
+                cache.set(lookup.cache_key, caption)
+                lookup.caption = caption
+        return lookup
+
+    def store(self, lookup: CaptionLookup, caption: str, backend: str) -> str:
+        # The key names the remote model, so a fallback caption would pin lower-quality text under it
+        if not self.image_captioner.is_primary(backend):
+            logger.info(f"Caption from {backend} fallback not cached")
+            return caption
+        self.context.result_cache().set(lookup.cache_key, caption)
+        index = self.context.near_duplicate_index()
+        if index is not None and lookup.value_hash is not None:
+            self._remember(index, lookup.value_hash, caption, lookup.request_id)
+        return caption
 
     def main(self, image_path: Path):
-        config = ConfigurationManager().get_image_captioning_config()
-        image_captioner = ImageCaptioning(config)
-        caption = image_captioner.caption_image(image_path)
-        logger.info(f"Image caption generated: {caption}")
+        with log_context(request_id=request_id_from(image_path)):
+            return self._main(image_path)
+
+    def _main(self, image_path: Path):
+        lookup = self.lookup(Path(image_path).read_bytes(), image_path, request_id_from(image_path))
+        if lookup.caption is not None:
+            return lookup.caption
+
+        with request_deadline(self.deadline()):
+            caption, backend = self.image_captioner.caption_image(image_path)
+        self.store(lookup, caption, backend)
+        logger.info(f"Image caption generated (length: {len(caption)} characters)")
+        logger.debug(f"Caption: {caption}")
         return caption
 
+    def main_ingested(self, ingested):
+        with log_context(request_id=ingested.request_id):
+            return self._main_ingested(ingested)
+
+    def _main_ingested(self, ingested):
+        lookup = self.lookup(ingested.data, ingested.name, ingested.request_id, ingested.phash)
+        if lookup.caption is not None:
+            return lookup.caption
+
+        with request_deadline(self.deadline()):
+            caption, backend = self.image_captioner.caption_ingested(ingested)
+        self.store(lookup, caption, backend)
+        logger.info(f"Image caption generated (length: {len(caption)} characters)")
+        logger.debug(f"Caption: {caption}")
+        return caption
+
+    def caption_many(self, image_paths: List[Path]) -> List[str]:
+        captions = self.image_captioner.caption_images(image_paths)
+        logger.info(f"Generated {len(captions)} image captions")
+        return captions
+
+    @staticmethod
+    def warm_up(force: bool = False):
+        config = get_app_context().config_manager.get_image_captioning_config()
+        if force or config.warmup_local_model:
+            florence2_registry.warm_up(
+                config.local_model_name,
+                config.revision_id,
+                config.inference_engine,
+                config.num_threads,
+                str(config.onnx_dir)
+            )
+
 if __name__ == '__main__':
+    setup_logging()
     try:
         logger.info(f">>>>>> stage {STAGE_NAME} started <<<<<<")
         pipeline = ImageCaptioningPipeline()
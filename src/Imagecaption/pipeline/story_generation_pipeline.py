@@ -1,22 +1,112 @@
 import logging
+from collections import Counter, defaultdict
 from pathlib import Path
-from src.Imagecaption.config.configuration import ConfigurationManager
-from src.Imagecaption.components.story_generation import StoryGeneration
+from typing import List
+from src.Imagecaption import setup_logging
+from src.Imagecaption.config.context import get_app_context
+from src.Imagecaption.components.story_generation import StoryVariant
+from src.Imagecaption.utils.resilience import request_deadline
 
 logger = logging.getLogger(__name__)
 STAGE_NAME = "Story Generation Stage"
 
 class StoryGenerationPipeline:
-    def __init__(self): pass
+    def __init__(self, context=None):
+        self.context = context or get_app_context()
+
+    def deadline(self) -> float:
+        return self.context.config_manager.get_resilience_config().story_deadline
 
     def main(self, caption_file_path: Path, theme=None, word_limit=None):
-        config = ConfigurationManager().get_story_generation_config()
-        story_generator = StoryGeneration(config)
-        story = story_generator.generate_story(caption_file_path, theme, word_limit)
+        cache = self.context.result_cache()
+        story_generator = self.context.story_generation()
+
+        caption, from_file = story_generator.read_caption(caption_file_path)
+        cache_key = story_generator.cache_key(caption, theme, word_limit)
+        story = cache.get(cache_key)
+        if story is not None:
+            logger.info("Story cache hit")
+            if from_file:
+                story_generator.save_story(caption_file_path, story)
+            return story
+
+        with request_deadline(self.deadline()):
+            story = story_generator.generate_story(caption_file_path, theme, word_limit)
+        cache.set(cache_key, story)
         logger.info(f"Story generated (length: {len(story)} characters)")
         return story
 
+    def variants(self, caption_file_path: Path, variants: List[StoryVariant]) -> List[dict]:
+        # One caption, many (theme, word_limit) variants; cached samples are reused per variant
+        cache = self.context.result_cache()
+        story_generator = self.context.story_generation()
+
+        caption, from_file = story_generator.read_caption(caption_file_path)
+        samples = [
+            (*story_generator.resolve(variant.theme, variant.word_limit), index)
+            for variant in variants
+            for index in range(max(1, variant.count))
+        ]
+
+        def cache_key(theme, word_limit, index):
+            # Sample 0 shares its key with a plain main() call for the same variant
+            extra = {"sample": index} if index else {}
+            return story_generator.cache_key(caption, theme, word_limit, **extra)
+
+        stories = [cache.get(cache_key(*sample)) for sample in samples]
+        missing = Counter((theme, word_limit) for (theme, word_limit, _), story in zip(samples, stories) if story is None)
+        logger.info(f"Story variants: {len(samples) - sum(missing.values())} cached, {sum(missing.values())} to generate")
+
+        if missing:
+            with request_deadline(self.deadline()):
+                # The caption text is passed instead of the file so only the combined result is saved
+                generated = story_generator.generate_variants(
+                    caption, [StoryVariant(theme, word_limit, count) for (theme, word_limit), count in missing.items()]
+                )
+            pending = defaultdict(list)
+            for record in generated:
+                pending[(record["theme"], record["word_limit"])].append(record["story"])
+            for i, (theme, word_limit, index) in enumerate(samples):
+                if stories[i] is None:
+                    stories[i] = pending[(theme, word_limit)].pop(0)
+                    cache.set(cache_key(theme, word_limit, index), stories[i])
+
+        results = [
+            {"theme": theme, "word_limit": word_limit, "story": story}
+            for (theme, word_limit, _), story in zip(samples, stories)
+        ]
+        if from_file:
+            story_generator.save_variants(caption_file_path, results)
+        return results
+
+    def stream(self, caption_file_path: Path, theme=None, word_limit=None):
+        # A generator cannot own a context variable across yields; callers iterate
+        # inside request_deadline(self.deadline()) instead
+        cache = self.context.result_cache()
+        story_generator = self.context.story_generation()
+
+        caption, from_file = story_generator.read_caption(caption_file_path)
+        cache_key = story_generator.cache_key(caption, theme, word_limit)
+        story = cache.get(cache_key)
+        if story is not None:
+            logger.info("Story cache hit")
+            if from_file:
+                story_generator.save_story(caption_file_path, story)
+            yield story
+            return
+
+        chunks = []
+        for chunk in story_generator.stream_story(caption_file_path, theme, word_limit):
+            chunks.append(chunk)
+            yield chunk
+
+        # Only completed streams are cached or saved as the story; a partial one stays in <id>_story.partial.txt
+        story = "".join(chunks).strip()
+        cache.set(cache_key, story)
+        logger.info(f"Story streamed (length: {len(story)} characters)")
+
 if __name__ == "__main__":
+    setup_logging()
     try:
         logger.info(f">>>>>> stage {STAGE_NAME} started <<<<<<")
         pipeline = StoryGenerationPipeline()
@@ -0,0 +1,246 @@
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import signal
+import socket
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Optional
+
+from src.Imagecaption import setup_logging
+from src.Imagecaption.config.context import AppContext, get_app_context
+from src.Imagecaption.components.story_generation import StoryVariant
+from src.Imagecaption.pipeline.image_captioning_pipeline import ImageCaptioningPipeline
+from src.Imagecaption.pipeline.story_generation_pipeline import StoryGenerationPipeline
+from src.Imagecaption.utils.artifacts import request_id_from
+from src.Imagecaption.utils.job_queue import Job
+from src.Imagecaption.utils.logs import log_context
+from src.Imagecaption.utils.metrics import metrics
+from src.Imagecaption.utils.resilience import request_deadline
+
+logger = logging.getLogger(__name__)
+STAGE_NAME = "Worker stage"
+
+
+class JobCancelled(Exception):
+    """Raised inside a running job once the queue no longer holds its lease."""
+
+
+class JobWorker:
+    """Claims jobs from the queue and runs captioning and story generation for them.
+
+    ``concurrency`` threads poll the queue; a heartbeat thread renews the lease
+    of every running job and flags jobs that were cancelled (or re-leased after
+    a stall) so their model calls are abandoned.
+    """
+
+    def __init__(self, context: Optional[AppContext] = None, concurrency: Optional[int] = None,
+                 worker_id: Optional[str] = None):
+        self.context = context or get_app_context()
+        self.config = self.context.config_manager.get_job_queue_config()
+        self.queue = self.context.job_queue()
+        self.concurrency = max(1, concurrency or self.config.worker_concurrency)
+        self.worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}"
+        self.caption_pipeline = ImageCaptioningPipeline(self.context)
+        self.story_pipeline = StoryGenerationPipeline(self.context)
+        self._running: Dict[str, threading.Event] = {}
+        self._running_lock = threading.Lock()
+
+    def run_job(self, job: Job, cancelled: threading.Event) -> dict:
+        payload = job.payload
+        ingested_path = Path(payload["ingested_path"])
+        theme, word_limit = payload.get("theme"), payload.get("word_limit")
+
+        self.queue.set_progress(job.id, {"stage": "captioning"})
+        caption = self.caption_pipeline.main(ingested_path)
+        if cancelled.is_set():
+            raise JobCancelled(job.id)
+
+        caption_file = self.context.image_captioning().caption_path(ingested_path)
+        progress = {"stage": "story", "caption": caption, "story": ""}
+        self.queue.set_progress(job.id, progress)
+        if payload.get("variants"):
+            with request_deadline(self.story_pipeline.deadline()):
+                results = self.story_pipeline.variants(
+                    caption_file, [StoryVariant(theme, word_limit) for theme, word_limit in payload["variants"]]
+                )
+            return {"caption": caption, "variants": results, "caption_path": str(caption_file)}
+
+        story, last_update = "", time.monotonic()
+        stream = self.story_pipeline.stream(caption_file, theme, word_limit)
+        try:
+            with request_deadline(self.story_pipeline.deadline()):
+                for chunk in stream:
+                    if cancelled.is_set():
+                        raise JobCancelled(job.id)
+                    story += chunk
+                    # Partial story for the front end, throttled so SQLite is not written per token
+                    if time.monotonic() - last_update >= self.config.poll_interval:
+                        progress["story"] = story
+                        self.queue.set_progress(job.id, progress)
+                        last_update = time.monotonic()
+        finally:
+            stream.close()
+
+        return {
+            "caption": caption,
+            "story": story.strip(),
+            "caption_path": str(caption_file),
+            "story_path": str(self.context.story_generation().story_path(caption_file))
+        }
+
+    def _execute(self, job: Job):
+        cancelled = threading.Event()
+        with self._running_lock:
+            self._running[job.id] = cancelled
+        with log_context(job_id=job.id, request_id=request_id_from(job.payload.get("ingested_path", ""))):
+            logger.info(f"Worker {self.worker_id} started job {job.id} (attempt {job.attempts})")
+            try:
+                with metrics.span("worker.job"):
+                    result = self.run_job(job, cancelled)
+                if self.queue.complete(job.id, self.worker_id, result):
+                    logger.info(f"Job {job.id} done")
+                else:
+                    logger.warning(f"Job {job.id} finished after its lease passed to another worker; result dropped")
+            except JobCancelled:
+                logger.info(f"Job {job.id} cancelled")
+            except Exception as e:
+                logger.error(f"Job {job.id} failed: {e}")
+                # Bad input fails for good; anything else (timeouts, provider errors) may be retried
+                self.queue.fail(job.id, self.worker_id, str(e), retry=not isinstance(e, ValueError))
+            finally:
+                with self._running_lock:
+                    self._running.pop(job.id, None)
+
+    def _poll_loop(self, stop: threading.Event):
+        while not stop.is_set():
+            try:
+                job = self.queue.claim(self.worker_id)
+            except Exception as e:
+                logger.warning(f"Claim failed: {e}")
+                job = None
+            if job is None:
+                stop.wait(self.config.poll_interval)
+                continue
+            self._execute(job)
+
+    def _heartbeat_loop(self, stop: threading.Event):
+        interval = max(1.0, self.config.lease_seconds / 4)
+        while not stop.wait(interval):
+            with self._running_lock:
+                running = list(self._running.items())
+            for job_id, cancelled in running:
+                if not self.queue.heartbeat(job_id, self.worker_id):
+                    cancelled.set()
+
+    def run(self, stop: Optional[threading.Event] = None):
+        stop = stop or threading.Event()
+        threads = [threading.Thread(target=self._heartbeat_loop, args=(stop,), name="worker-heartbeat", daemon=True)]
+        threads += [
+            threading.Thread(target=self._poll_loop, args=(stop,), name=f"worker-{i}", daemon=True)
+            for i in range(self.concurrency)
+        ]
+        for thread in threads:
+            thread.start()
+        logger.info(f"Worker {self.worker_id} polling with concurrency {self.concurrency}")
+        # Running jobs finish before the process exits
+        for thread in threads:
+            thread.join()
+        logger.info(f"Worker {self.worker_id} stopped")
+
+
+def _install_stop_handlers(stop: threading.Event):
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(sig, lambda *_: stop.set())
+
+
+def _worker_main(index: int, concurrency: Optional[int]):
+    # Entry point of a spawned worker process; each builds its own context and queue connection
+    setup_logging()
+    stop = threading.Event()
+    _install_stop_handlers(stop)
+    JobWorker(concurrency=concurrency, worker_id=f"{socket.gethostname()}:{os.getpid()}:{index}").run(stop)
+
+
+def run_workers(processes: int, concurrency: Optional[int] = None):
+    if processes <= 1:
+        _worker_main(0, concurrency)
+        return
+    # spawn: the parent may already hold SQLite connections and HTTP pools
+    ctx = multiprocessing.get_context("spawn")
+    workers = [ctx.Process(target=_worker_main, args=(i, concurrency), name=f"imagecaption-worker-{i}")
+               for i in range(processes)]
+    for worker in workers:
+        worker.start()
+    logger.info(f"Started {processes} worker process(es)")
+    try:
+        for worker in workers:
+            worker.join()
+    except KeyboardInterrupt:
+        # Children got the same SIGINT and finish their running jobs
+        for worker in workers:
+            worker.join()
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Run queue workers, or submit and inspect story jobs.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run = commands.add_parser("run", help="Start worker processes")
+    run.add_argument("--processes", type=int, default=None, help="Worker processes (default: params.yaml)")
+    run.add_argument("--concurrency", type=int, default=None, help="Concurrent jobs per process (default: params.yaml)")
+
+    submit = commands.add_parser("submit", help="Ingest an image and enqueue a story job")
+    submit.add_argument("image", type=Path)
+    submit.add_argument("--theme", default=None)
+    submit.add_argument("--word-limit", type=int, default=None)
+    submit.add_argument("--priority", type=int, default=None)
+    submit.add_argument("--user", default="cli")
+
+    status = commands.add_parser("status", help="Show a job, or queue counts when no job ID is given")
+    status.add_argument("job_id", nargs="?")
+
+    cancel = commands.add_parser("cancel", help="Cancel a queued or running job")
+    cancel.add_argument("job_id")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    setup_logging()
+    args = parse_args()
+    context = get_app_context()
+    queue_config = context.config_manager.get_job_queue_config()
+
+    try:
+        if args.command == "run":
+            logger.info(f">>>>>> stage {STAGE_NAME} started <<<<<<")
+            run_workers(args.processes or queue_config.worker_processes, args.concurrency)
+            logger.info(f">>>>>> stage {STAGE_NAME} completed <<<<<<\n\nx==========x")
+        elif args.command == "submit":
+            story_config = context.config_manager.get_story_generation_config()
+            ingested_path = context.data_ingestion().ingest(args.image)
+            job_id = context.job_queue().enqueue(
+                {
+                    "ingested_path": str(ingested_path),
+                    "theme": args.theme or story_config.default_theme,
+                    "word_limit": args.word_limit or story_config.default_word_limit
+                },
+                user_id=args.user,
+                priority=queue_config.default_priority if args.priority is None else args.priority
+            )
+            print(job_id)
+        elif args.command == "status":
+            queue = context.job_queue()
+            if args.job_id:
+                job = queue.get(args.job_id)
+                print(json.dumps(vars(job) if job else None, indent=2, ensure_ascii=False))
+            else:
+                print(json.dumps(queue.stats(), indent=2))
+        elif args.command == "cancel":
+            print("cancelled" if context.job_queue().cancel(args.job_id) else "not cancellable")
+    except Exception as e:
+        logger.exception(e)
+        raise e
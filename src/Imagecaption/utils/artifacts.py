@@ -0,0 +1,180 @@
+import hashlib
+import logging
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Optional
+
+from src.Imagecaption.utils.common import create_unique_filename
+from src.Imagecaption.utils.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# File name per artifact kind; {id} is the request ID, {ext} the image extension
+ARTIFACT_NAMES = {
+    "raw": "{id}{ext}",
+    "ingested": "{id}{ext}",
+    "caption": "{id}_caption.txt",
+    "story": "{id}_story.txt",
+    "variants": "{id}_variants.json",
+}
+
+_TMP_SUFFIX = ".tmp"
+
+
+def request_id_from(path) -> str:
+    # Recovers the request ID from any artifact path, including pre-store names (resized_<stem>)
+    stem = Path(path).stem
+    for suffix in ("_caption", "_story.partial", "_story", "_variants"):
+        if stem.endswith(suffix):
+            stem = stem[:-len(suffix)]
+    if stem.startswith("resized_"):
+        stem = stem[len("resized_"):]
+    return stem
+
+
+class ArtifactStore:
+    """Request-scoped storage for raw uploads, ingested images, captions and stories.
+
+    Every request gets a unique ID (``<name>_<timestamp>_<uuid8>``), so concurrent
+    uploads of ``image.png`` never share files. Files are written to a temporary
+    name and renamed into place, optionally under ``shard_depth`` levels of
+    two-hex-digit directories so no single directory grows past a few thousand
+    entries. ``gc`` deletes artifacts older than ``retention_seconds``.
+    """
+
+    def __init__(self, roots: Dict[str, Path], shard_depth: int = 0, retention_seconds: float = 0,
+                 gc_interval_seconds: float = 3600):
+        self.roots = {kind: Path(root) for kind, root in roots.items()}
+        self.shard_depth = max(0, int(shard_depth))
+        self.retention_seconds = retention_seconds
+        self.gc_interval_seconds = gc_interval_seconds
+        self._last_gc = time.monotonic()
+        self._gc_lock = threading.Lock()
+
+    def root(self, kind: str) -> Path:
+        if kind not in self.roots:
+            raise KeyError(f"Artifact kind not configured: {kind}")
+        return self.roots[kind]
+
+    def new_request_id(self, original_filename: str) -> str:
+        # A legacy prefix in the upload name would be stripped again by request_id_from
+        name = Path(original_filename).name
+        if name.startswith("resized_"):
+            name = name[len("resized_"):]
+        unique_filename = create_unique_filename(name, self.roots.get("raw", Path(".")))
+        return Path(unique_filename).stem
+
+    def shard(self, request_id: str) -> Path:
+        if not self.shard_depth:
+            return Path()
+        digest = hashlib.sha1(request_id.encode("utf-8")).hexdigest()
+        return Path(*(digest[2 * i:2 * i + 2] for i in range(self.shard_depth)))
+
+    def path(self, kind: str, request_id: str, ext: str = "") -> Path:
+        name = ARTIFACT_NAMES[kind].format(id=request_id, ext=ext)
+        return self.root(kind) / self.shard(request_id) / name
+
+    def path_for(self, kind: str, artifact_path, ext: str = "") -> Path:
+        return self.path(kind, request_id_from(artifact_path), ext)
+
+    @contextmanager
+    def open_atomic(self, path: Path, mode: str = "w", partial_path: Optional[Path] = None):
+        # Readers see either the previous file or the complete new one, never a partial write.
+        # With partial_path, an interrupted write is kept there instead of being deleted.
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_name(f".{path.name}.{uuid.uuid4().hex[:8]}{_TMP_SUFFIX}")
+        encoding = None if "b" in mode else "utf-8"
+        try:
+            with open(tmp_path, mode, encoding=encoding) as f:
+                yield f
+            os.replace(tmp_path, path)
+        except BaseException:
+            if partial_path is not None:
+                os.replace(tmp_path, partial_path)
+            else:
+                tmp_path.unlink(missing_ok=True)
+            raise
+        if partial_path is not None:
+            # A completed write supersedes what an earlier interrupted attempt left behind
+            Path(partial_path).unlink(missing_ok=True)
+        self.maybe_gc()
+
+    def write_bytes(self, path: Path, data: bytes) -> Path:
+        with self.open_atomic(path, "wb") as f:
+            f.write(data)
+        return Path(path)
+
+    def write_text(self, path: Path, text: str) -> Path:
+        with self.open_atomic(path, "w") as f:
+            f.write(text)
+        return Path(path)
+
+    def maybe_gc(self):
+        # Opportunistic: at most one background sweep per interval, triggered by writes
+        if not self.retention_seconds or time.monotonic() - self._last_gc < self.gc_interval_seconds:
+            return
+        if not self._gc_lock.acquire(blocking=False):
+            return
+        self._last_gc = time.monotonic()
+
+        def run():
+            try:
+                self.gc()
+            except Exception as e:
+                logger.warning(f"Artifact GC failed: {e}")
+            finally:
+                self._gc_lock.release()
+
+        threading.Thread(target=run, name="artifact-gc", daemon=True).start()
+
+    def gc(self, retention_seconds: Optional[float] = None) -> int:
+        retention = self.retention_seconds if retention_seconds is None else retention_seconds
+        if not retention:
+            return 0
+        cutoff = time.time() - retention
+        # Orphaned temp files from crashed writers go after an hour regardless of retention
+        tmp_cutoff = time.time() - min(retention, 3600)
+        removed = 0
+        for root in set(self.roots.values()):
+            if not root.exists():
+                continue
+            for dirpath, dirnames, filenames in os.walk(root, topdown=False):
+                for filename in filenames:
+                    file_path = Path(dirpath) / filename
+                    try:
+                        mtime = file_path.stat().st_mtime
+                        limit = tmp_cutoff if filename.endswith(_TMP_SUFFIX) else cutoff
+                        if mtime < limit:
+                            file_path.unlink()
+                            removed += 1
+                    except FileNotFoundError:
+                        continue
+                # Empty shard directories are pruned; the configured roots are kept
+                if Path(dirpath) != root:
+                    try:
+                        os.rmdir(dirpath)
+                    except OSError:
+                        pass
+        metrics.incr("artifacts_deleted_total", removed)
+        logger.info(f"Artifact GC removed {removed} file(s) older than {retention}s")
+        return removed
+
+
+def build_artifact_store(config) -> ArtifactStore:
+    return ArtifactStore(
+        {
+            "raw": config.raw_dir,
+            "ingested": config.ingested_dir,
+            "caption": config.captions_dir,
+            "story": config.stories_dir,
+            "variants": config.stories_dir,
+        },
+        shard_depth=config.shard_depth,
+        retention_seconds=config.retention_seconds,
+        gc_interval_seconds=config.gc_interval_seconds
+    )
@@ -0,0 +1,226 @@
+import hashlib
+import json
+import logging
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, Optional
+
+from src.Imagecaption.utils.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+
+def make_cache_key(namespace: str, **parts) -> str:
+    # bytes are hashed as-is, everything else through a canonical JSON encoding
+    digest = hashlib.sha256(namespace.encode("utf-8"))
+    for name in sorted(parts):
+        value = parts[name]
+        digest.update(b"\x00" + name.encode("utf-8") + b"\x00")
+        if isinstance(value, (bytes, bytearray, memoryview)):
+            digest.update(bytes(value))
+        else:
+            digest.update(json.dumps(value, sort_keys=True, default=str).encode("utf-8"))
+    return f"{namespace}:{digest.hexdigest()}"
+
+
+def caption_cache_key(image_bytes: bytes, model_name: str, prompt: str) -> str:
+    return make_cache_key("caption", image=hashlib.sha256(image_bytes).digest(), model=model_name, prompt=prompt)
+
+
+def story_cache_key(caption: str, theme, word_limit, **sampling_params) -> str:
+    return make_cache_key("story", caption=caption, theme=theme, word_limit=word_limit, sampling=sampling_params)
+
+
+class CacheBackend(ABC):
+    @abstractmethod
+    def get(self, key: str) -> Optional[str]:
+        ...
+
+    @abstractmethod
+    def set(self, key: str, value: str):
+        ...
+
+    @abstractmethod
+    def delete(self, key: str):
+        ...
+
+    @abstractmethod
+    def clear(self):
+        ...
+
+    @abstractmethod
+    def __len__(self) -> int:
+        ...
+
+
+class MemoryLRUBackend(CacheBackend):
+    def __init__(self, max_entries: int = 1024, ttl_seconds: Optional[float] = None):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._data: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            value, stored_at = item
+            if self.ttl_seconds and time.time() - stored_at > self.ttl_seconds:
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: str):
+        with self._lock:
+            self._data[key] = (value, time.time())
+            self._data.move_to_end(key)
+            while self.max_entries and len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def delete(self, key: str):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+class SQLiteBackend(CacheBackend):
+    def __init__(self, db_path: Path, max_entries: int = 100000, ttl_seconds: Optional[float] = None):
+        self.db_path = Path(db_path)
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.db_path), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS cache ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, "
+            "stored_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_cache_accessed ON cache(accessed_at)")
+        self._conn.commit()
+
+    def get(self, key: str) -> Optional[str]:
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute("SELECT value, stored_at FROM cache WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            value, stored_at = row
+            if self.ttl_seconds and now - stored_at > self.ttl_seconds:
+                self._conn.execute("DELETE FROM cache WHERE key = ?", (key,))
+                self._conn.commit()
+                return None
+            self._conn.execute("UPDATE cache SET accessed_at = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+            return value
+
+    def set(self, key: str, value: str):
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO cache (key, value, stored_at, accessed_at) VALUES (?, ?, ?, ?)",
+                (key, value, now, now)
+            )
+            self._evict(now)
+            self._conn.commit()
+
+    def _evict(self, now: float):
+        if self.ttl_seconds:
+            self._conn.execute("DELETE FROM cache WHERE stored_at < ?", (now - self.ttl_seconds,))
+        if self.max_entries:
+            self._conn.execute(
+                "DELETE FROM cache WHERE key IN ("
+                "SELECT key FROM cache ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,)
+            )
+
+    def delete(self, key: str):
+        with self._lock:
+            self._conn.execute("DELETE FROM cache WHERE key = ?", (key,))
+            self._conn.commit()
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM cache")
+            self._conn.commit()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM cache").fetchone()[0]
+
+
+class ResultCache:
+    def __init__(self, backend: CacheBackend, enabled: bool = True):
+        self.backend = backend
+        self.enabled = enabled
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[str]:
+        if not self.enabled:
+            return None
+        try:
+            value = self.backend.get(key)
+        except Exception as e:
+            # A broken cache must never fail the request; treat as a miss
+            logger.warning(f"Cache lookup failed for {key}: {e}")
+            value = None
+        with self._lock:
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        metrics.incr("cache_requests_total", namespace=key.split(":", 1)[0], result="miss" if value is None else "hit")
+        return value
+
+    def set(self, key: str, value: str):
+        if not self.enabled:
+            return
+        try:
+            self.backend.set(key, value)
+        except Exception as e:
+            logger.warning(f"Cache store failed for {key}: {e}")
+
+    def stats(self) -> Dict[str, float]:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "entries": len(self.backend),
+        }
+
+
+_caches: Dict[tuple, ResultCache] = {}
+_caches_lock = threading.Lock()
+
+
+def get_result_cache(config) -> ResultCache:
+    # Shared per process so counters and the SQLite connection are reused across requests
+    key = (config.backend, str(config.db_path), config.max_entries, config.ttl_seconds, config.enabled)
+    with _caches_lock:
+        cache = _caches.get(key)
+        if cache is None:
+            if config.backend == "sqlite":
+                backend = SQLiteBackend(config.db_path, config.max_entries, config.ttl_seconds)
+            elif config.backend == "memory":
+                backend = MemoryLRUBackend(config.max_entries, config.ttl_seconds)
+            else:
+                raise ValueError(f"Unknown cache backend: {config.backend}")
+            cache = ResultCache(backend, enabled=config.enabled)
+            _caches[key] = cache
+    return cache
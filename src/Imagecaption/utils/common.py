@@ -2,24 +2,32 @@ import os
 import sys
 import yaml
 import json
-import joblib
 import base64
 from pathlib import Path
-from typing import Any, Optional, Union
-from PIL import Image
+from typing import Any, Callable, Dict, Optional, Union
 import logging
-from ensure import ensure_annotations
 from box import ConfigBox
 from box.exceptions import BoxValueError
 
 logger = logging.getLogger(__name__)
 
-@ensure_annotations
+# ensure's per-call argument introspection costs more than most of these helpers do,
+# so it only runs when IMAGECAPTION_CHECK_TYPES is set (read once, at import); configuration
+# values are type-checked once instead, when ConfigurationManager builds them
+CHECK_TYPES = os.getenv("IMAGECAPTION_CHECK_TYPES", "").lower() in ("1", "true", "yes")
+
+def check_annotations(func):
+    if not CHECK_TYPES:
+        return func
+    from ensure import ensure_annotations
+    return ensure_annotations(func)
+
+@check_annotations
 def read_yaml(path_to_yaml: Path) -> ConfigBox:
     try:
         with open(path_to_yaml) as yaml_file:
             content = yaml.safe_load(yaml_file)
-            logger.info(f"yaml file: {path_to_yaml} loaded successfully")
+            logger.debug(f"yaml file: {path_to_yaml} loaded successfully")
             return ConfigBox(content)
     except BoxValueError:
         raise ValueError("yaml file is empty")
@@ -27,53 +35,74 @@ def read_yaml(path_to_yaml: Path) -> ConfigBox:
         logger.error(f"Error reading yaml file {path_to_yaml}: {str(e)}")
         raise e
 
-@ensure_annotations
+# Extra secret lookups consulted before the environment, e.g. Streamlit secrets
+# registered by app.py; the package itself never imports Streamlit
+_secret_sources: Dict[str, Callable[[str], Optional[str]]] = {}
+
+def register_secret_source(name: str, source: Callable[[str], Optional[str]]):
+    # Keyed by name so re-registering (Streamlit reruns app.py) replaces rather than stacks
+    _secret_sources[name] = source
+
+@check_annotations
+def get_secret(name: str, default: str = "") -> str:
+    for source in _secret_sources.values():
+        try:
+            value = source(name)
+        except Exception:
+            value = None
+        if value:
+            return value
+    return os.getenv(name, default)
+
+@check_annotations
 def create_directories(path_to_directories: list):
     for path in path_to_directories:
         path.mkdir(parents=True, exist_ok=True)
-        logger.info(f"Created directory at: {path}")
+        logger.debug(f"Created directory at: {path}")
 
-@ensure_annotations
+@check_annotations
 def save_json(path: Path, data: dict):
     try:
         with open(path, "w") as f:
             json.dump(data, f, indent=4)
-        logger.info(f"json file saved at: {path}")
+        logger.debug(f"json file saved at: {path}")
     except Exception as e:
         logger.error(f"Error saving json file {path}: {str(e)}")
         raise e
 
-@ensure_annotations
+@check_annotations
 def load_json(path: Path) -> ConfigBox:
     try:
         with open(path) as f:
             content = json.load(f)
-        logger.info(f"json file loaded successfully from: {path}")
+        logger.debug(f"json file loaded successfully from: {path}")
         return ConfigBox(content)
     except Exception as e:
         logger.error(f"Error loading json file {path}: {str(e)}")
         raise e
 
-@ensure_annotations
+@check_annotations
 def save_bin(data: Any, path: Path):
+    import joblib
     try:
         joblib.dump(value=data, filename=path)
-        logger.info(f"Binary file saved at: {path}")
+        logger.debug(f"Binary file saved at: {path}")
     except Exception as e:
         logger.error(f"Error saving binary file {path}: {str(e)}")
         raise e
 
-@ensure_annotations
+@check_annotations
 def load_bin(path: Path) -> Any:
+    import joblib
     try:
         data = joblib.load(path)
-        logger.info(f"Binary file loaded from: {path}")
+        logger.debug(f"Binary file loaded from: {path}")
         return data
     except Exception as e:
         logger.error(f"Error loading binary file {path}: {str(e)}")
         raise e
 
-@ensure_annotations
+@check_annotations
 def get_size(path: Path) -> str:
     try:
         size_in_kb = round(os.path.getsize(path) / 1024)
@@ -82,19 +111,21 @@ def get_size(path: Path) -> str:
         logger.error(f"Error getting file size for {path}: {str(e)}")
         return "Size unknown"
 
-@ensure_annotations
+@check_annotations
 def validate_image(image_path: Path) -> bool:
+    from PIL import Image
     try:
         with Image.open(image_path) as img:
             img.verify()
-        logger.info(f"Image validation successful for: {image_path}")
+        logger.debug(f"Image validation successful for: {image_path}")
         return True
     except Exception as e:
         logger.error(f"Image validation failed for {image_path}: {str(e)}")
         return False
 
-@ensure_annotations
+@check_annotations
 def resize_image(image_path: Path, max_size: tuple = (512, 512)) -> Path:
+    from PIL import Image
     try:
         with Image.open(image_path) as img:
             # Convert to RGB if necessary
@@ -103,45 +134,45 @@ def resize_image(image_path: Path, max_size: tuple = (512, 512)) -> Path:
             img.thumbnail(max_size, Image.Resampling.LANCZOS)
             resized_path = image_path.parent / f"resized_{image_path.name}"
             img.save(resized_path, "JPEG", quality=85)
-        logger.info(f"Image resized and saved at: {resized_path}")
+        logger.debug(f"Image resized and saved at: {resized_path}")
         return resized_path
     except Exception as e:
         logger.error(f"Error resizing image {image_path}: {str(e)}")
         raise e
 
-@ensure_annotations
+@check_annotations
 def encode_image_to_base64(image_path: Path) -> str:
     try:
         with open(image_path, "rb") as image_file:
             encoded_string = base64.b64encode(image_file.read()).decode('utf-8')
-        logger.info(f"Image encoded to base64: {image_path}")
+        logger.debug(f"Image encoded to base64: {image_path}")
         return encoded_string
     except Exception as e:
         logger.error(f"Error encoding image to base64 {image_path}: {str(e)}")
         raise e
 
-@ensure_annotations
+@check_annotations
 def clean_filename(filename: str) -> str:
     import re
     cleaned = re.sub(r'[^\w\-_\.]', '_', filename)
-    logger.info(f"Filename cleaned: {filename} -> {cleaned}")
+    logger.debug(f"Filename cleaned: {filename} -> {cleaned}")
     return cleaned
 
-@ensure_annotations
+@check_annotations
 def ensure_dir_exists(directory: Path):
     try:
         directory.mkdir(parents=True, exist_ok=True)
-        logger.info(f"Directory ensured: {directory}")
+        logger.debug(f"Directory ensured: {directory}")
     except Exception as e:
         logger.error(f"Error creating directory {directory}: {str(e)}")
         raise e
 
-@ensure_annotations
+@check_annotations
 def delete_file(file_path: Path) -> bool:
     try:
         if file_path.exists():
             file_path.unlink()
-            logger.info(f"File deleted: {file_path}")
+            logger.debug(f"File deleted: {file_path}")
             return True
         else:
             logger.warning(f"File does not exist: {file_path}")
@@ -150,18 +181,27 @@ def delete_file(file_path: Path) -> bool:
         logger.error(f"Error deleting file {file_path}: {str(e)}")
         return False
 
-@ensure_annotations
+@check_annotations
+def sniff_image_mime(data: bytes) -> str:
+    # Ingested files can carry the upload's extension, so the content decides the type
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+        return "image/webp"
+    if data[:8] == b"\x89PNG\r\n\x1a\n":
+        return "image/png"
+    return "image/jpeg"
+
+@check_annotations
 def get_file_extension(filename: str) -> str:
     return Path(filename).suffix.lower()
 
-@ensure_annotations
+@check_annotations
 def is_allowed_file(filename: str, allowed_extensions: list) -> bool:
     extension = get_file_extension(filename)
     allowed = extension.lstrip('.') in [ext.lower().lstrip('.') for ext in allowed_extensions]
-    logger.info(f"File extension check for {filename}: {allowed}")
+    logger.debug(f"File extension check for {filename}: {allowed}")
     return allowed
 
-@ensure_annotations
+@check_annotations
 def create_unique_filename(original_filename: str, upload_dir: Path) -> str:
     import time
     import uuid
@@ -174,5 +214,5 @@ def create_unique_filename(original_filename: str, upload_dir: Path) -> str:
     while (upload_dir / unique_filename).exists():
         unique_filename = f"{name}_{timestamp}_{unique_id}_{counter}{ext}"
         counter += 1
-    logger.info(f"Unique filename created: {unique_filename}")
+    logger.debug(f"Unique filename created: {unique_filename}")
     return unique_filename
@@ -0,0 +1,261 @@
+import json
+import logging
+import sqlite3
+import threading
+import time
+import uuid
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+from src.Imagecaption.utils.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+JOB_STATUSES = ("queued", "running", "done", "failed", "cancelled")
+
+
+class RateLimitExceeded(RuntimeError):
+    """Raised by ``enqueue`` when a user is over their submission or in-flight limit."""
+
+
+@dataclass
+class Job:
+    id: str
+    user_id: str
+    priority: int
+    status: str
+    payload: Dict[str, Any]
+    progress: Dict[str, Any] = field(default_factory=dict)
+    result: Optional[Dict[str, Any]] = None
+    error: Optional[str] = None
+    attempts: int = 0
+    created_at: float = 0.0
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+
+    @property
+    def finished(self) -> bool:
+        return self.status in ("done", "failed", "cancelled")
+
+
+class JobQueue:
+    """SQLite-backed job broker shared by the web front end and worker processes.
+
+    Jobs are claimed highest priority first, then oldest first, inside an
+    ``IMMEDIATE`` transaction so two workers never take the same job. A claim
+    is a lease: workers heartbeat while running, and a job whose lease expired
+    (its worker died) is handed to the next worker until ``max_attempts``.
+    """
+
+    def __init__(self, db_path: Path, rate_limit_per_minute: int = 0, max_active_per_user: int = 0,
+                 max_attempts: int = 2, lease_seconds: float = 60.0):
+        self.db_path = Path(db_path)
+        self.rate_limit_per_minute = rate_limit_per_minute
+        self.max_active_per_user = max_active_per_user
+        self.max_attempts = max(1, int(max_attempts))
+        self.lease_seconds = lease_seconds
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        # isolation_level=None: transactions are explicit so claims can use BEGIN IMMEDIATE
+        self._conn = sqlite3.connect(str(self.db_path), check_same_thread=False, isolation_level=None, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            "id TEXT PRIMARY KEY, user_id TEXT NOT NULL, priority INTEGER NOT NULL, status TEXT NOT NULL, "
+            "payload TEXT NOT NULL, progress TEXT NOT NULL DEFAULT '{}', result TEXT, error TEXT, "
+            "attempts INTEGER NOT NULL DEFAULT 0, worker_id TEXT, lease_until REAL, "
+            "created_at REAL NOT NULL, started_at REAL, finished_at REAL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_claim ON jobs(status, priority DESC, created_at)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_user ON jobs(user_id, created_at)")
+
+    @staticmethod
+    def _row_to_job(row) -> Job:
+        return Job(
+            id=row[0],
+            user_id=row[1],
+            priority=row[2],
+            status=row[3],
+            payload=json.loads(row[4]),
+            progress=json.loads(row[5] or "{}"),
+            result=json.loads(row[6]) if row[6] else None,
+            error=row[7],
+            attempts=row[8],
+            created_at=row[9],
+            started_at=row[10],
+            finished_at=row[11]
+        )
+
+    _COLUMNS = "id, user_id, priority, status, payload, progress, result, error, attempts, created_at, started_at, finished_at"
+
+    def enqueue(self, payload: Dict[str, Any], user_id: str = "anonymous", priority: int = 0) -> str:
+        now = time.time()
+        job_id = uuid.uuid4().hex
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._check_limits(user_id, now)
+                self._conn.execute(
+                    "INSERT INTO jobs (id, user_id, priority, status, payload, created_at) VALUES (?, ?, ?, 'queued', ?, ?)",
+                    (job_id, user_id, int(priority), json.dumps(payload), now)
+                )
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        metrics.incr("jobs_enqueued_total", priority=priority)
+        logger.info(f"Enqueued job {job_id} for user {user_id} (priority {priority})")
+        return job_id
+
+    def _check_limits(self, user_id: str, now: float):
+        if self.rate_limit_per_minute:
+            recent = self._conn.execute(
+                "SELECT COUNT(*) FROM jobs WHERE user_id = ? AND created_at > ?", (user_id, now - 60)
+            ).fetchone()[0]
+            if recent >= self.rate_limit_per_minute:
+                metrics.incr("jobs_rate_limited_total", reason="rate")
+                raise RateLimitExceeded(f"Rate limit reached: {self.rate_limit_per_minute} requests per minute")
+        if self.max_active_per_user:
+            active = self._conn.execute(
+                "SELECT COUNT(*) FROM jobs WHERE user_id = ? AND status IN ('queued', 'running')", (user_id,)
+            ).fetchone()[0]
+            if active >= self.max_active_per_user:
+                metrics.incr("jobs_rate_limited_total", reason="active")
+                raise RateLimitExceeded(f"Too many requests in progress (limit {self.max_active_per_user})")
+
+    def claim(self, worker_id: str) -> Optional[Job]:
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                # Expired leases of jobs that used up their attempts are failed rather than retried
+                self._conn.execute(
+                    "UPDATE jobs SET status = 'failed', error = 'worker lost (lease expired)', finished_at = ? "
+                    "WHERE status = 'running' AND lease_until < ? AND attempts >= ?",
+                    (now, now, self.max_attempts)
+                )
+                row = self._conn.execute(
+                    f"SELECT {self._COLUMNS} FROM jobs "
+                    "WHERE status = 'queued' OR (status = 'running' AND lease_until < ?) "
+                    "ORDER BY priority DESC, created_at LIMIT 1",
+                    (now,)
+                ).fetchone()
+                if row is None:
+                    self._conn.execute("COMMIT")
+                    return None
+                self._conn.execute(
+                    "UPDATE jobs SET status = 'running', worker_id = ?, lease_until = ?, attempts = attempts + 1, "
+                    "started_at = COALESCE(started_at, ?) WHERE id = ?",
+                    (worker_id, now + self.lease_seconds, now, row[0])
+                )
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        job = self._row_to_job(row)
+        job.status, job.attempts = "running", job.attempts + 1
+        metrics.observe("job_queue_wait_seconds", now - job.created_at)
+        return job
+
+    def _update(self, sql: str, params: tuple) -> int:
+        with self._lock:
+            return self._conn.execute(sql, params).rowcount
+
+    def heartbeat(self, job_id: str, worker_id: str) -> bool:
+        # False means the job was cancelled or re-leased to another worker
+        return self._update(
+            "UPDATE jobs SET lease_until = ? WHERE id = ? AND worker_id = ? AND status = 'running'",
+            (time.time() + self.lease_seconds, job_id, worker_id)
+        ) == 1
+
+    def set_progress(self, job_id: str, progress: Dict[str, Any]):
+        self._update("UPDATE jobs SET progress = ? WHERE id = ?", (json.dumps(progress), job_id))
+
+    def complete(self, job_id: str, worker_id: str, result: Dict[str, Any]) -> bool:
+        # False when the lease expired and another worker owns the job now; its result wins
+        updated = self._update(
+            "UPDATE jobs SET status = 'done', result = ?, error = NULL, finished_at = ? "
+            "WHERE id = ? AND worker_id = ? AND status = 'running'",
+            (json.dumps(result), time.time(), job_id, worker_id)
+        ) == 1
+        if updated:
+            metrics.incr("jobs_finished_total", status="done")
+        return updated
+
+    def fail(self, job_id: str, worker_id: str, error: str, retry: bool = True) -> bool:
+        with self._lock:
+            row = self._conn.execute("SELECT attempts FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            if row is None:
+                return False
+            status = "queued" if retry and row[0] < self.max_attempts else "failed"
+            updated = self._conn.execute(
+                "UPDATE jobs SET status = ?, error = ?, lease_until = NULL, finished_at = ? "
+                "WHERE id = ? AND worker_id = ? AND status = 'running'",
+                (status, error, time.time() if status == "failed" else None, job_id, worker_id)
+            ).rowcount == 1
+        if updated:
+            metrics.incr("jobs_finished_total", status="retry" if status == "queued" else "failed")
+        return updated
+
+    def cancel(self, job_id: str) -> bool:
+        return self._update(
+            "UPDATE jobs SET status = 'cancelled', finished_at = ? WHERE id = ? AND status IN ('queued', 'running')",
+            (time.time(), job_id)
+        ) == 1
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._lock:
+            row = self._conn.execute(f"SELECT {self._COLUMNS} FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return self._row_to_job(row) if row else None
+
+    def position(self, job_id: str) -> int:
+        # Jobs ahead of this one in claim order; 0 once it is running or finished
+        with self._lock:
+            row = self._conn.execute("SELECT status, priority, created_at FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            if row is None or row[0] != "queued":
+                return 0
+            return self._conn.execute(
+                "SELECT COUNT(*) FROM jobs WHERE status = 'queued' AND (priority > ? OR (priority = ? AND created_at < ?))",
+                (row[1], row[1], row[2])
+            ).fetchone()[0]
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            rows = self._conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall()
+        counts = {status: 0 for status in JOB_STATUSES}
+        counts.update(dict(rows))
+        return counts
+
+    def purge(self, older_than_seconds: float) -> int:
+        return self._update(
+            "DELETE FROM jobs WHERE status IN ('done', 'failed', 'cancelled') AND finished_at < ?",
+            (time.time() - older_than_seconds,)
+        )
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+_queues: Dict[tuple, JobQueue] = {}
+_queues_lock = threading.Lock()
+
+
+def get_job_queue(config) -> JobQueue:
+    # One connection per process and setting; every Streamlit session and worker thread shares it
+    key = (str(config.db_path), config.rate_limit_per_minute, config.max_active_per_user,
+           config.max_attempts, config.lease_seconds)
+    with _queues_lock:
+        queue = _queues.get(key)
+        if queue is None:
+            queue = JobQueue(
+                config.db_path,
+                rate_limit_per_minute=config.rate_limit_per_minute,
+                max_active_per_user=config.max_active_per_user,
+                max_attempts=config.max_attempts,
+                lease_seconds=config.lease_seconds
+            )
+            _queues[key] = queue
+    return queue
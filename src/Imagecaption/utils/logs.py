@@ -0,0 +1,179 @@
+import atexit
+import copy
+import itertools
+import json
+import logging
+import logging.handlers
+import queue
+import sys
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Dict, Optional
+
+from src.Imagecaption import logging_str as TEXT_FORMAT
+
+# Fields of the current request (request_id, job_id, ...) plus its stage timings; copied
+# contexts (worker threads, asyncio tasks) share the same timing dict
+_log_context: ContextVar[Optional[dict]] = ContextVar("log_context", default=None)
+
+# Attributes every LogRecord has; anything else on a record came in through ``extra=``
+_RECORD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime", "context"}
+
+
+@contextmanager
+def log_context(**fields):
+    parent = _log_context.get()
+    context = {**(parent or {}), **fields}
+    context["stage_ms"] = parent["stage_ms"] if parent else {}
+    token = _log_context.set(context)
+    try:
+        yield context
+    finally:
+        _log_context.reset(token)
+
+
+def current_log_context() -> dict:
+    return _log_context.get() or {}
+
+
+def record_stage(stage: str, seconds: float):
+    # Called by metrics.span, so every later record of the request carries the timings so far
+    context = _log_context.get()
+    if context is not None:
+        context["stage_ms"][stage] = round(seconds * 1000, 1)
+
+
+class ContextFilter(logging.Filter):
+    """Attaches a snapshot of the request's log context; runs on the calling thread, before queueing."""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        context = _log_context.get()
+        if context:
+            record.context = {**context, "stage_ms": dict(context["stage_ms"])}
+        return True
+
+
+class SamplingFilter(logging.Filter):
+    """Keeps one in every N sub-WARNING records of the configured loggers (by name prefix)."""
+
+    def __init__(self, sample_every: Dict[str, int]):
+        super().__init__()
+        # Longest prefix first, so "src.Imagecaption.utils" can override "src.Imagecaption"
+        self.rules = sorted(
+            ((prefix, max(1, int(every)), itertools.count()) for prefix, every in sample_every.items()),
+            key=lambda rule: -len(rule[0])
+        )
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING:
+            return True
+        for prefix, every, counter in self.rules:
+            if record.name == prefix or record.name.startswith(prefix + "."):
+                return next(counter) % every == 0
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "module": record.module,
+            "process": record.process,
+            "thread": record.threadName,
+            "message": record.getMessage(),
+        }
+        entry.update(getattr(record, "context", None) or {})
+        entry.update({key: value for key, value in vars(record).items() if key not in _RECORD_ATTRS})
+        if record.exc_text:
+            entry["exception"] = record.exc_text
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+class NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """Renders the message on the calling thread and drops records when the queue is full."""
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+        self._exception_formatter = logging.Formatter()
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Arguments may be mutated after the call returns, so they are rendered now;
+        # the listener's formatter still decides the layout
+        record = copy.copy(record)
+        record.message = record.getMessage()
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self._exception_formatter.formatException(record.exc_info)
+        record.msg, record.args, record.exc_info = record.message, None, None
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+            from src.Imagecaption.utils.metrics import metrics
+            metrics.incr("log_records_dropped_total")
+
+
+class _Listener(logging.handlers.QueueListener):
+    def enqueue_sentinel(self):
+        # Shutdown waits for room rather than losing the stop signal to a full queue
+        self.queue.put(self._sentinel)
+
+
+def _formatter(kind: str) -> logging.Formatter:
+    if kind == "json":
+        return JsonFormatter()
+    if kind == "text":
+        return logging.Formatter(TEXT_FORMAT)
+    raise ValueError(f"Unknown log format: {kind}")
+
+
+_listener: Optional[_Listener] = None
+
+
+def configure_logging(config, level: Optional[int] = None) -> NonBlockingQueueHandler:
+    """Routes every record through a bounded queue to a listener thread that owns the file and console handlers."""
+    global _listener
+    log_file = Path(config.log_file)
+    log_file.parent.mkdir(parents=True, exist_ok=True)
+
+    file_handler = logging.handlers.RotatingFileHandler(
+        log_file, maxBytes=config.max_bytes, backupCount=config.backup_count, encoding="utf-8"
+    )
+    file_handler.setFormatter(_formatter(config.file_format))
+    console_handler = logging.StreamHandler(sys.stdout)
+    console_handler.setFormatter(_formatter(config.console_format))
+
+    handler = NonBlockingQueueHandler(queue.Queue(maxsize=config.queue_size))
+    if config.sample_every:
+        handler.addFilter(SamplingFilter(config.sample_every))
+    handler.addFilter(ContextFilter())
+
+    root = logging.getLogger()
+    for existing in list(root.handlers):
+        root.removeHandler(existing)
+    root.addHandler(handler)
+    root.setLevel(level if level is not None else logging.getLevelName(config.level.upper()))
+    for name, module_level in config.module_levels.items():
+        logging.getLogger(name).setLevel(module_level.upper())
+
+    _listener = _Listener(handler.queue, file_handler, console_handler)
+    _listener.start()
+    atexit.register(shutdown_logging)
+    return handler
+
+
+def shutdown_logging():
+    # Flushes queued records; registered with atexit so short CLI runs lose nothing
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        for handler in _listener.handlers:
+            handler.close()
+        _listener = None
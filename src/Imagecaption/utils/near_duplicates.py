@@ -0,0 +1,264 @@
+import hashlib
+import logging
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from src.Imagecaption.utils.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+HASH_KINDS = ("dhash", "phash")
+_SIGN_BIT = 1 << 63
+_MASK = (1 << 64) - 1
+
+
+def hamming(a: int, b: int) -> int:
+    return bin(a ^ b).count("1")
+
+
+def dhash(image) -> int:
+    # Difference hash: 64 brightness gradients of a 9x8 greyscale thumbnail
+    import numpy as np
+    from PIL import Image
+
+    pixels = np.asarray(image.convert("L").resize((9, 8), Image.Resampling.BICUBIC), dtype=np.int16)
+    value = 0
+    for bit in (pixels[:, :-1] > pixels[:, 1:]).flatten():
+        value = (value << 1) | int(bit)
+    return value
+
+
+def phash(image) -> int:
+    # DCT hash: signs of the 8x8 lowest frequencies of a 32x32 thumbnail against their median
+    import numpy as np
+    from PIL import Image
+
+    pixels = np.asarray(image.convert("L").resize((32, 32), Image.Resampling.LANCZOS), dtype=np.float64)
+    n = np.arange(32)
+    basis = np.cos(np.pi * (2 * n[None, :] + 1) * n[:, None] / 64)
+    low = (basis @ pixels @ basis.T)[:8, :8].flatten()
+    median = np.median(low[1:])
+    value = 0
+    for bit in low > median:
+        value = (value << 1) | int(bit)
+    return value
+
+
+def perceptual_hash(image, kind: str = "dhash") -> int:
+    if kind == "dhash":
+        return dhash(image)
+    if kind == "phash":
+        return phash(image)
+    raise ValueError(f"Unknown perceptual hash: {kind}")
+
+
+def hash_image_bytes(data: bytes, kind: str = "dhash") -> int:
+    import io
+    from PIL import Image
+
+    with Image.open(io.BytesIO(data)) as image:
+        image.draft("L", (64, 64))
+        return perceptual_hash(image, kind)
+
+
+class BKTree:
+    """Metric tree over 64-bit hashes; ``search`` only visits subtrees that can hold a match.
+
+    Each node keeps its children keyed by their Hamming distance to it, so by
+    the triangle inequality a query within ``radius`` of some stored hash only
+    needs the children at distances ``d - radius .. d + radius``.
+    """
+
+    def __init__(self):
+        self.root: Optional[list] = None  # [hash, values, {distance: child}]
+        self.size = 0
+
+    def add(self, value_hash: int, value):
+        self.size += 1
+        if self.root is None:
+            self.root = [value_hash, [value], {}]
+            return
+        node = self.root
+        while True:
+            distance = hamming(value_hash, node[0])
+            if distance == 0:
+                node[1].append(value)
+                return
+            child = node[2].get(distance)
+            if child is None:
+                node[2][distance] = [value_hash, [value], {}]
+                return
+            node = child
+
+    def search(self, query: int, radius: int) -> List[Tuple[int, object]]:
+        matches, stack = [], [self.root] if self.root is not None else []
+        while stack:
+            node = stack.pop()
+            distance = hamming(query, node[0])
+            if distance <= radius:
+                matches.extend((distance, value) for value in node[1])
+            for child_distance, child in node[2].items():
+                if distance - radius <= child_distance <= distance + radius:
+                    stack.append(child)
+        return sorted(matches, key=lambda match: match[0])
+
+
+@dataclass
+class NearDuplicate:
+    caption: str
+    distance: int
+    request_id: str
+
+
+class NearDuplicateIndex:
+    """Perceptual hashes of ingested images and the captions generated for them.
+
+    Hashes are recorded at ingestion (by request ID) and captions once they
+    exist. Both live in SQLite; captions are also kept in one in-memory
+    BK-tree per caption variant (hash kind, model, prompt), which picks up rows
+    written by other processes incrementally before each lookup.
+    """
+
+    def __init__(self, db_path: Path, hash_kind: str = "dhash", max_distance: int = 6,
+                 retention_seconds: float = 0, prune_interval_seconds: float = 3600):
+        if hash_kind not in HASH_KINDS:
+            raise ValueError(f"Unknown perceptual hash: {hash_kind}")
+        self.db_path = Path(db_path)
+        self.hash_kind = hash_kind
+        self.max_distance = max_distance
+        self.retention_seconds = retention_seconds
+        self.prune_interval_seconds = prune_interval_seconds
+        self._last_prune = time.monotonic()
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.db_path), check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS image_hashes (request_id TEXT PRIMARY KEY, hash INTEGER NOT NULL, created_at REAL NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS captions (id INTEGER PRIMARY KEY AUTOINCREMENT, variant TEXT NOT NULL, "
+            "hash INTEGER NOT NULL, caption TEXT NOT NULL, request_id TEXT, created_at REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS image_hashes_created ON image_hashes (created_at)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS captions_created ON captions (created_at)")
+        self._conn.commit()
+        self._trees: Dict[str, BKTree] = {}
+        self._last_id = 0
+
+    @staticmethod
+    def _to_sql(value_hash: int) -> int:
+        # SQLite integers are signed 64-bit
+        return value_hash - (1 << 64) if value_hash & _SIGN_BIT else value_hash
+
+    @staticmethod
+    def _from_sql(value: int) -> int:
+        return value & _MASK
+
+    def variant_key(self, model_name: str, prompt: str) -> str:
+        # Captions are only reused for the same hash function, model and prompt
+        return f"{self.hash_kind}:{model_name}:{hashlib.sha1(prompt.encode('utf-8')).hexdigest()[:12]}"
+
+    def record_hash(self, request_id: str, value_hash: int):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO image_hashes (request_id, hash, created_at) VALUES (?, ?, ?)",
+                (request_id, self._to_sql(value_hash), time.time())
+            )
+            self._conn.commit()
+        self.maybe_prune()
+
+    def hash_bytes(self, data: bytes) -> int:
+        return hash_image_bytes(data, self.hash_kind)
+
+    def hash_for(self, request_id: str) -> Optional[int]:
+        with self._lock:
+            row = self._conn.execute("SELECT hash FROM image_hashes WHERE request_id = ?", (request_id,)).fetchone()
+        return self._from_sql(row[0]) if row else None
+
+    def _refresh(self):
+        rows = self._conn.execute(
+            "SELECT id, variant, hash, caption, request_id FROM captions WHERE id > ? ORDER BY id", (self._last_id,)
+        ).fetchall()
+        for row_id, variant, value_hash, caption, request_id in rows:
+            self._trees.setdefault(variant, BKTree()).add(self._from_sql(value_hash), (caption, request_id))
+            self._last_id = row_id
+
+    def add_caption(self, variant: str, value_hash: int, caption: str, request_id: str = ""):
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO captions (variant, hash, caption, request_id, created_at) VALUES (?, ?, ?, ?, ?)",
+                (variant, self._to_sql(value_hash), caption, request_id, time.time())
+            )
+            self._conn.commit()
+            self._refresh()
+        self.maybe_prune()
+
+    def maybe_prune(self):
+        # Triggered by writes, at most once per interval, like the artifact store's GC
+        if not self.retention_seconds or time.monotonic() - self._last_prune < self.prune_interval_seconds:
+            return
+        self._last_prune = time.monotonic()
+        try:
+            self.prune()
+        except Exception as e:
+            logger.warning(f"Near-duplicate index prune failed: {e}")
+
+    def prune(self, older_than: Optional[float] = None) -> int:
+        retention = self.retention_seconds if older_than is None else older_than
+        if not retention:
+            return 0
+        cutoff = time.time() - retention
+        with self._lock:
+            removed = self._conn.execute("DELETE FROM image_hashes WHERE created_at < ?", (cutoff,)).rowcount
+            removed += self._conn.execute("DELETE FROM captions WHERE created_at < ?", (cutoff,)).rowcount
+            self._conn.commit()
+            # BK-trees cannot drop nodes, so they are rebuilt from what is left (also picks up
+            # rows other processes pruned)
+            self._trees, self._last_id = {}, 0
+            self._refresh()
+        if removed:
+            logger.info(f"Pruned {removed} near-duplicate row(s) older than {retention}s")
+        return removed
+
+    def nearest(self, variant: str, value_hash: int, max_distance: Optional[int] = None) -> Optional[NearDuplicate]:
+        radius = self.max_distance if max_distance is None else max_distance
+        start = time.perf_counter()
+        with self._lock:
+            self._refresh()
+            tree = self._trees.get(variant)
+            matches = tree.search(value_hash, radius) if tree is not None else []
+        metrics.observe("stage_seconds", time.perf_counter() - start, stage="captioning.near_duplicate_lookup", status="ok")
+        if not matches:
+            return None
+        distance, (caption, request_id) = matches[0]
+        return NearDuplicate(caption=caption, distance=distance, request_id=request_id)
+
+    def __len__(self) -> int:
+        with self._lock:
+            self._refresh()
+            return sum(tree.size for tree in self._trees.values())
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+_indexes: Dict[tuple, NearDuplicateIndex] = {}
+_indexes_lock = threading.Lock()
+
+
+def get_near_duplicate_index(config) -> NearDuplicateIndex:
+    # One connection and one set of BK-trees per process
+    key = (str(config.db_path), config.hash_kind, config.max_distance)
+    with _indexes_lock:
+        index = _indexes.get(key)
+        if index is None:
+            index = _indexes[key] = NearDuplicateIndex(config.db_path, config.hash_kind, config.max_distance,
+                                                       config.retention_seconds, config.prune_interval_seconds)
+    return index
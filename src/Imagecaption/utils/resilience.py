@@ -0,0 +1,390 @@
+import asyncio
+import email.utils
+import logging
+import random
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from types import SimpleNamespace
+from typing import Dict, Optional
+
+from src.Imagecaption.utils.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# Absolute time.monotonic() by which the current request must finish; None means no deadline
+_deadline: ContextVar[Optional[float]] = ContextVar("request_deadline", default=None)
+
+RETRYABLE_STATUS = {408, 409, 429, 500, 502, 503, 504}
+OVERLOAD_STATUS = {429, 503}
+RETRYABLE_ERRORS = ("APITimeoutError", "APIConnectionError")
+
+
+class DeadlineExceeded(TimeoutError):
+    """Raised when a provider call cannot start or retry within the request deadline."""
+
+
+@contextmanager
+def request_deadline(seconds: Optional[float]):
+    # Nested deadlines can only tighten the outer one. Not for use across yields in a generator.
+    if not seconds or seconds <= 0:
+        yield
+        return
+    deadline = time.monotonic() + seconds
+    current = _deadline.get()
+    token = _deadline.set(deadline if current is None else min(current, deadline))
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+def time_remaining(default: Optional[float] = None) -> Optional[float]:
+    deadline = _deadline.get()
+    if deadline is None:
+        return default
+    left = max(0.0, deadline - time.monotonic())
+    return left if default is None else min(default, left)
+
+
+class TokenBucket:
+    """Requests-per-second limiter; ``reserve`` returns how long the caller must wait."""
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = max(1.0, burst)
+        self.tokens = self.burst
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self, max_wait: Optional[float] = None) -> Optional[float]:
+        # Takes a token now (the balance may go negative, which queues later callers behind
+        # this one); returns None without taking one if the wait would exceed max_wait
+        if self.rate <= 0:
+            return 0.0
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            wait = 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+            if max_wait is not None and wait > max_wait:
+                return None
+            self.tokens -= 1
+            return wait
+
+
+class AIMDLimiter:
+    """Adaptive concurrency limit: +1 per window of successes, halved on overload.
+
+    Decreases are applied at most once per ``decrease_interval`` so a burst of
+    429s from requests that were already in flight counts as one signal.
+    """
+
+    def __init__(self, name: str, initial: int = 8, minimum: int = 1, maximum: int = 32,
+                 backoff_ratio: float = 0.5, decrease_interval: float = 1.0):
+        self.name = name
+        self.minimum = max(1, minimum)
+        self.maximum = max(self.minimum, maximum)
+        self.limit = float(min(self.maximum, max(self.minimum, initial)))
+        self.backoff_ratio = backoff_ratio
+        self.decrease_interval = decrease_interval
+        self.in_flight = 0
+        self._last_decrease = 0.0
+        self._cond = threading.Condition()
+        metrics.set_gauge("provider_concurrency_limit", int(self.limit), model=name)
+
+    def try_acquire(self) -> bool:
+        with self._cond:
+            if self.in_flight < int(self.limit):
+                self.in_flight += 1
+                return True
+            return False
+
+    def acquire(self, timeout: Optional[float] = None) -> bool:
+        with self._cond:
+            if not self._cond.wait_for(lambda: self.in_flight < int(self.limit), timeout=timeout):
+                return False
+            self.in_flight += 1
+            return True
+
+    def release(self, outcome: str = "success"):
+        with self._cond:
+            self.in_flight -= 1
+            if outcome == "success":
+                self.limit = min(self.maximum, self.limit + 1.0 / self.limit)
+            elif outcome == "overload":
+                now = time.monotonic()
+                if now - self._last_decrease >= self.decrease_interval:
+                    self._last_decrease = now
+                    self.limit = max(self.minimum, self.limit * self.backoff_ratio)
+                    logger.warning(f"Provider overloaded, concurrency limit for {self.name} cut to {int(self.limit)}")
+            metrics.set_gauge("provider_concurrency_limit", int(self.limit), model=self.name)
+            self._cond.notify_all()
+
+
+class RateController:
+    """Per-model token buckets and concurrency limiters shared by every client in the process."""
+
+    def __init__(self, config):
+        self.config = config
+        self._buckets: Dict[str, TokenBucket] = {}
+        self._limiters: Dict[str, AIMDLimiter] = {}
+        self._lock = threading.Lock()
+
+    def bucket(self, model: str) -> TokenBucket:
+        with self._lock:
+            bucket = self._buckets.get(model)
+            if bucket is None:
+                rpm = self.config.model_requests_per_minute.get(model, self.config.requests_per_minute)
+                bucket = self._buckets[model] = TokenBucket(rpm / 60.0, self.config.burst)
+        return bucket
+
+    def limiter(self, model: str) -> AIMDLimiter:
+        with self._lock:
+            limiter = self._limiters.get(model)
+            if limiter is None:
+                limiter = self._limiters[model] = AIMDLimiter(
+                    model,
+                    initial=self.config.initial_concurrency,
+                    minimum=self.config.min_concurrency,
+                    maximum=self.config.max_concurrency
+                )
+        return limiter
+
+
+def classify_error(error: BaseException) -> str:
+    # "overload" (shrink concurrency, retry), "retryable" or "fatal"
+    if isinstance(error, DeadlineExceeded):
+        # Our own deadline ran out; the provider was never slow, so it is not an overload signal
+        return "fatal"
+    status = getattr(error, "status_code", None)
+    if status in OVERLOAD_STATUS:
+        return "overload"
+    if type(error).__name__ == "APITimeoutError" or isinstance(error, TimeoutError):
+        return "overload"
+    if status in RETRYABLE_STATUS or type(error).__name__ in RETRYABLE_ERRORS or isinstance(error, ConnectionError):
+        return "retryable"
+    return "fatal"
+
+
+def retry_after_seconds(error: BaseException) -> Optional[float]:
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None)
+    if not headers:
+        return None
+    value = headers.get("retry-after-ms")
+    if value is not None:
+        try:
+            return float(value) / 1000.0
+        except ValueError:
+            pass
+    value = headers.get("retry-after")
+    if value is None:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        # HTTP-date form
+        return max(0.0, email.utils.parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class _Guarded:
+    """Holds a concurrency slot until a streamed response is exhausted or closed."""
+
+    def __init__(self, stream, release):
+        self._stream = stream
+        self._release = release
+
+    def _done(self, outcome: str = "success"):
+        release, self._release = self._release, None
+        if release is not None:
+            release(outcome)
+
+    def __iter__(self):
+        try:
+            yield from self._stream
+        except Exception as e:
+            self._done("overload" if classify_error(e) == "overload" else "error")
+            raise
+        finally:
+            self._done()
+
+    async def __aiter__(self):
+        try:
+            async for chunk in self._stream:
+                yield chunk
+        except Exception as e:
+            self._done("overload" if classify_error(e) == "overload" else "error")
+            raise
+        finally:
+            self._done()
+
+    def close(self):
+        try:
+            if hasattr(self._stream, "close"):
+                self._stream.close()
+        finally:
+            self._done()
+
+    def __getattr__(self, name):
+        return getattr(self._stream, name)
+
+
+class ResilientClient:
+    """Wraps a Together client's ``chat.completions.create`` with rate limiting and retries.
+
+    Each call waits for a token from its model's bucket and a slot under the
+    model's adaptive concurrency limit, then retries overload, timeout and
+    5xx errors with full-jitter exponential backoff (or the server's
+    Retry-After). Attempts never outlive the caller's ``request_deadline``.
+    """
+
+    def __init__(self, client, controller: RateController, config):
+        self.client = client
+        self.controller = controller
+        self.config = config
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    def __getattr__(self, name):
+        return getattr(self.client, name)
+
+    def _backoff(self, attempt: int, error: BaseException) -> float:
+        server_hint = retry_after_seconds(error)
+        if server_hint is not None:
+            return min(server_hint, self.config.backoff_max)
+        return random.uniform(0, min(self.config.backoff_max, self.config.backoff_base * 2 ** attempt))
+
+    def _plan_retry(self, model: str, attempt: int, error: BaseException, kind: str) -> float:
+        # Returns the delay before the next attempt, or raises when the error is final
+        if kind == "fatal" or attempt >= self.config.max_retries:
+            raise error
+        delay = self._backoff(attempt, error)
+        left = time_remaining()
+        if left is not None and delay >= left:
+            metrics.incr("provider_deadline_exceeded_total", model=model)
+            raise DeadlineExceeded(f"No time left to retry {model} after {error!r}") from error
+        metrics.incr("provider_retries_total", model=model, reason=kind)
+        logger.warning(f"{model} call failed ({error!r}), retry {attempt + 1}/{self.config.max_retries} in {delay:.2f}s")
+        return delay
+
+    def _check_deadline(self, model: str):
+        # Before taking a slot, so an expired caller deadline never reaches the limiter
+        left = time_remaining()
+        if left is not None and left <= 0:
+            metrics.incr("provider_deadline_exceeded_total", model=model)
+            raise DeadlineExceeded(f"Request deadline passed before calling {model}")
+
+    def _release_failed(self, limiter: AIMDLimiter, model: str, error: BaseException) -> str:
+        kind = classify_error(error)
+        limiter.release("overload" if kind == "overload" else "error")
+        metrics.incr("provider_requests_total", model=model,
+                     outcome=kind if isinstance(error, Exception) else "cancelled")
+        return kind
+
+    def _attempt_kwargs(self, kwargs: dict, model: str) -> dict:
+        left = time_remaining()
+        if left is None:
+            return kwargs
+        if left <= 0:
+            metrics.incr("provider_deadline_exceeded_total", model=model)
+            raise DeadlineExceeded(f"Request deadline passed before calling {model}")
+        timeout = kwargs.get("timeout")
+        return {**kwargs, "timeout": left if timeout is None else min(timeout, left)}
+
+    def _reserve(self, model: str) -> float:
+        wait = self.controller.bucket(model).reserve(time_remaining())
+        if wait is None:
+            metrics.incr("provider_deadline_exceeded_total", model=model)
+            raise DeadlineExceeded(f"Rate limit wait for {model} exceeds the request deadline")
+        if wait > 0:
+            metrics.incr("provider_throttled_total", model=model, reason="rate_limit")
+            metrics.observe("provider_throttle_wait_seconds", wait, model=model)
+        return wait
+
+    def create(self, **kwargs):
+        model = kwargs.get("model", "default")
+        limiter = self.controller.limiter(model)
+        attempt = 0
+        while True:
+            time.sleep(self._reserve(model))
+            self._check_deadline(model)
+            start = time.monotonic()
+            if not limiter.acquire(timeout=time_remaining()):
+                metrics.incr("provider_deadline_exceeded_total", model=model)
+                raise DeadlineExceeded(f"No concurrency slot for {model} before the request deadline")
+            waited = time.monotonic() - start
+            if waited > 0.001:
+                metrics.incr("provider_throttled_total", model=model, reason="concurrency")
+                metrics.observe("provider_throttle_wait_seconds", waited, model=model)
+            try:
+                response = self.client.chat.completions.create(**self._attempt_kwargs(kwargs, model))
+            except BaseException as e:
+                # BaseException too, so an interrupted call still gives its slot back
+                kind = self._release_failed(limiter, model, e)
+                if not isinstance(e, Exception):
+                    raise
+                time.sleep(self._plan_retry(model, attempt, e, kind))
+                attempt += 1
+                continue
+            metrics.incr("provider_requests_total", model=model, outcome="ok")
+            if kwargs.get("stream"):
+                return _Guarded(response, limiter.release)
+            limiter.release("success")
+            return response
+
+
+class AsyncResilientClient(ResilientClient):
+    """``ResilientClient`` for ``AsyncTogether``; shares the same per-model limits."""
+
+    async def create(self, **kwargs):
+        model = kwargs.get("model", "default")
+        limiter = self.controller.limiter(model)
+        attempt = 0
+        while True:
+            await asyncio.sleep(self._reserve(model))
+            self._check_deadline(model)
+            start = time.monotonic()
+            # Polls instead of blocking the event loop on the limiter's condition
+            while not limiter.try_acquire():
+                left = time_remaining()
+                if left is not None and left <= 0:
+                    metrics.incr("provider_deadline_exceeded_total", model=model)
+                    raise DeadlineExceeded(f"No concurrency slot for {model} before the request deadline")
+                await asyncio.sleep(0.01)
+            waited = time.monotonic() - start
+            if waited > 0.001:
+                metrics.incr("provider_throttled_total", model=model, reason="concurrency")
+                metrics.observe("provider_throttle_wait_seconds", waited, model=model)
+            try:
+                response = await self.client.chat.completions.create(**self._attempt_kwargs(kwargs, model))
+            except BaseException as e:
+                # Cancellation (a hedge won, wait_for timed out) must give the slot back too
+                kind = self._release_failed(limiter, model, e)
+                if not isinstance(e, Exception):
+                    raise
+                await asyncio.sleep(self._plan_retry(model, attempt, e, kind))
+                attempt += 1
+                continue
+            metrics.incr("provider_requests_total", model=model, outcome="ok")
+            if kwargs.get("stream"):
+                return _Guarded(response, limiter.release)
+            limiter.release("success")
+            return response
+
+
+_controllers: Dict[str, RateController] = {}
+_controllers_lock = threading.Lock()
+
+
+def get_rate_controller(provider: str, config) -> RateController:
+    # One set of limits per provider per process, shared by sync and async clients
+    with _controllers_lock:
+        controller = _controllers.get(provider)
+        if controller is None:
+            controller = _controllers[provider] = RateController(config)
+    return controller
@@ -0,0 +1,18 @@
+from pathlib import Path
+
+from src.Imagecaption.config.context import AppContext
+from src.Imagecaption.pipeline.async_pipeline import AsyncStoryPipeline
+
+ROOT = Path(__file__).resolve().parent.parent
+
+
+def test_async_pipeline_writes_through_the_shared_artifact_store(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv("TOGETHER_API_KEY", "dummy")
+    context = AppContext(ROOT / "config" / "config.yaml", ROOT / "params.yaml")
+    pipeline = AsyncStoryPipeline(context)
+    store = context.artifact_store()
+    assert pipeline.image_captioner.store is store
+    assert pipeline.story_generator.store is store
+    ingested = store.path("ingested", "photo_0123456789_abcdef01", ".jpg")
+    assert pipeline.story_generator.story_path(ingested) == context.story_generation().story_path(ingested)
@@ -0,0 +1,117 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from src.Imagecaption.components.caption_backends import CaptionBackend, CaptionPolicy, CircuitBreaker
+
+
+class StaticBackend(CaptionBackend):
+    def __init__(self, name, caption="a caption", delay=0.0):
+        self.name = name
+        self.text = caption
+        self.delay = delay
+
+    def caption(self, image_bytes, mime_type="image/jpeg", image_url=None):
+        return self.text
+
+    async def acaption(self, image_bytes, mime_type="image/jpeg", image_url=None):
+        await asyncio.sleep(self.delay)
+        return self.text
+
+
+class HangingBackend(CaptionBackend):
+    def __init__(self, name, release):
+        self.name = name
+        self.release = release
+
+    def caption(self, image_bytes, mime_type="image/jpeg", image_url=None):
+        self.release.wait()
+        return f"{self.name} caption"
+
+
+class FailingBackend(CaptionBackend):
+    def __init__(self, name, delay=0.0):
+        self.name = name
+        self.delay = delay
+
+    def caption(self, image_bytes, mime_type="image/jpeg", image_url=None):
+        time.sleep(self.delay)
+        raise ConnectionError(f"{self.name} down")
+
+
+def half_open_breaker():
+    breaker = CircuitBreaker(failure_threshold=1, reset_seconds=0.0)
+    breaker.record_failure()
+    assert breaker.state == "half_open"
+    return breaker
+
+
+def test_incomplete_backend_fails_at_construction():
+    class Incomplete(CaptionBackend):
+        pass
+
+    with pytest.raises(TypeError):
+        Incomplete()
+
+
+def test_cancelled_half_open_trial_frees_the_breaker():
+    breaker = half_open_breaker()
+    policy = CaptionPolicy(
+        primary=StaticBackend("remote", delay=5.0),
+        fallback=StaticBackend("local", caption="local caption"),
+        timeout=5.0,
+        hedge_after_ms=10,
+        breaker=breaker
+    )
+
+    async def run():
+        result = await policy.acaption(b"image")
+        await asyncio.sleep(0)  # let the cancelled primary's done-callback run
+        return result
+
+    assert asyncio.run(run()) == ("local caption", "local")
+    assert breaker.allow()
+
+
+def test_cancelled_trial_without_fallback_frees_the_breaker():
+    breaker = half_open_breaker()
+    policy = CaptionPolicy(primary=StaticBackend("remote", delay=5.0), timeout=0.05, breaker=breaker)
+
+    async def run():
+        with pytest.raises(asyncio.TimeoutError):
+            await policy.acaption(b"image")
+        await asyncio.sleep(0)
+
+    asyncio.run(run())
+    assert breaker.allow()
+
+
+def test_hung_hedge_stops_at_the_caption_timeout():
+    release = threading.Event()
+    policy = CaptionPolicy(
+        primary=HangingBackend("remote", release),
+        fallback=HangingBackend("local", release),
+        timeout=0.2,
+        hedge_after_ms=10
+    )
+    start = time.monotonic()
+    try:
+        with pytest.raises(TimeoutError, match="local caption backend timed out"):
+            policy.caption(b"image")
+    finally:
+        release.set()
+    assert time.monotonic() - start < 1.0
+
+
+def test_hedge_failure_after_primary_failure_logs_both(caplog):
+    policy = CaptionPolicy(
+        primary=FailingBackend("remote", delay=0.05),
+        fallback=FailingBackend("local", delay=0.1),
+        timeout=2.0,
+        hedge_after_ms=10
+    )
+    with pytest.raises(ConnectionError, match="local down"):
+        policy.caption(b"image")
+    assert "remote caption backend failed (remote down)" in caplog.text
@@ -0,0 +1,68 @@
+from pathlib import Path
+from types import SimpleNamespace
+
+import pytest
+
+from src.Imagecaption.entity.config_entity import ResilienceConfig
+from src.Imagecaption.pipeline.image_captioning_pipeline import ImageCaptioningPipeline
+from src.Imagecaption.utils.cache import CacheBackend, MemoryLRUBackend, ResultCache
+
+
+class FakeCaptioner:
+    model_name = "remote-model"
+    prompt = "Describe"
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.calls = 0
+        self.saved = []
+
+    def is_primary(self, backend):
+        return backend == "together"
+
+    def caption_image(self, image_path):
+        self.calls += 1
+        return f"caption {self.calls}", self.backend
+
+    def save_caption(self, image_path, caption):
+        self.saved.append((Path(image_path), caption))
+
+
+def make_pipeline(backend):
+    cache = ResultCache(MemoryLRUBackend())
+    captioner = FakeCaptioner(backend)
+    context = SimpleNamespace(result_cache=lambda: cache, near_duplicate_index=lambda: None,
+                              image_captioning=lambda: captioner,
+                              config_manager=SimpleNamespace(get_resilience_config=ResilienceConfig))
+    return ImageCaptioningPipeline(context), captioner
+
+
+@pytest.fixture
+def image_path(tmp_path):
+    path = tmp_path / "photo_0123456789_abcdef01.jpg"
+    path.write_bytes(b"\xff\xd8\xff" + b"\x00" * 32)
+    return path
+
+
+def test_remote_captions_are_cached(image_path):
+    pipeline, captioner = make_pipeline("together")
+    assert pipeline.main(image_path) == "caption 1"
+    assert pipeline.main(image_path) == "caption 1"
+    assert captioner.calls == 1
+    assert captioner.saved == [(image_path, "caption 1")]
+
+
+def test_fallback_captions_are_not_cached(image_path):
+    pipeline, captioner = make_pipeline("florence2")
+    assert pipeline.main(image_path) == "caption 1"
+    assert pipeline.main(image_path) == "caption 2"
+    assert captioner.calls == 2
+
+
+def test_incomplete_cache_backend_fails_at_construction():
+    class Incomplete(CacheBackend):
+        def get(self, key):
+            return None
+
+    with pytest.raises(TypeError):
+        Incomplete()
@@ -0,0 +1,25 @@
+import asyncio
+from pathlib import Path
+
+from src.Imagecaption.config.context import AppContext
+
+ROOT = Path(__file__).resolve().parent.parent
+
+
+def test_closing_the_context_closes_and_drops_async_clients(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv("TOGETHER_API_KEY", "dummy")
+    context = AppContext(ROOT / "config" / "config.yaml", ROOT / "params.yaml")
+    client = context.async_together_client()
+    context.close()
+    assert client.is_closed()
+    assert context.async_together_client() is not client
+
+
+def test_aclose_closes_async_clients_on_the_running_loop(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv("TOGETHER_API_KEY", "dummy")
+    context = AppContext(ROOT / "config" / "config.yaml", ROOT / "params.yaml")
+    client = context.async_together_client()
+    asyncio.run(context.aclose())
+    assert client.is_closed()
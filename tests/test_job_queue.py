@@ -0,0 +1,32 @@
+import time
+
+from src.Imagecaption.utils.job_queue import JobQueue
+
+
+def test_stale_worker_cannot_finish_a_reclaimed_job(tmp_path):
+    queue = JobQueue(tmp_path / "jobs.sqlite", max_attempts=3, lease_seconds=0.05)
+    job_id = queue.enqueue({"ingested_path": "x.jpg"})
+    assert queue.claim("old").id == job_id
+    time.sleep(0.1)
+    assert queue.claim("new").id == job_id
+
+    # The old worker's lease expired; its late failure and result must not touch the new run
+    assert not queue.fail(job_id, "old", "provider error")
+    assert queue.get(job_id).status == "running"
+    assert not queue.complete(job_id, "old", {"story": "stale"})
+    assert queue.get(job_id).status == "running"
+
+    assert queue.complete(job_id, "new", {"story": "fresh"})
+    job = queue.get(job_id)
+    assert job.status == "done" and job.result == {"story": "fresh"}
+
+
+def test_owner_failure_requeues_until_attempts_run_out(tmp_path):
+    queue = JobQueue(tmp_path / "jobs.sqlite", max_attempts=2)
+    job_id = queue.enqueue({})
+    queue.claim("w")
+    assert queue.fail(job_id, "w", "timeout")
+    assert queue.get(job_id).status == "queued"
+    queue.claim("w")
+    assert queue.fail(job_id, "w", "timeout")
+    assert queue.get(job_id).status == "failed"
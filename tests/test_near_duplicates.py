@@ -0,0 +1,28 @@
+import time
+
+from src.Imagecaption.utils.near_duplicates import NearDuplicateIndex
+
+
+def test_prune_drops_old_rows_and_rebuilds_trees(tmp_path):
+    index = NearDuplicateIndex(tmp_path / "phash.sqlite", retention_seconds=60)
+    variant = index.variant_key("remote-model", "Describe")
+    index.record_hash("old", 0b1011)
+    index.add_caption(variant, 0b1011, "old caption", "old")
+    index._conn.execute("UPDATE image_hashes SET created_at = ?", (time.time() - 120,))
+    index._conn.execute("UPDATE captions SET created_at = ?", (time.time() - 120,))
+    index._conn.commit()
+    index.add_caption(variant, 0xFFFF0000, "new caption", "new")
+
+    assert index.nearest(variant, 0b1010).caption == "old caption"
+    assert index.prune() == 2
+    assert index.nearest(variant, 0b1010) is None
+    assert index.nearest(variant, 0xFFFF0001).caption == "new caption"
+    assert index.hash_for("old") is None
+    assert len(index) == 1
+
+
+def test_no_retention_keeps_everything(tmp_path):
+    index = NearDuplicateIndex(tmp_path / "phash.sqlite")
+    index.add_caption(index.variant_key("m", "p"), 1, "caption", "r")
+    assert index.prune() == 0
+    assert len(index) == 1
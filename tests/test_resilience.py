@@ -0,0 +1,67 @@
+import asyncio
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from src.Imagecaption.entity.config_entity import ResilienceConfig
+from src.Imagecaption.utils.resilience import (
+    AsyncResilientClient,
+    DeadlineExceeded,
+    RateController,
+    ResilientClient,
+    classify_error,
+    request_deadline,
+)
+
+
+def fake_client(create):
+    return SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create)))
+
+
+def make_config(**overrides):
+    settings = dict(requests_per_minute=0, initial_concurrency=2, min_concurrency=1, max_concurrency=4)
+    settings.update(overrides)
+    return ResilienceConfig(**settings)
+
+
+def test_cancelled_async_calls_release_their_slot():
+    async def never_answers(**kwargs):
+        await asyncio.sleep(60)
+
+    config = make_config()
+    controller = RateController(config)
+    client = AsyncResilientClient(fake_client(never_answers), controller, config)
+
+    async def cancel_calls(n):
+        for _ in range(n):
+            with pytest.raises(asyncio.TimeoutError):
+                await asyncio.wait_for(client.create(model="m", messages=[]), timeout=0.05)
+
+    asyncio.run(cancel_calls(config.initial_concurrency + 2))
+    limiter = controller.limiter("m")
+    assert limiter.in_flight == 0
+    assert limiter.try_acquire()
+
+
+def test_expired_deadline_does_not_shrink_the_limit():
+    calls = []
+    config = make_config()
+    controller = RateController(config)
+    client = ResilientClient(fake_client(lambda **kwargs: calls.append(kwargs)), controller, config)
+    limiter = controller.limiter("m")
+    limit = limiter.limit
+
+    with request_deadline(0.01):
+        time.sleep(0.02)
+        with pytest.raises(DeadlineExceeded):
+            client.create(model="m", messages=[])
+
+    assert not calls
+    assert limiter.limit == limit
+    assert limiter.in_flight == 0
+
+
+def test_local_deadline_is_not_overload():
+    assert classify_error(DeadlineExceeded("late")) == "fatal"
+    assert classify_error(TimeoutError()) == "overload"
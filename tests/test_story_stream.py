@@ -0,0 +1,103 @@
+import logging
+from pathlib import Path
+from types import SimpleNamespace
+
+import pytest
+
+from src.Imagecaption.components.story_generation import StoryGeneration, _WordCounter, word_count
+from src.Imagecaption.entity.config_entity import StoryGenerationConfig
+from src.Imagecaption.utils.artifacts import ArtifactStore
+from src.Imagecaption.utils.metrics import metrics
+
+
+def chunk(text):
+    return SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=text))])
+
+
+class FakeStream:
+    def __init__(self, texts, error=None):
+        self.texts = texts
+        self.error = error
+        self.closed = False
+
+    def __iter__(self):
+        for text in self.texts:
+            yield chunk(text)
+        if self.error is not None:
+            raise self.error
+
+    def close(self):
+        self.closed = True
+
+
+def make_generator(tmp_path, stream):
+    config = StoryGenerationConfig(
+        captions_dir=tmp_path / "captions", stories_dir=tmp_path / "stories", model_name="story-model",
+        together_api_key="", max_tokens=700, temperature=0.7, top_p=0.9,
+        story_prompt_template="{theme} {word_limit} {caption}"
+    )
+    client = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=lambda **kwargs: stream)))
+    store = ArtifactStore({"story": config.stories_dir, "caption": config.captions_dir})
+    caption_file = store.write_text(store.path("caption", "photo_0123456789_abcdef01"), "A lighthouse at dusk.")
+    return StoryGeneration(config, client=client, store=store), caption_file
+
+
+def story_files(tmp_path):
+    return sorted(p.name for p in (tmp_path / "stories").rglob("*") if p.is_file())
+
+
+def test_completed_stream_is_saved(tmp_path):
+    generator, caption_file = make_generator(tmp_path, FakeStream(["Once upon ", "a time."]))
+    assert "".join(generator.stream_story(caption_file, "adventure", 100)) == "Once upon a time."
+    assert Path(generator.story_path(caption_file)).read_text(encoding="utf-8") == "Once upon a time."
+    assert story_files(tmp_path) == ["photo_0123456789_abcdef01_story.txt"]
+
+
+def test_failed_stream_keeps_partial_story(tmp_path):
+    metrics.reset()
+    generator, caption_file = make_generator(tmp_path, FakeStream(["Once upon "], error=ConnectionError("reset")))
+    with pytest.raises(ConnectionError):
+        list(generator.stream_story(caption_file, "adventure", 100))
+    assert story_files(tmp_path) == ["photo_0123456789_abcdef01_story.partial.txt"]
+    assert Path(generator.partial_story_path(caption_file)).read_text(encoding="utf-8") == "Once upon "
+    stream_series = [key for key in metrics.summary()["histograms"]["stage_seconds"] if "story.stream" in key]
+    assert stream_series == ['{stage="story.stream",status="error"}']
+
+
+def test_abandoned_stream_keeps_partial_story(tmp_path):
+    stream = FakeStream(["Once ", "upon ", "a time."])
+    generator, caption_file = make_generator(tmp_path, stream)
+    chunks = generator.stream_story(caption_file, "adventure", 100)
+    next(chunks)
+    chunks.close()
+    assert stream.closed
+    assert story_files(tmp_path) == ["photo_0123456789_abcdef01_story.partial.txt"]
+    assert Path(generator.partial_story_path(caption_file)).read_text(encoding="utf-8") == "Once "
+
+
+def test_word_counter_matches_word_count():
+    text = "Once upon  a time,\nthere was\ta lighthouse keeper. "
+    for size in (1, 2, 3, 7):
+        counter = _WordCounter()
+        for i in range(0, len(text), size):
+            counted = counter.add(text[i:i + size])
+            assert counted == word_count(text[:i + size])
+
+
+def test_cutoff_never_takes_back_streamed_text(tmp_path, caplog):
+    # The final cutoff backs off to "seven." but ten words were already streamed
+    words = "One two three four five six seven. eight nine ten eleven twelve thirteen".split(" ")
+    generator, caption_file = make_generator(tmp_path, FakeStream([w + " " for w in words]))
+    with caplog.at_level(logging.INFO):
+        story = "".join(generator.stream_story(caption_file, "adventure", 10))
+    assert word_count(story) == 10
+    assert Path(generator.story_path(caption_file)).read_text(encoding="utf-8") == story
+    assert "Story budget: 10/10 words" in caplog.text
+
+
+def test_default_and_explicit_arguments_share_a_cache_key(tmp_path):
+    generator, _ = make_generator(tmp_path, FakeStream([]))
+    caption = "A lighthouse at dusk."
+    assert generator.cache_key(caption) == generator.cache_key(caption, "adventure", 400)
+    assert generator.cache_key(caption, word_limit=100) == generator.cache_key(caption, "adventure", "100")
+    assert generator.cache_key(caption, word_limit=100) != generator.cache_key(caption, word_limit=200)
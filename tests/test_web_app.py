@@ -0,0 +1,94 @@
+import io
+from pathlib import Path
+
+import pytest
+import yaml
+
+pytest.importorskip("flask")
+
+from src.Imagecaption.config.context import AppContext  # noqa: E402
+from web_app import create_app  # noqa: E402
+
+ROOT = Path(__file__).resolve().parent.parent
+
+
+def jpeg_bytes() -> bytes:
+    from PIL import Image
+
+    buffer = io.BytesIO()
+    Image.effect_noise((64, 48), 40).convert("RGB").save(buffer, "JPEG")
+    return buffer.getvalue()
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    # Relative data paths in config.yaml resolve under tmp_path
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.delenv("FLASK_SECRET_KEY", raising=False)
+    params = yaml.safe_load((ROOT / "params.yaml").read_text(encoding="utf-8"))
+    params["data_ingestion"]["preprocess_mode"] = "inline"
+    (tmp_path / "params.yaml").write_text(yaml.safe_dump(params), encoding="utf-8")
+    context = AppContext(ROOT / "config" / "config.yaml", tmp_path / "params.yaml")
+    app = create_app(context)
+    app.testing = True
+    app.context = context
+    yield app.test_client()
+    context.uploads().shutdown()
+
+
+def create(client, size, filename="photo.jpg"):
+    response = client.post("/uploads", json={"filename": filename, "size": size})
+    assert response.status_code == 201
+    return response.get_json()
+
+
+def test_secret_key_is_never_a_fixed_default(client):
+    key = client.application.secret_key
+    assert key and key != "imagecaption-dev"
+    assert create_app(client.application.context).secret_key != key
+
+
+def test_chunked_upload_resume_and_complete(client):
+    data = jpeg_bytes()
+    upload = create(client, len(data))
+    upload_id, half = upload["upload_id"], len(data) // 2
+
+    response = client.put(f"/uploads/{upload_id}?offset=0", data=data[:half])
+    assert response.status_code == 200 and response.get_json()["received"] == half
+
+    # A chunk past the stored end is rejected with the offset to resume from
+    response = client.put(f"/uploads/{upload_id}?offset={half + 10}", data=data[half + 10:])
+    assert response.status_code == 409 and response.get_json()["received"] == half
+    assert client.get(f"/uploads/{upload_id}").get_json()["received"] == half
+
+    # A retried chunk overlapping stored data only appends the new tail
+    response = client.put(f"/uploads/{upload_id}?offset={half - 4}", data=data[half - 4:])
+    assert response.get_json()["received"] == len(data)
+
+    response = client.post(f"/uploads/{upload_id}/complete")
+    assert response.status_code == 202
+    ingested_path = client.application.context.uploads().ingested(upload_id, timeout=30)
+    assert Path(ingested_path).exists()
+    status = client.get(f"/uploads/{upload_id}").get_json()
+    assert status["state"] == "ingested" and status["mime_type"] == "image/jpeg"
+
+
+def test_incomplete_upload_cannot_complete(client):
+    data = jpeg_bytes()
+    upload_id = create(client, len(data))["upload_id"]
+    client.put(f"/uploads/{upload_id}?offset=0", data=data[:20])
+    response = client.post(f"/uploads/{upload_id}/complete")
+    assert response.status_code == 409 and response.get_json()["received"] == 20
+
+
+def test_bad_header_is_rejected_on_the_first_chunk(client):
+    upload_id = create(client, 4096)["upload_id"]
+    response = client.put(f"/uploads/{upload_id}?offset=0", data=b"MZ" + b"\x00" * 100)
+    assert response.status_code == 400
+    assert client.get(f"/uploads/{upload_id}").status_code == 404
+
+
+def test_unknown_and_malformed_upload_ids(client):
+    assert client.get("/uploads/" + "0" * 32).status_code == 404
+    assert client.get("/uploads/..%2F..%2Fetc").status_code == 404
+    assert client.post("/uploads", json={"filename": "notes.txt", "size": 10}).status_code == 400
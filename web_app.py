@@ -0,0 +1,119 @@
+import logging
+import secrets
+
+from flask import Flask, flash, jsonify, redirect, render_template, request, url_for
+
+from src.Imagecaption import setup_logging
+from src.Imagecaption.components.preprocessing import PreprocessingBusy
+from src.Imagecaption.components.uploads import UploadError, UploadNotFound, UploadOffsetMismatch
+from src.Imagecaption.config.context import get_app_context
+from src.Imagecaption.pipeline.image_captioning_pipeline import ImageCaptioningPipeline
+from src.Imagecaption.pipeline.story_generation_pipeline import StoryGenerationPipeline
+from src.Imagecaption.utils.common import get_secret
+from src.Imagecaption.utils.logs import log_context
+
+logger = logging.getLogger(__name__)
+
+
+def create_app(context=None) -> Flask:
+    context = context or get_app_context()
+    upload_config = context.config_manager.get_upload_config()
+
+    app = Flask(__name__)
+    app.secret_key = get_secret("FLASK_SECRET_KEY")
+    if not app.secret_key:
+        # Never a fixed fallback: anyone could forge sessions signed with it
+        logger.warning("FLASK_SECRET_KEY is not set; using a random per-process key "
+                       "(sessions do not survive restarts or span several processes)")
+        app.secret_key = secrets.token_hex(32)
+    # Plain form posts carry the whole file; chunk PUTs are bounded separately by max_chunk_size
+    app.config["MAX_CONTENT_LENGTH"] = upload_config.max_file_size + 1024 * 1024
+
+    @app.errorhandler(UploadError)
+    def upload_error(e):
+        if isinstance(e, UploadNotFound):
+            return jsonify(error=str(e)), 404
+        if isinstance(e, UploadOffsetMismatch):
+            return jsonify(error=str(e), received=e.received), 409
+        return jsonify(error=str(e)), 400
+
+    @app.errorhandler(PreprocessingBusy)
+    def busy(e):
+        return jsonify(error=str(e)), 503
+
+    @app.post("/uploads")
+    def create_upload():
+        body = request.get_json(force=True)
+        if not isinstance(body.get("size"), int):
+            raise UploadError("size (in bytes) is required")
+        status = context.uploads().create(body.get("filename", ""), body["size"])
+        return jsonify(status.to_dict() | {"chunk_size": upload_config.chunk_size}), 201
+
+    @app.get("/uploads/<upload_id>")
+    def upload_status(upload_id):
+        # Clients resume from "received" after a dropped connection or a page reload
+        return jsonify(context.uploads().status(upload_id).to_dict())
+
+    @app.put("/uploads/<upload_id>")
+    def upload_chunk(upload_id):
+        offset = request.args.get("offset", type=int)
+        if offset is None:
+            raise UploadError("offset query parameter is required")
+        if (request.content_length or 0) > upload_config.max_chunk_size:
+            raise UploadError(f"Chunk exceeds {upload_config.max_chunk_size} bytes")
+        # Read at most one chunk; the body is never buffered beyond that
+        data = request.stream.read(upload_config.max_chunk_size + 1)
+        return jsonify(context.uploads().write_chunk(upload_id, offset, data).to_dict())
+
+    @app.post("/uploads/<upload_id>/complete")
+    def complete_upload(upload_id):
+        return jsonify(context.uploads().complete(upload_id).to_dict()), 202
+
+    @app.delete("/uploads/<upload_id>")
+    def discard_upload(upload_id):
+        context.uploads().discard(upload_id)
+        return "", 204
+
+    def upload_from_form():
+        # Fallback without JavaScript: the form posted the file itself
+        file = request.files.get("image")
+        if file is None or not file.filename:
+            raise UploadError("Please choose an image.")
+        uploads = context.uploads()
+        status = uploads.create(file.filename)
+        uploads.write_stream(status.upload_id, file.stream)
+        uploads.complete(status.upload_id)
+        return status.upload_id
+
+    @app.route("/", methods=["GET", "POST"])
+    def index():
+        story_config = context.config_manager.get_story_generation_config()
+        if request.method == "GET":
+            return render_template("index.html", chunk_size=upload_config.chunk_size, max_file_size=upload_config.max_file_size)
+
+        theme = request.form.get("theme") or story_config.default_theme
+        word_limit = request.form.get("word_limit", type=int) or story_config.default_word_limit
+        try:
+            upload_id = request.form.get("upload_id") or upload_from_form()
+            uploads = context.uploads()
+            filename = uploads.status(upload_id).filename
+            with log_context(upload_id=upload_id):
+                # Usually already done: ingestion started when the last chunk arrived
+                ingested_path = uploads.ingested(upload_id, timeout=context.config_manager.get_resilience_config().caption_deadline)
+                caption = ImageCaptioningPipeline(context).main(ingested_path)
+                caption_file = context.image_captioning().caption_path(ingested_path)
+                story = StoryGenerationPipeline(context).main(caption_file, theme, word_limit)
+        except Exception as e:
+            logger.exception(f"Story request failed: {e}")
+            flash(str(e) if isinstance(e, (UploadError, PreprocessingBusy)) else f"Could not generate a story: {e}")
+            return redirect(url_for("index"))
+
+        return render_template("result.html", filename=filename, caption=caption, theme=theme,
+                               word_limit=word_limit, story=story)
+
+    return app
+
+
+if __name__ == "__main__":
+    setup_logging()
+    create_app().run(host="0.0.0.0", port=5000, threaded=True)